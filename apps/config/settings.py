@@ -101,6 +101,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'database/db.sqlite3',
+        # Дампы пишут статусы операций из нескольких потоков
+        'OPTIONS': {'timeout': 30},
+        # Тесты с потоками: у in-memory базы с общим кэшем блокировки не ждут timeout
+        'TEST': {'NAME': BASE_DIR / 'database/test_db.sqlite3'},
     }
 }
 
@@ -137,6 +141,8 @@ LANGUAGES = [
     ('ru', 'Russian'),
 ]
 
+# Модели используют не ленивый gettext: подписи попадают в миграции на этом языке,
+# поэтому миграции генерируются с LANGUAGE=ru, как и первые миграции manager
 LANGUAGE_CODE = os.getenv("LANGUAGE", 'en')
 
 
@@ -175,4 +181,41 @@ UNFOLD = {
             "href": lambda request: static("manager/img/favicon.ico"),
         },
     ],
-}
\ No newline at end of file
+}
+
+
+# Параллельный запуск задач в check_dump_operations
+DUMP_CONCURRENCY = int(os.getenv("DUMP_CONCURRENCY", 4))
+DUMP_CONCURRENCY_PER_DB_HOST = int(os.getenv("DUMP_CONCURRENCY_PER_DB_HOST", 1))
+DUMP_CONCURRENCY_PER_STORAGE = int(os.getenv("DUMP_CONCURRENCY_PER_STORAGE", 2))
+
+# Воркер, выполняющий операции, поставленные в очередь из админки
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 4))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 5))
+# Через сколько секунд без heartbeat операция IN_PROCESS считается брошенной (процесс убит)
+OPERATION_CLAIM_TTL = int(os.getenv("OPERATION_CLAIM_TTL", 600))
+
+# Размер пула соединений кэшированного S3-клиента (параллельные части/чанки/удаления)
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+
+# /metrics (Prometheus): нужен заголовок Authorization: Bearer <токен>; без токена отключён
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Том для временных файлов дампов и восстановления (дамп, скачанный артефакт, каталог -Fd)
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/tmp")
+# Каталог локальных бэкапов clickhouse-backup (general.local_path / path диска backups)
+CLICKHOUSE_BACKUP_DIR = os.getenv("CLICKHOUSE_BACKUP_DIR", "/var/lib/clickhouse/backup/")
+# Запас к оценке размера дампа при проверке свободного места перед операцией
+SPOOL_HEADROOM = float(os.getenv("SPOOL_HEADROOM", 1.2))
+# Как часто (сек.) опрашивается system.backups при нативных BACKUP/RESTORE ClickHouse
+CLICKHOUSE_POLL_INTERVAL = float(os.getenv("CLICKHOUSE_POLL_INTERVAL", 5))
+# Сколько секунд ждать нативный BACKUP/RESTORE ClickHouse целиком, прежде чем считать операцию проваленной
+CLICKHOUSE_BACKUP_TIMEOUT = float(os.getenv("CLICKHOUSE_BACKUP_TIMEOUT", 24 * 3600))
+# Нативный RESTORE в непустые таблицы (allow_non_empty_tables): данные бэкапа дописываются к существующим
+CLICKHOUSE_RESTORE_ALLOW_NON_EMPTY = os.getenv("CLICKHOUSE_RESTORE_ALLOW_NON_EMPTY", "0") == "1"
+
+# Проверки подключения к базам и хранилищам: успешный результат переиспользуется PROBE_TTL секунд
+PROBE_TTL = int(os.getenv("PROBE_TTL", 60))
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", 5))
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", 16))
+PROBE_HISTORY_DAYS = int(os.getenv("PROBE_HISTORY_DAYS", 30))
@@ -17,6 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from manager.views import metrics
+
 urlpatterns = [
+    path('metrics', metrics, name='metrics'),
     path('', admin.site.urls),
 ]
@@ -1,18 +1,20 @@
-import subprocess
-
-import boto3
-import yadisk
-from botocore.exceptions import ClientError
 from django.contrib import admin, messages
 from django.contrib.auth.admin import GroupAdmin as BaseGroupAdmin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group, User
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 from django.http import HttpRequest
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import gettext as _
-from manager.models import (DumpTask, DumpTaskOperation, FileStorage,
+from manager.choices import DumpOperationStatusChoices
+from manager.models import (ConnectionProbe, DumpContent, DumpTask,
+                            DumpTaskOperation, FileStorage,
                             RecoverBackupOperation, UserDatabase)
-from manager.services.databases import DB_INTERFACE
-from unfold.admin import ModelAdmin
+from manager.services.claims import requeueable
+from manager.services.metrics import MB
+from manager.services.probes import probe_databases, probe_storages
+from unfold.admin import ModelAdmin, TabularInline
 from unfold.decorators import action
 
 admin.site.unregister(User)
@@ -29,6 +31,12 @@ class GroupAdmin(BaseGroupAdmin, ModelAdmin):
     pass
 
 
+def probe_latency(probe):
+    if probe.cached:
+        return _("(checked at %s)") % probe.created_at.strftime("%H:%M:%S")
+    return f"({probe.latency_ms:.0f} ms)"
+
+
 @admin.register(FileStorage)
 class FileStorageAdmin(ModelAdmin):
     compressed_fields = True
@@ -52,6 +60,10 @@ class FileStorageAdmin(ModelAdmin):
             "fields": ("host", "bucket_name", "access_key"),
             "classes": ("fs-section", "fs-s3"),
         }),
+        (_("S3 transfer"), {
+            "fields": ("multipart_chunk_size_mb", "max_concurrency", "max_bandwidth_mb", "resumable_uploads"),
+            "classes": ("fs-section", "fs-s3"),
+        }),
     )
 
     class Media:
@@ -80,32 +92,15 @@ class FileStorageAdmin(ModelAdmin):
 
     @action(description=_("Check connection"))
     def check_connection(self, request: HttpRequest, queryset):
-        for storage in queryset:
-            try:
-                if storage.type == FileStorage.TYPE_YADISK:
-                    if not storage.secret_key:
-                        messages.error(request, _(f"{storage.name}: Yandex Disk token is empty (secret_key)."))
-                        continue
-                    y = yadisk.YaDisk(token=storage.secret_key)
-                    if not y.check_token():
-                        messages.error(request, _(f"{storage.name}: Yandex Disk token is invalid."))
-                        continue
-                    y.get_disk_info()
-                    messages.success(request, _(f"{storage.name} (Yandex Disk) connection success!"))
-                else:
-                    s3_client = boto3.client(
-                        "s3",
-                        endpoint_url=storage.host,
-                        aws_access_key_id=storage.access_key,
-                        aws_secret_access_key=storage.secret_key,
-                        verify=(storage.host or "").startswith("https"),
-                    )
-                    s3_client.list_buckets()
-                    messages.success(request, _(f"{storage.name} (S3) connection success!"))
-            except ClientError as e:
-                messages.error(request, _(f"{storage.name} Connection failed: {e}"))
-            except Exception as e:
-                messages.error(request, _(f"{storage.name} Connection failed: {e}"))
+        storages = list(queryset)
+        probes = probe_storages(storages)
+        for storage in storages:
+            probe = probes[storage.pk]
+            if probe.ok:
+                messages.success(request, _(
+                    f"{storage.name} ({storage.get_type_display()}) connection success! {probe_latency(probe)}"))
+            else:
+                messages.error(request, _(f"{storage.name} Connection failed: {probe.error}"))
 
 
 @admin.register(UserDatabase)
@@ -119,17 +114,40 @@ class UserDatabaseAdmin(ModelAdmin):
 
     @action(description=_("Check connection"))
     def check_connection(self, request: HttpRequest, queryset):
-        for db in queryset:
-            db_interface = DB_INTERFACE[db.db_type]()
-            is_connected = db_interface.check_connection(db.connection_string)
-            if is_connected:
-                messages.success(request, _(f"{db.name} connection success!"))
+        databases = list(queryset)
+        probes = probe_databases(databases)
+        for db in databases:
+            probe = probes[db.pk]
+            if probe.ok:
+                messages.success(request, _(f"{db.name} connection success! {probe_latency(probe)}"))
             else:
-                messages.error(request, _(f"{db.name} Connection failed!"))
+                messages.error(request, _(f"{db.name}: {probe.error}"))
+
+
+# Большие JSON-поля операций, которые не нужны в списках
+HEAVY_OPERATION_FIELDS = ["parts_manifest", "upload_state", "stage_metrics", "table_catalog"]
+
+
+def is_changelist(request):
+    return bool(request.resolver_match and request.resolver_match.url_name.endswith("_changelist"))
 
 
-class DumpTaskOperationInline(admin.TabularInline):
+class DumpTaskOperationInline(TabularInline):
+    """Последние операции задачи постранично; полная история — в списке операций."""
     model = DumpTaskOperation
+    fields = ["created_dt", "status", "dump_size", "dump_path"]
+    readonly_fields = fields
+    ordering = ["-created_dt"]
+    per_page = 20
+    extra = 0
+    show_change_link = True
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(*HEAVY_OPERATION_FIELDS)
+
+    def has_add_permission(self, request, obj=None):
+        # Новые операции создаёт действие "Execute dump"
+        return False
 
 
 @admin.register(DumpTask)
@@ -139,42 +157,103 @@ class DumpTaskAdmin(ModelAdmin):
     list_filter_submit = False
     list_fullwidth = False
     list_display = ["id", "created_dt", "database",
-                    "file_storage", "task_period", "max_dumpfiles_keep"]
+                    "file_storage", "task_period", "max_dumpfiles_keep",
+                    "last_success_dt", "last_failure_dt", "last_dump_size", "last_duration_seconds"]
+    list_select_related = ["database", "file_storage"]
+    readonly_fields = ["last_success_dt", "last_failure_dt", "last_dump_size", "last_duration_seconds"]
     actions = ['execute_dump']
     inlines = [DumpTaskOperationInline]
 
     @action(description=_("Execute dump"))
     def execute_dump(self, request: HttpRequest, queryset):
-        for task in queryset:
+        tasks = list(queryset.select_related("database"))
+        # Базы проверяются параллельно, по одной на несколько задач
+        probes = probe_databases({task.database_id: task.database for task in tasks}.values())
+        for task in tasks:
             db = task.database
-            db_interface = DB_INTERFACE[db.db_type]()
-            is_connected = db_interface.check_connection(db.connection_string)
-            if not is_connected:
-                messages.error(request, _(f"{task.id}: {db.name} Connection failed!"))
+            if not probes[db.pk].ok:
+                messages.error(request, _(f"{task.id}: {db.name}: {probes[db.pk].error}"))
                 continue
+            # Выполнит воркер (manage.py run_worker)
             new_operation = DumpTaskOperation.objects.create(
                 task=task,
             )
-            subprocess.Popen(
-                ["python", "manage.py", "dump_operation", str(new_operation.id)])
             messages.success(request, _(
                 f"{task.id}: Operation of dump created {new_operation.id}"))
 
 
+class StageMetricsAdminMixin:
+    """Замеры этапов операции (StageTimer) таблицей вместо сырого JSON."""
+
+    exclude = ["stage_metrics"]
+    readonly_fields = ["stage_metrics_table"]
+
+    @admin.display(description=_("Stage metrics"))
+    def stage_metrics_table(self, obj):
+        if not obj.stage_metrics:
+            return "-"
+        rows = format_html_join("", "<tr>{}</tr>", (
+            (format_html_join("", "<td style=\"padding: 2px 12px 2px 0\">{}</td>", (
+                (record["stage"],),
+                (f"{record['wall_seconds']:.1f} s",),
+                (f"{record['bytes'] / MB:.1f} MB" if record.get("bytes") is not None else "",),
+                (f"{record['bytes_per_second'] / MB:.1f} MB/s" if record.get("bytes_per_second") else "",),
+                (f"{record.get('thread_cpu_seconds', 0):.1f} s",),
+                (f"{record.get('child_cpu_seconds', 0):.1f} s",),
+            )),)
+            for record in obj.stage_metrics
+        ))
+        header = format_html_join("", "<th style=\"padding: 2px 12px 2px 0; text-align: left\">{}</th>", (
+            (_("Stage"),), (_("Wall time"),), (_("Bytes"),), (_("Throughput"),),
+            (_("CPU"),), (_("Child CPU"),),
+        ))
+        return format_html("<table><tr>{}</tr>{}</table>", header, rows)
+
+
+class DumpContentInline(TabularInline):
+    """Содержимое дампа постранично; поиск по всем дампам — в списке Dump contents."""
+    model = DumpContent
+    fields = ["schema", "table", "partition", "partition_id", "rows", "size", "parts"]
+    readonly_fields = fields
+    ordering = ["schema", "table", "partition"]
+    per_page = 50
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(DumpTaskOperation)
-class DumpTaskOperationAdmin(ModelAdmin):
+class DumpTaskOperationAdmin(StageMetricsAdminMixin, ModelAdmin):
     compressed_fields = True
     warn_unsaved_form = True
     list_filter_submit = False
     list_fullwidth = False
-    list_display = ["id", "created_dt", "task__database", "status"]
+    list_display = ["id", "created_dt", "task__database", "status", "dump_size"]
+    list_select_related = ["task__database"]
+    ordering = ["-created_dt"]
+    # COUNT(*) по всей таблице на каждой странице списка
+    show_full_result_count = False
+    raw_id_fields = ["task", "base_operation", "artifact_operation"]
     actions = ["reexecute_dump", "restore_dump"]
+    inlines = [DumpContentInline]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.defer(*HEAVY_OPERATION_FIELDS) if is_changelist(request) else queryset
 
     @action(description=_("ReExecute dump"))
     def reexecute_dump(self, request: HttpRequest, queryset):
-        for operation in queryset:
-            subprocess.Popen(
-                ["python", "manage.py", "dump_operation", str(operation.id)])
+        # Повторно ставим в очередь воркера; выполняющиеся не трогаем, брошенные — можно.
+        # Дамп, артефакт которого переиспользуют более поздние операции, не перезаписываем
+        reused = queryset.filter(reuses__isnull=False).distinct().count()
+        queued = queryset.filter(requeueable()).exclude(reuses__isnull=False).update(
+            status=DumpOperationStatusChoices.CREATED, error_text=None)
+        messages.success(request, _(f"Operations of dump queued: {queued}"))
+        if reused:
+            messages.warning(request, _(
+                f"Operations skipped, their dumps are reused by later operations: {reused}"))
 
     @action(description=_("Restore dump"))
     def restore_dump(self, request: HttpRequest, queryset):
@@ -182,14 +261,12 @@ class DumpTaskOperationAdmin(ModelAdmin):
             new_restore_operation = RecoverBackupOperation.objects.create(
                 dump_operation=operation
             )
-            subprocess.Popen(
-                ["python", "manage.py", "restore_dump", str(new_restore_operation.id)])
             messages.success(request, _(
                 f"Operation of restore dump created {new_restore_operation.id}"))
 
 
 @admin.register(RecoverBackupOperation)
-class RecoverBackupOperationAdmin(ModelAdmin):
+class RecoverBackupOperationAdmin(StageMetricsAdminMixin, ModelAdmin):
     compressed_fields = True
     warn_unsaved_form = True
     list_filter_submit = False
@@ -197,9 +274,99 @@ class RecoverBackupOperationAdmin(ModelAdmin):
     actions = ["restore_dump"]
     list_display = ["created_dt", "dump_operation__task__database",
                     "dump_operation__dump_path", "status"]
+    list_select_related = ["dump_operation__task__database"]
+    ordering = ["-created_dt"]
+    show_full_result_count = False
+    raw_id_fields = ["dump_operation"]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if is_changelist(request):
+            queryset = queryset.defer("stage_metrics", *(f"dump_operation__{field}" for field in HEAVY_OPERATION_FIELDS))
+        return queryset
 
     @action(description=_("Restore dump"))
     def restore_dump(self, request: HttpRequest, queryset):
-        for operation in queryset:
-            subprocess.Popen(
-                ["python", "manage.py", "restore_dump", str(operation.id)])
+        queued = queryset.filter(requeueable()).update(
+            status=DumpOperationStatusChoices.CREATED, error_text=None)
+        messages.success(request, _(f"Operations of restore queued: {queued}"))
+
+
+@admin.register(ConnectionProbe)
+class ConnectionProbeAdmin(ModelAdmin):
+    list_filter_submit = False
+    list_fullwidth = False
+    list_display = ["created_at", "database", "file_storage", "ok", "latency_ms", "error"]
+    list_filter = ["ok", "database", "file_storage"]
+    list_select_related = ["database", "file_storage"]
+    ordering = ["-created_at"]
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DumpContent)
+class DumpContentAdmin(ModelAdmin):
+    """Поиск бэкапа по содержимому: в каком дампе есть таблица или партиция."""
+    list_filter_submit = False
+    list_fullwidth = False
+    list_display = ["operation", "operation__created_dt", "operation__task__database",
+                    "schema", "table", "partition", "partition_id", "rows", "size", "parts"]
+    list_filter = ["operation__task__database"]
+    list_select_related = ["operation__task__database"]
+    search_fields = ["table", "schema", "partition_id"]
+    search_help_text = _("Exact table, schema / database, schema.table or partition ID")
+    ordering = ["-operation__created_dt", "schema", "table", "partition"]
+    show_full_result_count = False
+    actions = ["restore_tables"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(
+            *(f"operation__{field}" for field in HEAVY_OPERATION_FIELDS))
+
+    def get_search_results(self, request, queryset, search_term):
+        # Точное совпадение с учётом регистра — по индексам; icontains/iexact читали бы всю таблицу
+        for term in search_term.split():
+            schema, table = term.rpartition(".")[::2]
+            if schema:
+                queryset = queryset.filter(schema=schema, table=table)
+            else:
+                queryset = queryset.filter(Q(table=term) | Q(schema=term) | Q(partition_id=term))
+        return queryset, False
+
+    @action(description=_("Restore selected tables"))
+    def restore_tables(self, request: HttpRequest, queryset):
+        # По операции восстановления на дамп. Партиции восстановления общие для всех
+        # таблиц, поэтому выбираются, только если у всех таблиц выбраны одни и те же
+        selected = {}
+        for content in queryset.select_related("operation").order_by("schema", "table", "partition_id"):
+            tables = selected.setdefault(content.operation, {})
+            tables.setdefault(f"{content.schema}.{content.table}", []).append(content.partition_id)
+        for dump_operation, tables in selected.items():
+            partition_sets = {tuple(partition_ids) for partition_ids in tables.values()}
+            partitions = next(iter(partition_sets)) if len(partition_sets) == 1 else ()
+            # Postgres и старые каталоги ClickHouse — без id партиций
+            if not all(partitions):
+                partitions = ()
+            if len(partition_sets) > 1 and all(all(partition_ids) for partition_ids in partition_sets):
+                messages.warning(request, _("%s: different partitions per table, restoring whole tables")
+                                 % dump_operation.id)
+            restore_operation = RecoverBackupOperation(
+                dump_operation=dump_operation, tables="\n".join(tables), partitions="\n".join(partitions))
+            try:
+                restore_operation.full_clean()
+            except ValidationError as e:
+                messages.error(request, f"{dump_operation.id}: {'; '.join(e.messages)}")
+                continue
+            restore_operation.save()
+            messages.success(request, _(f"Operation of restore dump created {restore_operation.id}"))
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+import yadisk
+
+from manager.services.streams import CHUNK_SIZE
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Минимальная часть REST API Яндекс.Диска, которую использует
+    YandexDiskStorageSerivce: метаданные, mkdir, удаление, ссылки на
+    выгрузку/скачивание, PUT (в том числе chunked) и GET с Range.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def disk(self):
+        return self.server.disk
+
+    def _send(self, status, payload=None, headers=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, error):
+        self._send(status, {"error": error, "message": error, "description": error})
+
+    def _query_path(self):
+        query = parse_qs(urlparse(self.path).query)
+        path = query.get("path", ["/"])[0]
+        if path.startswith("disk:"):
+            path = path[len("disk:"):]
+        return "/" + path.strip("/"), query
+
+    def _read_body(self, fileobj):
+        """Тело запроса в файл: по Content-Length или chunked."""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                remaining = size
+                while remaining:
+                    data = self.rfile.read(min(remaining, CHUNK_SIZE))
+                    fileobj.write(data)
+                    remaining -= len(data)
+                self.rfile.readline()
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining:
+            data = self.rfile.read(min(remaining, CHUNK_SIZE))
+            fileobj.write(data)
+            remaining -= len(data)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/v1/disk/resources":
+            path, _ = self._query_path()
+            meta = self.disk.meta(path)
+            return self._send(200, meta) if meta else self._error(404, "DiskNotFoundError")
+        if parsed.path in ("/v1/disk/resources/upload", "/v1/disk/resources/download"):
+            path, _ = self._query_path()
+            if parsed.path.endswith("download") and not self.disk.meta(path):
+                return self._error(404, "DiskNotFoundError")
+            kind = "upload" if parsed.path.endswith("upload") else "download"
+            href = f"{self.server.base_url}/{kind}{quote(path)}"
+            return self._send(200, {"href": href, "method": "PUT" if kind == "upload" else "GET", "templated": False})
+        if parsed.path.startswith("/download/"):
+            return self._download(unquote(parsed.path[len("/download"):]))
+        self._error(404, "NotFound")
+
+    def _download(self, path):
+        local_path = self.disk.local_path(path)
+        if not os.path.isfile(local_path):
+            return self._error(404, "DiskNotFoundError")
+        size = os.path.getsize(local_path)
+        start, end = 0, size - 1
+        status = 200
+        byte_range = self.headers.get("Range")
+        if byte_range:
+            first, last = byte_range.split("=", 1)[1].split("-", 1)
+            start, end = int(first), min(int(last or size - 1), size - 1)
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        with open(local_path, "rb") as fileobj:
+            fileobj.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                data = fileobj.read(min(remaining, CHUNK_SIZE))
+                self.wfile.write(data)
+                remaining -= len(data)
+
+    def do_PUT(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/v1/disk/resources":
+            path, _ = self._query_path()
+            local_path = self.disk.local_path(path)
+            if os.path.isdir(local_path):
+                return self._error(409, "DiskPathPointsToExistentDirectoryError")
+            if os.path.exists(local_path):
+                return self._error(409, "DiskResourceAlreadyExistsError")
+            os.makedirs(local_path)
+            return self._send(201, {"href": "", "method": "GET", "templated": False})
+        if parsed.path.startswith("/upload/"):
+            path = unquote(parsed.path[len("/upload"):])
+            local_path = self.disk.local_path(path)
+            if not os.path.isdir(os.path.dirname(local_path)):
+                return self._error(409, "DiskPathDoesntExistsError")
+            with open(local_path + ".part", "wb") as fileobj:
+                self._read_body(fileobj)
+            os.replace(local_path + ".part", local_path)
+            self.disk.forget(path)
+            return self._send(201)
+        self._error(404, "NotFound")
+
+    def do_DELETE(self):
+        path, _ = self._query_path()
+        local_path = self.disk.local_path(path)
+        if os.path.isdir(local_path):
+            shutil.rmtree(local_path)
+        elif os.path.isfile(local_path):
+            os.remove(local_path)
+        else:
+            return self._error(404, "DiskNotFoundError")
+        self.disk.forget(path)
+        self._send(204)
+
+
+class FakeYandexDisk:
+    """
+    Локальная замена Яндекс.Диска для бенчмарков: файлы лежат во временном
+    каталоге, yadisk перенаправляется сюда через settings.BASE_API_URL.
+
+        with FakeYandexDisk():
+            ...  # YandexDiskStorageSerivce ходит на локальный сервер
+    """
+
+    def __init__(self, root=None):
+        self.root = root or tempfile.mkdtemp(prefix="fake_yadisk_")
+        self._md5 = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._original_url = None
+
+    def local_path(self, path):
+        return os.path.join(self.root, path.strip("/"))
+
+    def forget(self, path):
+        with self._lock:
+            self._md5.pop(path, None)
+
+    def meta(self, path):
+        local_path = self.local_path(path)
+        if os.path.isdir(local_path):
+            return {"type": "dir", "path": f"disk:{path}", "name": os.path.basename(path)}
+        if not os.path.isfile(local_path):
+            return None
+        with self._lock:
+            md5 = self._md5.get(path)
+        if md5 is None:
+            digest = hashlib.md5()
+            with open(local_path, "rb") as fileobj:
+                for block in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    digest.update(block)
+            md5 = digest.hexdigest()
+            with self._lock:
+                self._md5[path] = md5
+        return {
+            "type": "file", "path": f"disk:{path}", "name": os.path.basename(path),
+            "size": os.path.getsize(local_path), "md5": md5,
+        }
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.disk = self
+        self._server.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self._original_url = yadisk.settings.BASE_API_URL
+        yadisk.settings.BASE_API_URL = self._server.base_url
+        return self
+
+    def stop(self):
+        yadisk.settings.BASE_API_URL = self._original_url
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
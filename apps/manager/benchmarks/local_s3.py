@@ -0,0 +1,41 @@
+import socket
+from contextlib import contextmanager
+
+import boto3
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_s3(endpoint=None, access_key="benchmark", secret_key="benchmark", bucket="benchmarks"):
+    """
+    S3 для бенчмарков -> {"endpoint", "bucket", "access_key", "secret_key"}.
+    endpoint — уже запущенный локальный S3 (MinIO и т.п.); без него
+    поднимается in-process сервер moto (pip install "moto[server]").
+    """
+    server = None
+    if not endpoint:
+        try:
+            from moto.server import ThreadedMotoServer
+        except ImportError:
+            raise RuntimeError('S3 stand-in needs moto: pip install "moto[server]" or pass --s3-endpoint')
+        port = _free_port()
+        server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+        server.start()
+        endpoint = f"http://127.0.0.1:{port}"
+    try:
+        client = boto3.session.Session().client(
+            "s3", endpoint_url=endpoint, aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key, region_name="us-east-1")
+        try:
+            client.create_bucket(Bucket=bucket)
+        except client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+        yield {"endpoint": endpoint, "bucket": bucket, "access_key": access_key, "secret_key": secret_key}
+    finally:
+        if server:
+            server.stop()
@@ -0,0 +1,507 @@
+import os
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+
+from manager.choices import (DBType, DumpOperationStatusChoices,
+                             DumpTaskPeriodsChoices, PgDumpFormatChoices,
+                             StorageFormatChoices)
+from manager.models import (DumpTask, DumpTaskOperation, FileStorage,
+                            RecoverBackupOperation, UserDatabase)
+from manager.services.backup_service import BackupService
+from manager.services.chunk_store import ChunkStore, ContentDefinedChunker
+from manager.services.compression import get_codec
+from manager.services.spool import spool_path
+from manager.services.storage_factory import get_storage_service
+from manager.services.streams import (CHUNK_SIZE, CompressingReader,
+                                      DecompressingReader, HashingReader,
+                                      write_directory_tar, write_directory_zip)
+
+MB = 1024 * 1024
+# Блок синтетических данных: повторяется с разными заголовками
+SYNTHETIC_BLOCK_SIZE = 4 * MB
+SAMPLE_INTERVAL = 0.05
+
+
+def _process_rss(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _children(pid):
+    children = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as fileobj:
+                children.extend(int(child) for child in fileobj.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def tree_rss(pid=None):
+    """RSS процесса и всех его потомков (pg_dump, psql, ...) из /proc."""
+    pid = pid or os.getpid()
+    return _process_rss(pid) + sum(tree_rss(child) for child in _children(pid))
+
+
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResourceSampler:
+    """
+    Пики за время замера: RSS процесса вместе с дочерними и объём временных
+    файлов в SPOOL_DIR, в имени которых есть spool_marker (id операции).
+    ru_maxrss для этого не годится — это максимум за всю жизнь процесса.
+    """
+
+    def __init__(self, spool_marker=None):
+        self.spool_marker = spool_marker
+        self.peak_rss_bytes = 0
+        self.peak_spool_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _spool_bytes(self):
+        if not self.spool_marker:
+            return 0
+        try:
+            names = [name for name in os.listdir(settings.SPOOL_DIR) if self.spool_marker in name]
+        except OSError:
+            return 0
+        return sum(path_size(os.path.join(settings.SPOOL_DIR, name)) for name in names)
+
+    def _sample(self):
+        self.peak_rss_bytes = max(self.peak_rss_bytes, tree_rss())
+        self.peak_spool_bytes = max(self.peak_spool_bytes, self._spool_bytes())
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+@lru_cache(maxsize=4)
+def _synthetic_block(seed):
+    rng = random.Random(seed)
+    lines = []
+    length = 0
+    row = 0
+    while length < SYNTHETIC_BLOCK_SIZE:
+        row += 1
+        line = (f"{row}\t2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+                f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00\t"
+                f"{rng.random() * 10000:.2f}\t{rng.getrandbits(128):032x}\t"
+                f"{rng.choice(['new', 'paid', 'shipped', 'cancelled'])}\n")
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode()[:SYNTHETIC_BLOCK_SIZE]
+
+
+class SyntheticReader:
+    """
+    size байт данных, похожих на вывод COPY: строки с числами, датами и
+    хэшами. Сжимаются примерно как настоящие дампы; блок генерируется один
+    раз на seed, дальше повторяется с новым заголовком, чтобы замер не
+    упирался в random.
+    """
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self._position = 0
+        self._block = _synthetic_block(seed)
+        self._buffer = b""
+        self._blocks = 0
+
+    def read(self, size=-1):
+        remaining = self.size - self._position
+        if remaining <= 0:
+            return b""
+        size = remaining if size is None or size < 0 else min(size, remaining)
+        while len(self._buffer) < size:
+            self._blocks += 1
+            self._buffer += f"-- block {self._blocks}\n".encode() + self._block
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._position += len(data)
+        return data
+
+    def close(self):
+        return None
+
+
+def drain(reader):
+    total = 0
+    while True:
+        data = reader.read(CHUNK_SIZE)
+        if not data:
+            return total
+        total += len(data)
+
+
+class _CountingSink:
+    """Приёмник архива: считает байты (после сжатия, если задан codec) и выбрасывает их."""
+
+    def __init__(self, codec=None):
+        self.size = 0
+        self._compressor = codec.compressor() if codec else None
+
+    def write(self, data):
+        self.size += len(self._compressor.compress(data) if self._compressor else data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._compressor:
+            self.size += len(self._compressor.flush())
+
+
+def measure(name, func, spool_marker=None, **params):
+    """
+    Замер одного сценария. func() -> dict с результатами (bytes, stages, ...);
+    исключение записывается в error, а не прерывает весь прогон.
+    """
+    print(f"Benchmark {name}...")
+    result = {"name": name, "params": params}
+    started = time.monotonic()
+    sampler = ResourceSampler(spool_marker)
+    try:
+        with sampler:
+            result.update(func() or {})
+    except Exception as e:
+        result["error"] = str(e)
+    wall_seconds = time.monotonic() - started
+    result["wall_seconds"] = round(wall_seconds, 3)
+    if result.get("bytes") and wall_seconds > 0:
+        result["bytes_per_second"] = round(result["bytes"] / wall_seconds)
+    result["peak_rss_bytes"] = sampler.peak_rss_bytes
+    result["peak_spool_bytes"] = sampler.peak_spool_bytes
+    summary = result.get("error") or (
+        f"{result['wall_seconds']:.2f}s" + (
+            f", {result['bytes_per_second'] / MB:.1f} MB/s" if "bytes_per_second" in result else ""))
+    print(f"  {summary}")
+    return result
+
+
+# --- Отдельные этапы, без сети и БД ---
+
+def run_micro(size):
+    results = []
+    cpu_count = os.cpu_count() or 1
+    codecs = [
+        ("gzip-6", get_codec("gzip", level=6)),
+        ("zstd-3", get_codec("zstd", level=3)),
+        (f"zstd-3-threads{cpu_count}", get_codec("zstd", level=3, threads=cpu_count)),
+    ]
+    for label, codec in codecs:
+        compressed_path = os.path.join(tempfile.gettempdir(), f"benchmark_{uuid.uuid4().hex}.{codec.extension}")
+
+        def compress():
+            with open(compressed_path, "wb") as fileobj:
+                shutil.copyfileobj(CompressingReader(SyntheticReader(size), codec), fileobj, CHUNK_SIZE)
+            return {"bytes": size, "output_bytes": os.path.getsize(compressed_path),
+                    "ratio": round(size / max(os.path.getsize(compressed_path), 1), 2)}
+
+        def decompress():
+            with open(compressed_path, "rb") as fileobj:
+                return {"bytes": drain(DecompressingReader(fileobj, codec))}
+
+        results.append(measure(f"micro/compress/{label}", compress, size=size))
+        results.append(measure(f"micro/decompress/{label}", decompress, size=size))
+        if os.path.exists(compressed_path):
+            os.remove(compressed_path)
+
+    def sha256():
+        reader = HashingReader(SyntheticReader(size))
+        return {"bytes": drain(reader)}
+
+    def chunker():
+        chunks = [len(chunk) for chunk in ContentDefinedChunker(SyntheticReader(size))]
+        return {"bytes": sum(chunks), "chunks": len(chunks)}
+
+    results.append(measure("micro/sha256", sha256, size=size))
+    results.append(measure("micro/chunker", chunker, size=size))
+
+    # Архивация каталога бэкапа ClickHouse: много файлов частей
+    directory = tempfile.mkdtemp(prefix="benchmark_parts_")
+    try:
+        reader = SyntheticReader(size)
+        part = 0
+        while True:
+            data = reader.read(4 * MB)
+            if not data:
+                break
+            part_dir = os.path.join(directory, "shadow", "db", "table", "default", f"all_{part}_{part}_0")
+            os.makedirs(part_dir)
+            with open(os.path.join(part_dir, "data.bin"), "wb") as fileobj:
+                fileobj.write(data)
+            part += 1
+
+        def archive(writer, codec=None):
+            def run():
+                sink = _CountingSink(codec)
+                writer(directory, sink)
+                sink.close()
+                return {"bytes": size, "output_bytes": sink.size, "files": part}
+            return run
+
+        results.append(measure("micro/archive/zip-store", archive(write_directory_zip), size=size))
+        results.append(measure("micro/archive/tar", archive(write_directory_tar), size=size))
+        results.append(measure(
+            "micro/archive/tar-zstd", archive(write_directory_tar, get_codec("zstd", level=3)), size=size))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+# --- Хранилища (локальные заглушки S3 и Яндекс.Диска) ---
+
+def create_storage(storage_type, s3=None, **options):
+    suffix = uuid.uuid4().hex[:8]
+    fields = {"name": f"benchmark-{storage_type}-{suffix}", "type": storage_type, **options}
+    if storage_type == FileStorage.TYPE_S3:
+        fields.update(host=s3["endpoint"], bucket_name=s3["bucket"],
+                      access_key=s3["access_key"], secret_key=s3["secret_key"])
+    else:
+        fields.update(secret_key="benchmark-token")
+    return FileStorage.objects.create(**fields)
+
+
+def run_storage(storage_type, size, s3=None):
+    results = []
+    storage = create_storage(storage_type, s3)
+    params = {"storage": storage_type, "size": size}
+    try:
+        service = get_storage_service(storage)
+        operation_id = uuid.uuid4()
+        paths = {}
+
+        def upload_stream():
+            path, error = service.upload_stream(SyntheticReader(size), operation_id, "sql")
+            if error:
+                raise RuntimeError(error)
+            paths["single"] = path
+            return {"bytes": size}
+
+        def download_stream():
+            reader, error = service.open_stream(paths["single"])
+            if error:
+                raise RuntimeError(error)
+            try:
+                return {"bytes": drain(reader)}
+            finally:
+                reader.close()
+
+        results.append(measure(f"storage/{storage_type}/upload_stream", upload_stream, **params))
+        if "single" in paths:
+            results.append(measure(f"storage/{storage_type}/download_stream", download_stream, **params))
+
+        if hasattr(service, "upload_resumable"):
+            filepath = spool_path(f"dump_{operation_id}.resumable.sql")
+            with open(filepath, "wb") as fileobj:
+                shutil.copyfileobj(SyntheticReader(size), fileobj, CHUNK_SIZE)
+
+            def upload_resumable():
+                _, error = service.upload_resumable(filepath, f"{operation_id}-resumable", {}, lambda state: None)
+                if error:
+                    raise RuntimeError(error)
+                return {"bytes": size}
+
+            try:
+                results.append(measure(f"storage/{storage_type}/upload_resumable", upload_resumable, **params))
+            finally:
+                os.remove(filepath)
+
+        chunk_store = ChunkStore(service, storage)
+        manifests = []
+
+        def chunked_upload(seed):
+            def run():
+                path, error = chunk_store.upload(SyntheticReader(size, seed), uuid.uuid4(), "sql")
+                if error:
+                    raise RuntimeError(error)
+                manifests.append(path)
+                return {"bytes": size}
+            return run
+
+        def chunked_download():
+            reader, error = chunk_store.open(manifests[0])
+            if error:
+                raise RuntimeError(error)
+            try:
+                return {"bytes": drain(reader)}
+            finally:
+                reader.close()
+
+        results.append(measure(f"storage/{storage_type}/chunked_upload", chunked_upload(0), **params))
+        # Те же данные ещё раз: почти все чанки уже есть, выгружается только манифест
+        results.append(measure(f"storage/{storage_type}/chunked_upload_dedup", chunked_upload(0), **params))
+        if manifests:
+            results.append(measure(f"storage/{storage_type}/chunked_download", chunked_download, **params))
+        for manifest in manifests:
+            chunk_store.delete(manifest)
+        if "single" in paths:
+            service.delete_dump(paths["single"])
+    finally:
+        storage.delete()
+    return results
+
+
+# --- Полный цикл make_dump/restore_dump на локальном Postgres ---
+
+def load_postgres_data(dsn, size):
+    """Синтетическая таблица benchmark_rows примерно на size байт (не перезаливается, если уже такая)."""
+    import psycopg2
+
+    with psycopg2.connect(dsn) as connection, connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE IF NOT EXISTS benchmark_rows ("
+                       "id bigint PRIMARY KEY, created timestamptz, amount numeric(12, 2), "
+                       "token text, status text)")
+        cursor.execute("SELECT pg_total_relation_size('benchmark_rows')")
+        current = cursor.fetchone()[0]
+        if abs(current - size) <= size * 0.1:
+            return current
+        print(f"Loading ~{size // MB} MB of synthetic rows into Postgres...")
+        cursor.execute("TRUNCATE benchmark_rows")
+        # ~150 байт на строку вместе с индексом
+        rows = max(size // 150, 1)
+        cursor.execute(
+            "INSERT INTO benchmark_rows "
+            "SELECT g, now() - g * interval '1 second', (random() * 10000)::numeric(12, 2), "
+            "md5(g::text) || md5(random()::text), "
+            "(ARRAY['new', 'paid', 'shipped', 'cancelled'])[1 + g % 4] "
+            "FROM generate_series(1, %s) g", (rows,))
+        cursor.execute("SELECT pg_total_relation_size('benchmark_rows')")
+        return cursor.fetchone()[0]
+
+
+def same_postgres_database(dsn, other_dsn):
+    """Указывают ли строки подключения на одну базу (сервер, порт, имя — как их видит сам сервер)."""
+    import psycopg2
+
+    identities = []
+    for connection_string in (dsn, other_dsn):
+        with psycopg2.connect(connection_string) as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT inet_server_addr(), inet_server_port(), current_database(), "
+                           "pg_postmaster_start_time()")
+            identities.append(cursor.fetchone())
+    return identities[0] == identities[1]
+
+
+def run_pipeline(storage_type, mode, pg_format, dsn, restore_dsn, s3=None):
+    storage = create_storage(
+        storage_type, s3, resumable_uploads=(mode == "resumable"))
+    database = UserDatabase.objects.create(
+        name=f"benchmark-{uuid.uuid4().hex[:8]}", db_type=DBType.POSTGRESQL, connection_string=dsn)
+    restore_database = UserDatabase.objects.create(
+        name=f"benchmark-restore-{uuid.uuid4().hex[:8]}", db_type=DBType.POSTGRESQL,
+        connection_string=restore_dsn)
+    task = DumpTask.objects.create(
+        database=database, file_storage=storage, task_period=DumpTaskPeriodsChoices.NEVER,
+        pg_dump_format=pg_format,
+        storage_format=StorageFormatChoices.CHUNKED if mode == "chunked" else StorageFormatChoices.SINGLE,
+    )
+    params = {"storage": storage_type, "mode": mode, "pg_format": PgDumpFormatChoices(pg_format).name.lower()}
+    name = f"pipeline/{storage_type}/{mode}/{params['pg_format']}"
+    results = []
+    try:
+        operation = DumpTaskOperation.objects.create(task=task, status=DumpOperationStatusChoices.IN_PROCESS)
+
+        def dump():
+            is_success, error = BackupService(operation.id).make_dump()
+            if not is_success:
+                raise RuntimeError(error)
+            operation.refresh_from_db()
+            return {"bytes": operation.dump_size, "stages": operation.stage_metrics}
+
+        results.append(measure(f"{name}/dump", dump, spool_marker=str(operation.id), **params))
+        operation.refresh_from_db()
+        if operation.status != DumpOperationStatusChoices.SUCCESS:
+            return results
+
+        # Восстановление в restore_dsn: задача временно смотрит на эту базу
+        DumpTask.objects.filter(id=task.id).update(database=restore_database)
+        restore = RecoverBackupOperation.objects.create(
+            dump_operation=operation, status=DumpOperationStatusChoices.IN_PROCESS)
+
+        def restore_dump():
+            is_success, error = BackupService(restore.id).restore_dump()
+            restore.refresh_from_db()
+            if not is_success:
+                raise RuntimeError(error)
+            return {"bytes": operation.dump_size, "stages": restore.stage_metrics}
+
+        results.append(measure(f"{name}/restore", restore_dump, spool_marker=str(operation.id), **params))
+
+        service = get_storage_service(storage)
+        if ChunkStore.is_manifest(operation.dump_path):
+            ChunkStore(service, storage).delete(operation.dump_path)
+        else:
+            service.delete_dump(operation.dump_path)
+    finally:
+        task.delete()
+        database.delete()
+        restore_database.delete()
+        storage.delete()
+    return results
+
+
+def environment():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline):
+    """Строки сравнения с прошлым прогоном по bytes_per_second (или wall_seconds)."""
+    previous = {result["name"]: result for result in baseline.get("results", [])}
+    lines = [f"{'benchmark':<55} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for result in results:
+        before = previous.get(result["name"])
+        if not before or result.get("error") or before.get("error"):
+            continue
+        if result.get("bytes_per_second") and before.get("bytes_per_second"):
+            old, new = before["bytes_per_second"] / MB, result["bytes_per_second"] / MB
+            change = (new - old) / old * 100
+            unit = "MB/s"
+        else:
+            old, new = before["wall_seconds"], result["wall_seconds"]
+            # Для времени меньше — лучше: знак как у скорости
+            change = (old - new) / old * 100 if old else 0.0
+            unit = "s"
+        lines.append(f"{result['name']:<55} {old:>9.1f} {unit:<2} {new:>9.1f} {unit:<2} {change:>+7.1f}%")
+    return "\n".join(lines)
@@ -19,3 +19,35 @@ class DumpOperationStatusChoices(IntegerChoices):
     IN_PROCESS = 2, _('In Process')
     FAIL = 3, _('Fail')
     SUCCESS = 4, _('Success')
+    DELETE_PENDING = 5, _('Pending deletion')
+
+
+class PgDumpFormatChoices(IntegerChoices):
+    PLAIN = 1, _('Plain SQL (psql)')
+    DIRECTORY = 2, _('Directory (parallel pg_dump/pg_restore)')
+    PER_TABLE = 3, _('Object per table (selective restore)')
+
+
+class ClickhouseArchiveChoices(IntegerChoices):
+    STORE = 1, _('Zip without compression')
+    ZSTD = 2, _('tar + zstd')
+    ZSTD_MT = 3, _('tar + multi-threaded zstd')
+
+
+class ClickhouseEngineChoices(IntegerChoices):
+    CLICKHOUSE_BACKUP = 1, _('clickhouse-backup (local files)')
+    NATIVE = 2, _('Native BACKUP/RESTORE to S3 (server-side)')
+    REMOTE = 3, _('clickhouse-backup create_remote/restore_remote to S3')
+
+
+class CompressionCodecChoices(IntegerChoices):
+    DEFAULT = 1, _('Default for the dump format')
+    NONE = 2, _('No compression')
+    GZIP = 3, _('gzip')
+    ZSTD = 4, _('zstd')
+    LZ4 = 5, _('lz4')
+
+
+class StorageFormatChoices(IntegerChoices):
+    SINGLE = 1, _('Single file')
+    CHUNKED = 2, _('Deduplicated chunks')
@@ -1,36 +1,73 @@
 from datetime import datetime
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from manager.models import DumpTask, DumpTaskOperation
-from manager.choices import DumpTaskPeriodsChoices
+from manager.choices import DumpOperationStatusChoices, DumpTaskPeriodsChoices
 from manager.services.backup_service import BackupService
+from manager.services.claims import HEARTBEAT_INTERVAL, touch_claims
+from manager.services.executor import BoundedExecutor, database_host_key
+from manager.services.retention import prune_task
 
 
 class Command(BaseCommand):
     help = 'Check and execute dump operations'
 
-    def _process_dump(self, task):
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.DUMP_CONCURRENCY,
+                            help='Max dumps running at once')
+        parser.add_argument('--per-host', type=int, default=settings.DUMP_CONCURRENCY_PER_DB_HOST,
+                            help='Max dumps running at once against one database host')
+        parser.add_argument('--per-storage', type=int, default=settings.DUMP_CONCURRENCY_PER_STORAGE,
+                            help='Max dumps uploading at once to one file storage')
+
+    def _process_dump(self, executor, task, operation_id):
+        backup_service = BackupService(operation_id)
+        is_success, error = backup_service.make_dump()
+        if is_success:
+            # Очистка — отдельной задачей пула, не на пути самого дампа
+            executor.submit(f"{task.id}/prune", prune_task, task.id, operation_id,
+                            limit_keys=(("storage", task.file_storage_id),))
+        return error or "ok"
+
+    def _submit(self, executor, task):
         print("Process task:", task.id)
+        # Сразу IN_PROCESS, чтобы операцию не забрал ещё и воркер
         new_operation = DumpTaskOperation.objects.create(
             task=task,
+            status=DumpOperationStatusChoices.IN_PROCESS,
         )
         print(f"New operation {task.id} created: ", {new_operation.id})
-        backup_service = BackupService(str(new_operation.id))
-        backup_service.make_dump()
-
+        executor.submit(
+            f"{task.id}/{new_operation.id}",
+            self._process_dump,
+            executor,
+            task,
+            str(new_operation.id),
+            limit_keys=(
+                ("host", database_host_key(task.database.connection_string)),
+                ("storage", task.file_storage_id),
+            ),
+            claim=(DumpTaskOperation, new_operation.id),
+        )
 
     def handle(self, *args, **options):
-        every_day_tasks = DumpTask.objects.filter(task_period=DumpTaskPeriodsChoices.EVERYDAY)
-        for task in every_day_tasks:
-            self._process_dump(task)
+        periods = [DumpTaskPeriodsChoices.EVERYDAY]
         today = datetime.now()
         if today.weekday() == 0:
-            tasks = DumpTask.objects.filter(task_period=DumpTaskPeriodsChoices.EVERYWEEK)
-            for task in tasks:
-                self._process_dump(task)
+            periods.append(DumpTaskPeriodsChoices.EVERYWEEK)
         if today.day == 1:
-            tasks = DumpTask.objects.filter(task_period=DumpTaskPeriodsChoices.EVERYMONTH)
-            for task in tasks:
-                self._process_dump(task)
+            periods.append(DumpTaskPeriodsChoices.EVERYMONTH)
+
+        executor = BoundedExecutor(
+            options['concurrency'],
+            limits={"host": options['per_host'], "storage": options['per_storage']},
+        )
+        tasks = DumpTask.objects.filter(task_period__in=periods).select_related("database")
+        for task in tasks:
+            self._submit(executor, task)
+        # Продлеваем захват, чтобы воркер не счёл операции брошенными
+        executor.wait(tick=lambda: touch_claims(executor.active_jobs()), interval=HEARTBEAT_INTERVAL)
+        print(executor.summary())
         print("Check tasks finished")
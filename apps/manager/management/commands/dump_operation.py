@@ -1,7 +1,9 @@
 from django.core.management.base import BaseCommand
 
 
+from manager.models import DumpTaskOperation
 from manager.services.backup_service import BackupService
+from manager.services.retention import prune_task
 
 
 class Command(BaseCommand):
@@ -14,7 +16,10 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         operation_id = options['operation_id']
         backup_service = BackupService(operation_id)
-        backup_service.make_dump()
+        is_success, _ = backup_service.make_dump()
 
         # Проверка на max_cnt_keep
-        
+        if is_success:
+            task_id = DumpTaskOperation.objects.filter(id=operation_id).values_list("task_id", flat=True).first()
+            print(prune_task(task_id, operation_id))
+
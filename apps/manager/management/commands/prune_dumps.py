@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from manager.models import DumpTask
+from manager.services.retention import prune_task
+
+
+class Command(BaseCommand):
+    help = 'Delete old dumps by retention policy and retry failed deletions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task', type=str, help='Task Id (all tasks by default)')
+
+    def handle(self, *args, **options):
+        task_ids = [options['task']] if options['task'] else DumpTask.objects.values_list("id", flat=True)
+        for task_id in task_ids:
+            print(f"Prune task {task_id}: {prune_task(task_id)}")
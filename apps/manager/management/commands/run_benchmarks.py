@@ -0,0 +1,127 @@
+import json
+import os
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from manager.benchmarks.fake_yadisk import FakeYandexDisk
+from manager.benchmarks.local_s3 import local_s3
+from manager.benchmarks.suite import (MB, compare, environment,
+                                      load_postgres_data, run_micro,
+                                      run_pipeline, run_storage,
+                                      same_postgres_database)
+from manager.choices import PgDumpFormatChoices
+from manager.models import FileStorage
+
+SUITES = ("micro", "storage", "pipeline")
+MODES = ("stream", "chunked", "resumable")
+PG_FORMATS = {"plain": PgDumpFormatChoices.PLAIN, "directory": PgDumpFormatChoices.DIRECTORY}
+
+
+def _csv(value):
+    return [item for item in value.split(",") if item]
+
+
+class Command(BaseCommand):
+    help = ('Offline benchmarks of the dump/upload/restore pipeline: local S3 and Yandex Disk '
+            'stand-ins, local Postgres with synthetic data; results are written as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suites', type=_csv, default=list(SUITES),
+                            help='Comma-separated: micro,storage,pipeline')
+        parser.add_argument('--size-mb', type=int, default=64,
+                            help='Synthetic data size (stream, archive and Postgres table)')
+        parser.add_argument('--storages', type=_csv, default=[FileStorage.TYPE_S3, FileStorage.TYPE_YADISK],
+                            help='Comma-separated: s3,yadisk')
+        parser.add_argument('--modes', type=_csv, default=list(MODES),
+                            help='Pipeline upload modes: stream,chunked,resumable (resumable is S3 only)')
+        parser.add_argument('--pg-formats', type=_csv, default=["plain"],
+                            help='Pipeline pg_dump formats: plain,directory')
+        parser.add_argument('--s3-endpoint', default=os.getenv("BENCHMARK_S3_ENDPOINT"),
+                            help='Running local S3 (MinIO, ...); without it an in-process moto server is used')
+        parser.add_argument('--s3-access-key', default=os.getenv("BENCHMARK_S3_ACCESS_KEY", "benchmark"))
+        parser.add_argument('--s3-secret-key', default=os.getenv("BENCHMARK_S3_SECRET_KEY", "benchmark"))
+        parser.add_argument('--pg-dsn', default=os.getenv("BENCHMARK_PG_DSN"),
+                            help='Local Postgres for the pipeline suite (gets a benchmark_rows table)')
+        parser.add_argument('--pg-restore-dsn', default=os.getenv("BENCHMARK_PG_RESTORE_DSN"),
+                            help='Scratch Postgres database for restores (schema public is dropped and '
+                                 'recreated); required for the pipeline suite, must differ from --pg-dsn')
+        parser.add_argument('--output', help='JSON file with results (default benchmarks-<time>.json)')
+        parser.add_argument('--baseline', help='Previous results JSON to compare against')
+
+    def handle(self, *args, **options):
+        if "pipeline" in options['suites'] and options['pg_dsn']:
+            if not options['pg_restore_dsn']:
+                raise CommandError("The pipeline suite needs --pg-restore-dsn / BENCHMARK_PG_RESTORE_DSN: "
+                                   "a scratch database, restores drop its schema public")
+            if same_postgres_database(options['pg_dsn'], options['pg_restore_dsn']):
+                raise CommandError("--pg-restore-dsn points to the --pg-dsn database: "
+                                   "restores would drop its schema public")
+        # Хранилища, задачи и операции бенчмарков — в отдельной тестовой базе сервиса, не в рабочей
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self._run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def _run(self, options):
+        size = options['size_mb'] * MB
+        started_at = datetime.now()
+        results = []
+        skipped = []
+
+        if "micro" in options['suites']:
+            results.extend(run_micro(size))
+
+        with ExitStack() as stack:
+            s3 = None
+            if FileStorage.TYPE_S3 in options['storages'] and {"storage", "pipeline"} & set(options['suites']):
+                try:
+                    s3 = stack.enter_context(local_s3(
+                        options['s3_endpoint'], options['s3_access_key'], options['s3_secret_key']))
+                except Exception as e:
+                    skipped.append({"name": "s3", "reason": str(e)})
+            if FileStorage.TYPE_YADISK in options['storages']:
+                stack.enter_context(FakeYandexDisk())
+            storages = [
+                storage_type for storage_type in options['storages']
+                if storage_type != FileStorage.TYPE_S3 or s3
+            ]
+
+            if "storage" in options['suites']:
+                for storage_type in storages:
+                    results.extend(run_storage(storage_type, size, s3))
+
+            if "pipeline" in options['suites']:
+                if not options['pg_dsn']:
+                    skipped.append({"name": "pipeline", "reason": "no --pg-dsn / BENCHMARK_PG_DSN"})
+                else:
+                    load_postgres_data(options['pg_dsn'], size)
+                    for storage_type in storages:
+                        for mode in options['modes']:
+                            if mode == "resumable" and storage_type != FileStorage.TYPE_S3:
+                                continue
+                            for pg_format in options['pg_formats']:
+                                results.extend(run_pipeline(
+                                    storage_type, mode, PG_FORMATS[pg_format], options['pg_dsn'],
+                                    options['pg_restore_dsn'], s3))
+
+        report = {
+            "started_at": started_at.isoformat(),
+            "environment": environment(),
+            "options": {key: options[key] for key in ("suites", "size_mb", "storages", "modes", "pg_formats")},
+            "skipped": skipped,
+            "results": results,
+        }
+        output = options['output'] or f"benchmarks-{started_at:%Y%m%d-%H%M%S}.json"
+        with open(output, "w") as fileobj:
+            json.dump(report, fileobj, indent=2, default=str)
+        for item in skipped:
+            print(f"Skipped {item['name']}: {item['reason']}")
+        print(f"Results written to {output}")
+
+        if options['baseline']:
+            with open(options['baseline']) as fileobj:
+                print(compare(results, json.load(fileobj)))
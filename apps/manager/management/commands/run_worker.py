@@ -0,0 +1,112 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from manager.choices import DumpOperationStatusChoices
+from manager.models import DumpTaskOperation, RecoverBackupOperation
+from manager.services.backup_service import BackupService
+from manager.services.claims import HEARTBEAT_INTERVAL, fail_stale_claims, touch_claims
+from manager.services.executor import BoundedExecutor, database_host_key
+from manager.services.retention import prune_task
+
+
+class Command(BaseCommand):
+    help = 'Worker: execute queued dump and restore operations on a warm thread pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.WORKER_CONCURRENCY,
+                            help='Max operations running at once')
+        parser.add_argument('--poll-interval', type=float, default=settings.WORKER_POLL_INTERVAL,
+                            help='Seconds between queue checks')
+
+    def _stop(self, signum, frame):
+        print("Worker: stop requested, waiting for running operations")
+        self._stopping = True
+
+    @staticmethod
+    def _claim(model, operation_id):
+        # Забираем операцию атомарно: при нескольких воркерах её получит только один.
+        # updated_dt — начало heartbeat, иначе давно созданная операция сразу выглядела бы брошенной
+        return model.objects.filter(
+            id=operation_id, status=DumpOperationStatusChoices.CREATED,
+        ).update(status=DumpOperationStatusChoices.IN_PROCESS, updated_dt=timezone.now()) == 1
+
+    @staticmethod
+    def _make_dump(executor, task, operation_id):
+        is_success, error = BackupService(operation_id).make_dump()
+        if is_success:
+            # Очистка — отдельной задачей пула, не на пути самого дампа
+            executor.submit(f"{task.id}/prune", prune_task, task.id, operation_id,
+                            limit_keys=(("storage", task.file_storage_id),))
+        return error or "ok"
+
+    @staticmethod
+    def _restore_dump(executor, task, operation_id):
+        _, error = BackupService(operation_id).restore_dump()
+        return error or "ok"
+
+    def _poll(self, executor):
+        free_slots = executor.free_slots
+        if not free_slots:
+            return
+        queue = [
+            (operation.created_dt, DumpTaskOperation, self._make_dump, operation.id, operation.task)
+            for operation in DumpTaskOperation.objects.filter(
+                status=DumpOperationStatusChoices.CREATED,
+            ).select_related("task__database").order_by("created_dt")[:free_slots]
+        ] + [
+            (operation.created_dt, RecoverBackupOperation, self._restore_dump, operation.id,
+             operation.dump_operation.task)
+            for operation in RecoverBackupOperation.objects.filter(
+                status=DumpOperationStatusChoices.CREATED,
+            ).select_related("dump_operation__task__database").order_by("created_dt")[:free_slots]
+        ]
+        queue.sort(key=lambda item: item[0])
+        for _, model, func, operation_id, task in queue[:free_slots]:
+            if not self._claim(model, operation_id):
+                continue
+            print(f"Worker: {model.__name__} {operation_id} started")
+            executor.submit(
+                f"{model.__name__}/{operation_id}",
+                func,
+                executor,
+                task,
+                str(operation_id),
+                limit_keys=(
+                    ("host", database_host_key(task.database.connection_string)),
+                    ("storage", task.file_storage_id),
+                ),
+                claim=(model, operation_id),
+            )
+
+    def _heartbeat(self, executor):
+        if time.monotonic() - self._last_heartbeat < HEARTBEAT_INTERVAL:
+            return
+        self._last_heartbeat = time.monotonic()
+        touch_claims(executor.active_jobs())
+        fail_stale_claims()
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        executor = BoundedExecutor(
+            options['concurrency'],
+            limits={
+                "host": settings.DUMP_CONCURRENCY_PER_DB_HOST,
+                "storage": settings.DUMP_CONCURRENCY_PER_STORAGE,
+            },
+            keep_jobs=False,
+        )
+        print(f"Worker started, concurrency {executor.max_workers}")
+        self._last_heartbeat = float("-inf")
+        while not self._stopping:
+            self._heartbeat(executor)
+            self._poll(executor)
+            time.sleep(options['poll_interval'])
+        executor.wait(tick=lambda: self._heartbeat(executor), interval=options['poll_interval'])
+        print("Worker stopped")
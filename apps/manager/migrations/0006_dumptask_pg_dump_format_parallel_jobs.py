@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0005_filestorage_alter_dumptask_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='parallel_jobs',
+            field=models.PositiveIntegerField(default=1, help_text='pg_dump/pg_restore -j for the directory format', verbose_name='Parallel jobs'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='pg_dump_format',
+            field=models.IntegerField(choices=[(1, 'Plain SQL (psql)'), (2, 'Directory (parallel pg_dump/pg_restore)')], default=1, verbose_name='Postgres dump format'),
+        ),
+    ]
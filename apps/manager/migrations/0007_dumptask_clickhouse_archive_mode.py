@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0006_dumptask_pg_dump_format_parallel_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='clickhouse_archive_mode',
+            field=models.IntegerField(choices=[(1, 'Zip without compression'), (2, 'tar + zstd'), (3, 'tar + multi-threaded zstd')], default=1, help_text='ClickHouse parts are already compressed, so zip without compression is usually enough', verbose_name='ClickHouse archive mode'),
+        ),
+        migrations.AlterField(
+            model_name='dumptask',
+            name='parallel_jobs',
+            field=models.PositiveIntegerField(default=1, help_text='pg_dump/pg_restore -j for the directory format, zstd threads for ClickHouse', verbose_name='Parallel jobs'),
+        ),
+    ]
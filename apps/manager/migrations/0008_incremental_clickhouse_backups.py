@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0007_dumptask_clickhouse_archive_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='clickhouse_full_every',
+            field=models.PositiveIntegerField(default=7, help_text='Maximum length of the base -> increment chain', verbose_name='Full ClickHouse backup every N dumps'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='clickhouse_incremental',
+            field=models.BooleanField(default=False, help_text='Upload only parts that are missing in the previous successful backup', verbose_name='ClickHouse incremental backups'),
+        ),
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='base_operation',
+            field=models.ForeignKey(blank=True, default=None, help_text='Incremental dump: operation whose artifact holds the unchanged data', null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='increments', to='manager.dumptaskoperation', verbose_name='Base operation'),
+        ),
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='parts_manifest',
+            field=models.JSONField(blank=True, default=None, help_text='ClickHouse: all parts of this backup (db/table/disk/part)', null=True, verbose_name='Parts manifest'),
+        ),
+    ]
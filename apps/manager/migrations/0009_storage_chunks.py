@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0008_incremental_clickhouse_backups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='storage_format',
+            field=models.IntegerField(choices=[(1, 'Single file'), (2, 'Deduplicated chunks')], default=1, help_text='Deduplicated chunks: only chunks missing in the storage are uploaded', verbose_name='Storage format'),
+        ),
+        migrations.CreateModel(
+            name='StorageChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('stored_size', models.PositiveBigIntegerField(verbose_name='Stored size')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Manifests referencing the chunk')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('file_storage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='manager.filestorage')),
+            ],
+            options={
+                'verbose_name': 'Storage chunk',
+                'verbose_name_plural': 'Storage chunks',
+                'constraints': [models.UniqueConstraint(fields=('file_storage', 'digest'), name='unique_storage_chunk')],
+            },
+        ),
+    ]
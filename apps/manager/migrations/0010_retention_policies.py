@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0009_storage_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='keep_daily',
+            field=models.PositiveIntegerField(default=0, help_text='Newest dump of each of the last N days', verbose_name='Keep daily dumps'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='keep_monthly',
+            field=models.PositiveIntegerField(default=0, help_text='Newest dump of each of the last N months', verbose_name='Keep monthly dumps'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='keep_weekly',
+            field=models.PositiveIntegerField(default=0, help_text='Newest dump of each of the last N weeks', verbose_name='Keep weekly dumps'),
+        ),
+        migrations.AlterField(
+            model_name='dumptaskoperation',
+            name='status',
+            field=models.IntegerField(choices=[(1, 'Создана'), (2, 'В процессе'), (3, 'Провал'), (4, 'Успешно'), (5, 'Ожидает удаления')], default=1, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='recoverbackupoperation',
+            name='status',
+            field=models.IntegerField(choices=[(1, 'Создана'), (2, 'В процессе'), (3, 'Провал'), (4, 'Успешно'), (5, 'Ожидает удаления')], default=1, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0010_retention_policies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='local_dump_path',
+            field=models.CharField(blank=True, default=None, help_text='Resumable upload: dump file kept until the upload is completed', max_length=250, null=True, verbose_name='Local dump file'),
+        ),
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='upload_state',
+            field=models.JSONField(blank=True, default=None, help_text='Resumable upload: multipart upload id, part size and ETags of uploaded parts', null=True, verbose_name='Upload state'),
+        ),
+        migrations.AddField(
+            model_name='filestorage',
+            name='max_bandwidth_mb',
+            field=models.PositiveIntegerField(default=0, help_text='0 - unlimited', verbose_name='Bandwidth limit, MB/s'),
+        ),
+        migrations.AddField(
+            model_name='filestorage',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(default=4, help_text='S3: parts uploaded/downloaded at once', verbose_name='Parallel transfers'),
+        ),
+        migrations.AddField(
+            model_name='filestorage',
+            name='multipart_chunk_size_mb',
+            field=models.PositiveIntegerField(default=64, help_text='S3: size of one multipart part (min 5 MB)', verbose_name='Multipart part size, MB'),
+        ),
+        migrations.AddField(
+            model_name='filestorage',
+            name='resumable_uploads',
+            field=models.BooleanField(default=False, help_text='S3: keep the dump on local disk and persist multipart state, so re-executing an operation continues the upload', verbose_name='Resumable uploads'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0011_resumable_s3_transfers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='dump_sha256',
+            field=models.CharField(blank=True, default=None, max_length=64, null=True, verbose_name='Dump SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='dump_size',
+            field=models.BigIntegerField(blank=True, default=None, help_text='Size of the artifact as it is read on restore', null=True, verbose_name='Dump size, bytes'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+# DumpOperationStatusChoices
+FAIL = 3
+SUCCESS = 4
+
+
+def fill_task_summary(apps, schema_editor):
+    DumpTask = apps.get_model("manager", "DumpTask")
+    DumpTaskOperation = apps.get_model("manager", "DumpTaskOperation")
+    for task in DumpTask.objects.all():
+        operations = DumpTaskOperation.objects.filter(task=task).order_by("-created_dt")
+        success = operations.filter(status=SUCCESS).first()
+        failure = operations.filter(status=FAIL).first()
+        if success:
+            task.last_success_dt = success.created_dt
+            task.last_dump_size = success.dump_size
+            task.last_duration_seconds = sum(
+                record["wall_seconds"] for record in success.stage_metrics or []
+                if record["stage"] != "retention") or None
+        if failure:
+            task.last_failure_dt = failure.created_dt
+        task.save(update_fields=["last_success_dt", "last_failure_dt", "last_dump_size", "last_duration_seconds"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0013_stage_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='last_dump_size',
+            field=models.BigIntegerField(blank=True, default=None, editable=False, null=True, verbose_name='Last dump size, bytes'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='last_duration_seconds',
+            field=models.FloatField(blank=True, default=None, editable=False, null=True, verbose_name='Last dump duration, s'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='last_failure_dt',
+            field=models.DateTimeField(blank=True, default=None, editable=False, null=True, verbose_name='Last failure'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='last_success_dt',
+            field=models.DateTimeField(blank=True, default=None, editable=False, null=True, verbose_name='Last success'),
+        ),
+        migrations.AddIndex(
+            model_name='dumptaskoperation',
+            index=models.Index(fields=['task', 'status', '-created_dt'], name='dumpop_task_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='dumptaskoperation',
+            index=models.Index(fields=['status', 'created_dt'], name='dumpop_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='dumptaskoperation',
+            index=models.Index(fields=['-created_dt'], name='dumpop_created'),
+        ),
+        migrations.AddIndex(
+            model_name='recoverbackupoperation',
+            index=models.Index(fields=['dump_operation', 'status', '-created_dt'], name='restoreop_dump_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='recoverbackupoperation',
+            index=models.Index(fields=['status', 'created_dt'], name='restoreop_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='recoverbackupoperation',
+            index=models.Index(fields=['-created_dt'], name='restoreop_created'),
+        ),
+        migrations.RunPython(fill_task_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0014_operation_indexes_task_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionProbe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('ok', models.BooleanField(verbose_name='Connected')),
+                ('latency_ms', models.FloatField(blank=True, null=True, verbose_name='Latency, ms')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('database', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='probes', to='manager.userdatabase')),
+                ('file_storage', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='probes', to='manager.filestorage')),
+            ],
+            options={
+                'verbose_name': 'Connection probe',
+                'verbose_name_plural': 'Connection probes',
+                'indexes': [models.Index(fields=['database', '-created_at'], name='probe_database_created'), models.Index(fields=['file_storage', '-created_at'], name='probe_storage_created'), models.Index(fields=['created_at'], name='probe_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0015_connection_probes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='table_catalog',
+            field=models.JSONField(blank=True, default=None, help_text='Per-table Postgres dump: tables, row estimates, sizes and object keys', null=True, verbose_name='Table catalog'),
+        ),
+        migrations.AddField(
+            model_name='recoverbackupoperation',
+            name='tables',
+            field=models.TextField(blank=True, default='', help_text='Per-table Postgres dumps only: schema.table, one per line or comma-separated. The tables are truncated and reloaded, nothing else is touched. Empty - restore the whole database', verbose_name='Tables to restore'),
+        ),
+        migrations.AlterField(
+            model_name='dumptask',
+            name='pg_dump_format',
+            field=models.IntegerField(choices=[(1, 'Plain SQL (psql)'), (2, 'Directory (parallel pg_dump/pg_restore)'), (3, 'Object per table (selective restore)')], default=1, verbose_name='Postgres dump format'),
+        ),
+    ]
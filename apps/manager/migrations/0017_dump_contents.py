@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0016_per_table_dumps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DumpContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema', models.CharField(max_length=255, verbose_name='Schema / database')),
+                ('table', models.CharField(max_length=255, verbose_name='Table')),
+                ('partition', models.CharField(blank=True, default='', max_length=255, verbose_name='Partition')),
+                ('rows', models.BigIntegerField(blank=True, help_text='Postgres: planner estimate', null=True, verbose_name='Rows')),
+                ('size', models.BigIntegerField(blank=True, null=True, verbose_name='Size, bytes')),
+                ('parts', models.PositiveIntegerField(blank=True, help_text='ClickHouse only', null=True, verbose_name='Parts')),
+                ('operation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contents', to='manager.dumptaskoperation')),
+            ],
+            options={
+                'verbose_name': 'Dump content',
+                'verbose_name_plural': 'Dump contents',
+                'indexes': [models.Index(fields=['table', 'schema'], name='dumpcontent_table'), models.Index(fields=['schema', 'table'], name='dumpcontent_schema_table')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0017_dump_contents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='clickhouse_engine',
+            field=models.IntegerField(choices=[(1, 'clickhouse-backup (local files)'), (2, 'Native BACKUP/RESTORE to S3 (server-side)')], default=1, help_text='Native: ClickHouse writes the backup to the S3 storage itself, data does not pass through the manager. Needs an S3 storage reachable from the ClickHouse server; archive mode and incremental settings do not apply', verbose_name='ClickHouse backup engine'),
+        ),
+        migrations.AlterField(
+            model_name='dumptaskoperation',
+            name='upload_state',
+            field=models.JSONField(blank=True, default=None, help_text='Resumable upload: multipart upload id, part size and ETags of uploaded parts; native ClickHouse backup: id of the running BACKUP', null=True, verbose_name='Upload state'),
+        ),
+    ]
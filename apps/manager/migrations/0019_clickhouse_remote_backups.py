@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0018_clickhouse_native_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='remote_backup_name',
+            field=models.CharField(blank=True, default=None, help_text='clickhouse-backup create_remote: backup name in the remote storage (restore_remote)', max_length=255, null=True, verbose_name='Remote backup name'),
+        ),
+        migrations.AlterField(
+            model_name='dumptask',
+            name='clickhouse_engine',
+            field=models.IntegerField(choices=[(1, 'clickhouse-backup (local files)'), (2, 'Native BACKUP/RESTORE to S3 (server-side)'), (3, 'clickhouse-backup create_remote/restore_remote to S3')], default=1, help_text='Native: ClickHouse writes the backup to the S3 storage itself. create_remote: clickhouse-backup uploads the parts in parallel (storage transfer settings, archive mode as compression). Both need an S3 storage reachable from the ClickHouse server, data does not pass through the manager and incremental settings do not apply', verbose_name='ClickHouse backup engine'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0019_clickhouse_remote_backups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recoverbackupoperation',
+            name='partitions',
+            field=models.TextField(blank=True, default='', help_text='ClickHouse only: partition IDs of the selected tables (as in part names, e.g. 202401). Empty - all partitions', verbose_name='Partitions to restore'),
+        ),
+        migrations.AlterField(
+            model_name='recoverbackupoperation',
+            name='tables',
+            field=models.TextField(blank=True, default='', help_text='One per line or comma-separated. Per-table Postgres dumps: schema.table, the tables are truncated and reloaded, nothing else is touched. ClickHouse: database.table or database.*, only their data is read from the archive. Empty - restore the whole database', verbose_name='Tables to restore'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0020_clickhouse_selective_restore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='skip_unchanged',
+            field=models.BooleanField(default=False, help_text='Before dumping, compare a cheap change fingerprint (Postgres WAL position, ClickHouse parts and table definitions) with the last successful dump and reuse its artifact if nothing changed', verbose_name='Skip unchanged databases'),
+        ),
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='artifact_operation',
+            field=models.ForeignKey(blank=True, default=None, help_text='The database had not changed: no dump was taken, the artifact of this operation is reused', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reuses', to='manager.dumptaskoperation', verbose_name='Reused artifact of'),
+        ),
+        migrations.AddField(
+            model_name='dumptaskoperation',
+            name='change_fingerprint',
+            field=models.CharField(blank=True, default=None, help_text='State of the database and dump settings taken before the dump', max_length=64, null=True, verbose_name='Change fingerprint'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0021_change_detection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumptask',
+            name='adaptive_compression',
+            field=models.BooleanField(default=False, help_text='Pick the level from the compression and upload speed of previous dumps, so that neither CPU nor network limits the dump', verbose_name='Adaptive compression level'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='compression_codec',
+            field=models.IntegerField(choices=[(1, 'Default for the dump format'), (2, 'No compression'), (3, 'gzip'), (4, 'zstd'), (5, 'lz4')], default=1, help_text='Compression of the Postgres plain dump and the ClickHouse tar archive. Default: gzip for Postgres, the archive mode for ClickHouse. Zip archives and the directory format stay uncompressed', verbose_name='Compression codec'),
+        ),
+        migrations.AddField(
+            model_name='dumptask',
+            name='compression_level',
+            field=models.PositiveSmallIntegerField(blank=True, default=None, help_text='Empty: codec default. gzip 1-9, zstd 1-22, lz4 0-16', null=True, verbose_name='Compression level'),
+        ),
+        migrations.AlterField(
+            model_name='dumptask',
+            name='parallel_jobs',
+            field=models.PositiveIntegerField(default=1, help_text='pg_dump/pg_restore -j for the directory format, zstd compression threads', verbose_name='Parallel jobs'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0022_compression_codec'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storagechunk',
+            name='deleting_dt',
+            field=models.DateTimeField(blank=True, default=None, null=True, verbose_name='Deleting since'),
+        ),
+        migrations.AddField(
+            model_name='storagechunk',
+            name='stored',
+            # Чанки, учтённые до этой миграции, уже выгружены
+            field=models.BooleanField(default=True, verbose_name='Stored'),
+        ),
+        migrations.AlterField(
+            model_name='storagechunk',
+            name='stored',
+            field=models.BooleanField(default=False, verbose_name='Stored'),
+        ),
+    ]
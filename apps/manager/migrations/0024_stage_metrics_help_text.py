@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0023_storage_chunk_claims'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dumptaskoperation',
+            name='stage_metrics',
+            field=models.JSONField(blank=True, default=None, help_text='Wall time, bytes, throughput and CPU of each stage', null=True, verbose_name='Stage metrics'),
+        ),
+        migrations.AlterField(
+            model_name='recoverbackupoperation',
+            name='stage_metrics',
+            field=models.JSONField(blank=True, default=None, help_text='Wall time, bytes, throughput and CPU of each stage', null=True, verbose_name='Stage metrics'),
+        ),
+    ]
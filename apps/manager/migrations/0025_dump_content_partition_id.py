@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0024_stage_metrics_help_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dumpcontent',
+            name='partition_id',
+            field=models.CharField(blank=True, default='', help_text='ClickHouse only: as in part names and restore partitions, e.g. 202401', max_length=255, verbose_name='Partition ID'),
+        ),
+    ]
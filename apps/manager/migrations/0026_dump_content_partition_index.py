@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0025_dump_content_partition_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dumpcontent',
+            index=models.Index(fields=['partition_id'], name='dumpcontent_partition'),
+        ),
+    ]
@@ -4,7 +4,12 @@ from django.db import models
 from django.utils.translation import gettext as _
 from django.core.exceptions import ValidationError
 
-from manager.choices import DBType, DumpTaskPeriodsChoices, DumpOperationStatusChoices
+from manager.choices import (ClickhouseArchiveChoices,
+                             ClickhouseEngineChoices, CompressionCodecChoices,
+                             DBType,
+                             DumpOperationStatusChoices,
+                             DumpTaskPeriodsChoices, PgDumpFormatChoices,
+                             StorageFormatChoices)
 
 
 class AbstractBaseModel(models.Model):
@@ -41,6 +46,18 @@ class FileStorage(models.Model):
     secret_key = models.CharField(max_length=255, blank=True, null=True,
                                   help_text=_("S3 Secret Key ИЛИ OAuth-токен (для Yandex Disk)"))
 
+    # Параметры передачи (S3)
+    multipart_chunk_size_mb = models.PositiveIntegerField(
+        _("Multipart part size, MB"), default=64, help_text=_("S3: size of one multipart part (min 5 MB)"))
+    max_concurrency = models.PositiveIntegerField(
+        _("Parallel transfers"), default=4, help_text=_("S3: parts uploaded/downloaded at once"))
+    max_bandwidth_mb = models.PositiveIntegerField(
+        _("Bandwidth limit, MB/s"), default=0, help_text=_("0 - unlimited"))
+    resumable_uploads = models.BooleanField(
+        _("Resumable uploads"), default=False,
+        help_text=_("S3: keep the dump on local disk and persist multipart state, "
+                    "so re-executing an operation continues the upload"))
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -72,6 +89,60 @@ class FileStorage(models.Model):
                     {"secret_key": _("OAuth token is required for Yandex Disk")})
 
 
+class StorageChunk(models.Model):
+    """Индекс чанков дедуплицированного хранилища: что уже лежит в FileStorage."""
+    file_storage = models.ForeignKey(
+        "manager.FileStorage", on_delete=models.CASCADE, related_name="chunks")
+    digest = models.CharField(_("SHA-256"), max_length=64)
+    size = models.PositiveBigIntegerField(_("Size"))
+    stored_size = models.PositiveBigIntegerField(_("Stored size"))
+    refcount = models.PositiveIntegerField(_("Manifests referencing the chunk"), default=0)
+    # Объект чанка точно выгружен; пока False, выгрузка идёт или оборвалась
+    stored = models.BooleanField(_("Stored"), default=False)
+    # Чанк без ссылок захвачен очисткой: объект удаляется, новые ссылки ждут
+    deleting_dt = models.DateTimeField(_("Deleting since"), null=True, blank=True, default=None)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+    class Meta:
+        verbose_name = _("Storage chunk")
+        verbose_name_plural = _("Storage chunks")
+        constraints = [
+            models.UniqueConstraint(fields=["file_storage", "digest"], name="unique_storage_chunk"),
+        ]
+
+
+class ConnectionProbe(models.Model):
+    """История проверок подключения к базам и хранилищам (services/probes.py)."""
+    database = models.ForeignKey(
+        "manager.UserDatabase", on_delete=models.CASCADE, null=True, blank=True, related_name="probes")
+    file_storage = models.ForeignKey(
+        "manager.FileStorage", on_delete=models.CASCADE, null=True, blank=True, related_name="probes")
+    # sha256 параметров подключения: после их смены старые результаты не переиспользуются
+    fingerprint = models.CharField(max_length=64)
+    ok = models.BooleanField(_("Connected"))
+    latency_ms = models.FloatField(_("Latency, ms"), null=True, blank=True)
+    error = models.TextField(_("Error"), null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Результат взят из кэша, а не получен только что; в базе не хранится
+    cached = False
+
+    def __str__(self):
+        return f"{self.database or self.file_storage}: {'ok' if self.ok else 'fail'}"
+
+    class Meta:
+        verbose_name = _("Connection probe")
+        verbose_name_plural = _("Connection probes")
+        indexes = [
+            models.Index(fields=["database", "-created_at"], name="probe_database_created"),
+            models.Index(fields=["file_storage", "-created_at"], name="probe_storage_created"),
+            models.Index(fields=["created_at"], name="probe_created"),
+        ]
+
+
 class UserDatabase(AbstractBaseModel):
     name = models.CharField(_("Name"), max_length=100)
     db_type = models.IntegerField(_("Type"), choices=DBType.choices)
@@ -85,6 +156,14 @@ class UserDatabase(AbstractBaseModel):
         verbose_name_plural = _('Databases')
 
 
+# Допустимые уровни сжатия кодеков задачи
+COMPRESSION_LEVELS = {
+    CompressionCodecChoices.GZIP: range(1, 10),
+    CompressionCodecChoices.ZSTD: range(1, 23),
+    CompressionCodecChoices.LZ4: range(0, 17),
+}
+
+
 class DumpTask(AbstractBaseModel):
     # Relations
     database = models.ForeignKey(
@@ -97,10 +176,78 @@ class DumpTask(AbstractBaseModel):
         _("Task Period"), choices=DumpTaskPeriodsChoices.choices)
     max_dumpfiles_keep = models.PositiveIntegerField(
         _("Max Dump files count to keep"), default=1)
+    # Grandfather-father-son: дополнительно к max_dumpfiles_keep последних
+    keep_daily = models.PositiveIntegerField(
+        _("Keep daily dumps"), default=0, help_text=_("Newest dump of each of the last N days"))
+    keep_weekly = models.PositiveIntegerField(
+        _("Keep weekly dumps"), default=0, help_text=_("Newest dump of each of the last N weeks"))
+    keep_monthly = models.PositiveIntegerField(
+        _("Keep monthly dumps"), default=0, help_text=_("Newest dump of each of the last N months"))
+    pg_dump_format = models.IntegerField(
+        _("Postgres dump format"), choices=PgDumpFormatChoices.choices, default=PgDumpFormatChoices.PLAIN)
+    parallel_jobs = models.PositiveIntegerField(
+        _("Parallel jobs"), default=1,
+        help_text=_("pg_dump/pg_restore -j for the directory format, zstd compression threads"))
+    clickhouse_engine = models.IntegerField(
+        _("ClickHouse backup engine"), choices=ClickhouseEngineChoices.choices,
+        default=ClickhouseEngineChoices.CLICKHOUSE_BACKUP,
+        help_text=_("Native: ClickHouse writes the backup to the S3 storage itself. create_remote: "
+                    "clickhouse-backup uploads the parts in parallel (storage transfer settings, archive mode "
+                    "as compression). Both need an S3 storage reachable from the ClickHouse server, "
+                    "data does not pass through the manager and incremental settings do not apply"))
+    clickhouse_archive_mode = models.IntegerField(
+        _("ClickHouse archive mode"), choices=ClickhouseArchiveChoices.choices,
+        default=ClickhouseArchiveChoices.STORE,
+        help_text=_("ClickHouse parts are already compressed, so zip without compression is usually enough"))
+    clickhouse_incremental = models.BooleanField(
+        _("ClickHouse incremental backups"), default=False,
+        help_text=_("Upload only parts that are missing in the previous successful backup"))
+    clickhouse_full_every = models.PositiveIntegerField(
+        _("Full ClickHouse backup every N dumps"), default=7,
+        help_text=_("Maximum length of the base -> increment chain"))
+    storage_format = models.IntegerField(
+        _("Storage format"), choices=StorageFormatChoices.choices, default=StorageFormatChoices.SINGLE,
+        help_text=_("Deduplicated chunks: only chunks missing in the storage are uploaded"))
+    compression_codec = models.IntegerField(
+        _("Compression codec"), choices=CompressionCodecChoices.choices, default=CompressionCodecChoices.DEFAULT,
+        help_text=_("Compression of the Postgres plain dump and the ClickHouse tar archive. Default: gzip for "
+                    "Postgres, the archive mode for ClickHouse. Zip archives and the directory format stay "
+                    "uncompressed"))
+    compression_level = models.PositiveSmallIntegerField(
+        _("Compression level"), null=True, blank=True, default=None,
+        help_text=_("Empty: codec default. gzip 1-9, zstd 1-22, lz4 0-16"))
+    adaptive_compression = models.BooleanField(
+        _("Adaptive compression level"), default=False,
+        help_text=_("Pick the level from the compression and upload speed of previous dumps, so that "
+                    "neither CPU nor network limits the dump"))
+    skip_unchanged = models.BooleanField(
+        _("Skip unchanged databases"), default=False,
+        help_text=_("Before dumping, compare a cheap change fingerprint (Postgres WAL position, ClickHouse "
+                    "parts and table definitions) with the last successful dump and reuse its artifact "
+                    "if nothing changed"))
+
+    # Сводка по последним дампам: обновляется BackupService, чтобы списки не агрегировали операции
+    last_success_dt = models.DateTimeField(_("Last success"), null=True, blank=True, default=None, editable=False)
+    last_failure_dt = models.DateTimeField(_("Last failure"), null=True, blank=True, default=None, editable=False)
+    last_dump_size = models.BigIntegerField(
+        _("Last dump size, bytes"), null=True, blank=True, default=None, editable=False)
+    last_duration_seconds = models.FloatField(
+        _("Last dump duration, s"), null=True, blank=True, default=None, editable=False)
 
     def __str__(self):
         return str(self.id)
 
+    def clean(self):
+        levels = COMPRESSION_LEVELS.get(self.compression_codec)
+        if self.compression_level is not None and levels and self.compression_level not in levels:
+            raise ValidationError({"compression_level": _("Level must be between %(min)s and %(max)s") % {
+                "min": levels.start, "max": levels.stop - 1}})
+        if self.clickhouse_engine == ClickhouseEngineChoices.CLICKHOUSE_BACKUP \
+                or not self.database_id or not self.file_storage_id:
+            return
+        if self.database.db_type == DBType.CLICKHOUSE and self.file_storage.type != FileStorage.TYPE_S3:
+            raise ValidationError({"clickhouse_engine": _("This ClickHouse engine needs an S3 storage")})
+
     class Meta:
         verbose_name = _('Dump Task')
         verbose_name_plural = _('Dump Tasks')
@@ -117,13 +264,94 @@ class DumpTaskOperation(AbstractBaseModel):
         _("Error text"), blank=True, default=None, null=True)
     dump_path = models.CharField(
         _("Dump File Path"), max_length=250, null=True, blank=True, default=None)
+    base_operation = models.ForeignKey(
+        "self", verbose_name=_("Base operation"), on_delete=models.RESTRICT,
+        null=True, blank=True, default=None, related_name="increments",
+        help_text=_("Incremental dump: operation whose artifact holds the unchanged data"))
+    parts_manifest = models.JSONField(
+        _("Parts manifest"), null=True, blank=True, default=None,
+        help_text=_("ClickHouse: all parts of this backup (db/table/disk/part)"))
+    dump_size = models.BigIntegerField(
+        _("Dump size, bytes"), null=True, blank=True, default=None,
+        help_text=_("Size of the artifact as it is read on restore"))
+    dump_sha256 = models.CharField(
+        _("Dump SHA-256"), max_length=64, null=True, blank=True, default=None)
+    local_dump_path = models.CharField(
+        _("Local dump file"), max_length=250, null=True, blank=True, default=None,
+        help_text=_("Resumable upload: dump file kept until the upload is completed"))
+    upload_state = models.JSONField(
+        _("Upload state"), null=True, blank=True, default=None,
+        help_text=_("Resumable upload: multipart upload id, part size and ETags of uploaded parts; "
+                    "native ClickHouse backup: id of the running BACKUP"))
+    stage_metrics = models.JSONField(
+        _("Stage metrics"), null=True, blank=True, default=None,
+        help_text=_("Wall time, bytes, throughput and CPU of each stage"))
+    change_fingerprint = models.CharField(
+        _("Change fingerprint"), max_length=64, null=True, blank=True, default=None,
+        help_text=_("State of the database and dump settings taken before the dump"))
+    artifact_operation = models.ForeignKey(
+        "self", verbose_name=_("Reused artifact of"), on_delete=models.SET_NULL,
+        null=True, blank=True, default=None, related_name="reuses",
+        help_text=_("The database had not changed: no dump was taken, the artifact of this operation is reused"))
+    remote_backup_name = models.CharField(
+        _("Remote backup name"), max_length=255, null=True, blank=True, default=None,
+        help_text=_("clickhouse-backup create_remote: backup name in the remote storage (restore_remote)"))
+    table_catalog = models.JSONField(
+        _("Table catalog"), null=True, blank=True, default=None,
+        help_text=_("Per-table Postgres dump: tables, row estimates, sizes and object keys"))
 
     def __str__(self):
         return str(self.id)
 
+    def get_chain(self):
+        """Цепочка base -> ... -> self, начиная с полного бэкапа."""
+        chain = [self]
+        while chain[0].base_operation_id:
+            chain.insert(0, chain[0].base_operation)
+        return chain
+
     class Meta:
         verbose_name = _('Dump Task Operation')
         verbose_name_plural = _('Dump Tasks Operations')
+        indexes = [
+            # Очистка, история задачи, поиск базы инкремента, метрики
+            models.Index(fields=["task", "status", "-created_dt"], name="dumpop_task_status_created"),
+            # Очередь воркера
+            models.Index(fields=["status", "created_dt"], name="dumpop_status_created"),
+            # Список в админке
+            models.Index(fields=["-created_dt"], name="dumpop_created"),
+        ]
+
+
+class DumpContent(models.Model):
+    """
+    Что лежит в дампе, строкой на таблицу (Postgres) или партицию таблицы
+    (ClickHouse). Снимается при дампе, чтобы искать нужный бэкап без скачивания.
+    """
+    operation = models.ForeignKey(
+        "manager.DumpTaskOperation", on_delete=models.CASCADE, related_name="contents")
+    schema = models.CharField(_("Schema / database"), max_length=255)
+    table = models.CharField(_("Table"), max_length=255)
+    partition = models.CharField(_("Partition"), max_length=255, blank=True, default="")
+    partition_id = models.CharField(
+        _("Partition ID"), max_length=255, blank=True, default="",
+        help_text=_("ClickHouse only: as in part names and restore partitions, e.g. 202401"))
+    rows = models.BigIntegerField(_("Rows"), null=True, blank=True, help_text=_("Postgres: planner estimate"))
+    size = models.BigIntegerField(_("Size, bytes"), null=True, blank=True)
+    parts = models.PositiveIntegerField(_("Parts"), null=True, blank=True, help_text=_("ClickHouse only"))
+
+    def __str__(self):
+        name = f"{self.schema}.{self.table}"
+        return f"{name} [{self.partition}]" if self.partition else name
+
+    class Meta:
+        verbose_name = _("Dump content")
+        verbose_name_plural = _("Dump contents")
+        indexes = [
+            models.Index(fields=["table", "schema"], name="dumpcontent_table"),
+            models.Index(fields=["schema", "table"], name="dumpcontent_schema_table"),
+            models.Index(fields=["partition_id"], name="dumpcontent_partition"),
+        ]
 
 
 class RecoverBackupOperation(AbstractBaseModel):
@@ -136,10 +364,92 @@ class RecoverBackupOperation(AbstractBaseModel):
         _("Status"), choices=DumpOperationStatusChoices.choices, default=DumpOperationStatusChoices.CREATED)
     error_text = models.TextField(
         _("Error text"), blank=True, default=None, null=True)
+    stage_metrics = models.JSONField(
+        _("Stage metrics"), null=True, blank=True, default=None,
+        help_text=_("Wall time, bytes, throughput and CPU of each stage"))
+    tables = models.TextField(
+        _("Tables to restore"), blank=True, default="",
+        help_text=_("One per line or comma-separated. Per-table Postgres dumps: schema.table, the tables are "
+                    "truncated and reloaded, nothing else is touched. ClickHouse: database.table or database.*, "
+                    "only their data is read from the archive. Empty - restore the whole database"))
+    partitions = models.TextField(
+        _("Partitions to restore"), blank=True, default="",
+        help_text=_("ClickHouse only: partition IDs of the selected tables (as in part names, e.g. 202401). "
+                    "Empty - all partitions"))
 
     def __str__(self):
         return str(self.id)
 
+    @staticmethod
+    def _split_names(value):
+        names = [name.strip() for name in value.replace(",", "\n").splitlines()]
+        return list(dict.fromkeys(name for name in names if name)) or None
+
+    @property
+    def table_list(self):
+        """Выбранные таблицы или None — восстановление целиком."""
+        return self._split_names(self.tables)
+
+    @property
+    def partition_list(self):
+        return self._split_names(self.partitions)
+
+    def clean(self):
+        if not self.dump_operation_id:
+            return
+        if self.partition_list and not self.table_list:
+            raise ValidationError({"partitions": _("Select the tables whose partitions to restore")})
+        if not self.table_list:
+            return
+        dump_operation = self.dump_operation
+        if dump_operation.task.database.db_type == DBType.CLICKHOUSE:
+            self._clean_clickhouse_tables(dump_operation)
+            return
+        if self.partition_list:
+            raise ValidationError({"partitions": _("Partitions can be selected for ClickHouse dumps only")})
+        catalog = dump_operation.table_catalog
+        if not catalog:
+            raise ValidationError({"tables": _("Selective restore needs a per-table dump")})
+        known = {f"{entry['schema']}.{entry['name']}" for entry in catalog["tables"]}
+        missing = [name for name in self.table_list if name not in known]
+        if missing:
+            raise ValidationError({"tables": _("Not in the dump: %s") % ", ".join(missing)})
+
+    def _clean_clickhouse_tables(self, dump_operation):
+        from manager.services.databases import get_db_interface
+
+        if not get_db_interface(dump_operation.task, dump_operation.dump_path).supports_selective_restore:
+            raise ValidationError({"tables": _("Selective restore is not supported by this ClickHouse engine")})
+        invalid = [name for name in self.table_list if "." not in name]
+        if invalid:
+            raise ValidationError({"tables": _("Expected database.table: %s") % ", ".join(invalid)})
+        # Проверяем по каталогу содержимого, если он снят
+        contents = set(dump_operation.contents.values_list("schema", "table", "partition_id"))
+        if not contents:
+            return
+        missing = [
+            name for name in self.table_list
+            if not any(name in (f"{schema}.{table}", f"{schema}.*") for schema, table, partition_id in contents)
+        ]
+        if missing:
+            raise ValidationError({"tables": _("Not in the dump: %s") % ", ".join(missing)})
+        # В каталогах старых дампов id партиций нет — их не проверить
+        if not self.partition_list or not all(partition_id for schema, table, partition_id in contents):
+            return
+        known = {
+            partition_id for schema, table, partition_id in contents
+            if any(name in (f"{schema}.{table}", f"{schema}.*") for name in self.table_list)
+        }
+        missing = [partition_id for partition_id in self.partition_list if partition_id not in known]
+        if missing:
+            raise ValidationError({"partitions": _("No such partition IDs in the selected tables: %s")
+                                   % ", ".join(missing)})
+
     class Meta:
         verbose_name = _('Recover Backup Operation')
         verbose_name_plural = _('Recover Backup Operations')
+        indexes = [
+            models.Index(fields=["dump_operation", "status", "-created_dt"], name="restoreop_dump_status_created"),
+            models.Index(fields=["status", "created_dt"], name="restoreop_status_created"),
+            models.Index(fields=["-created_dt"], name="restoreop_created"),
+        ]
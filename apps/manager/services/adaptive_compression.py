@@ -0,0 +1,72 @@
+import copy
+
+from manager.choices import DumpOperationStatusChoices
+from manager.models import DumpTaskOperation
+
+# Ступени уровней: за один дамп уровень сдвигается не больше чем на одну
+LEVEL_STEPS = {
+    "gzip": [1, 3, 6, 9],
+    "zstd": [1, 3, 6, 9, 12, 15, 19],
+    "lz4": [0, 3, 6, 9, 12],
+}
+# Сжатие быстрее выгрузки больше чем в HEADROOM раз — CPU простаивает, можно жать сильнее
+HEADROOM = 2.0
+# Сколько последних дампов задачи просматривается в поисках замера тем же кодеком
+HISTORY = 10
+MB = 1024 * 1024
+
+
+def compression_sample(stage_metrics):
+    """
+    Замер сжатия из этапов дампа -> (этап со сжатием, время выгрузки, сек.) или None.
+    В конвейере (dump_upload) выгрузка — время вне read() сжатого потока:
+    потребитель ждёт сеть; при дампе во временный файл — отдельный этап upload.
+    """
+    compressed = next((record for record in stage_metrics if "compress_seconds" in record), None)
+    if not compressed:
+        return None
+    upload = next((record for record in stage_metrics if record["stage"] == "upload"), None)
+    if upload:
+        return compressed, upload["wall_seconds"]
+    return compressed, compressed["wall_seconds"] - compressed["read_seconds"]
+
+
+def _step(levels, level, direction):
+    index = min(range(len(levels)), key=lambda i: abs(levels[i] - level))
+    return levels[max(0, min(len(levels) - 1, index + direction))]
+
+
+def adaptive_codec(operation, codec):
+    """
+    Уровень сжатия по прошлому дампу задачи тем же кодеком. Скорости сравниваются
+    в несжатых байтах в секунду: сжатие медленнее выгрузки — уровень ниже
+    (упирались в CPU), быстрее с запасом HEADROOM — выше (упирались в сеть,
+    лучше выгрузить меньше байт). Без замеров остаётся уровень задачи. -> кодек
+    """
+    levels = LEVEL_STEPS.get(codec.name)
+    if not levels:
+        return codec
+    previous_operations = DumpTaskOperation.objects.filter(
+        task_id=operation.task_id, status=DumpOperationStatusChoices.SUCCESS, stage_metrics__isnull=False,
+    ).exclude(id=operation.id).order_by("-created_dt").only("stage_metrics")[:HISTORY]
+    for previous in previous_operations:
+        sample = compression_sample(previous.stage_metrics)
+        if sample and sample[0].get("codec") == codec.name:
+            break
+    else:
+        return codec
+
+    record, upload_seconds = sample
+    compress_rate = record["raw_bytes"] / max(record["compress_seconds"], 0.001)
+    upload_rate = record["raw_bytes"] / max(upload_seconds, 0.001)
+    if compress_rate < upload_rate:
+        level = _step(levels, record["level"], -1)
+    elif compress_rate > upload_rate * HEADROOM:
+        level = _step(levels, record["level"], 1)
+    else:
+        level = record["level"]
+    print(f"Adaptive compression: {codec.name} level {record['level']} -> {level}, "
+          f"compression {compress_rate / MB:.1f} MB/s, upload {upload_rate / MB:.1f} MB/s (uncompressed)")
+    codec = copy.copy(codec)
+    codec.level = level
+    return codec
@@ -1,26 +1,373 @@
-from manager.choices import DumpOperationStatusChoices
-from manager.models import (DumpTaskOperation, FileStorage,
-                            RecoverBackupOperation)
-from manager.services.databases import DB_INTERFACE
+import os
+import shutil
+
+from django.conf import settings
+from django.db.models import Q
+
+from manager.choices import DumpOperationStatusChoices, StorageFormatChoices
+from manager.models import (DumpContent, DumpTask, DumpTaskOperation,
+                            FileStorage, RecoverBackupOperation)
+from manager.services.adaptive_compression import adaptive_codec
+from manager.services.change_detection import (change_fingerprint,
+                                               find_unchanged, reuse_artifact)
+from manager.services.chunk_store import ChunkStore
+from manager.services.claims import heartbeat
+from manager.services.databases import get_db_interface
+from manager.services.metrics import StageTimer
+from manager.services.preflight import estimate_dump, source_bytes
+from manager.services.probes import probe_database
+from manager.services.retention import discard_upload
+from manager.services.spool import GB, check_space, spool_path
 from manager.services.storage_factory import get_storage_service
+from manager.services.streams import (CHUNK_SIZE, CompressingReader,
+                                      HashingReader)
+from manager.services.table_store import TableStore
 
 
 class BackupService:
 
     def __init__(self, operation_id):
         self.operation_id = operation_id
+        # Размер и sha256 выгруженного артефакта; заполняют _upload_* по ходу выгрузки
+        self.checksum = {}
+        self.timer = StageTimer()
+        # Потоки артефактов, прочитанные при восстановлении (для подсчёта байт)
+        self._readers = []
+        # Zip, из которого выборочно читаются отдельные файлы (RangeReader с seek)
+        self._ranged_readers = []
+
+    def _record_checksum(self, reader):
+        self.checksum = {"dump_size": reader.size, "dump_sha256": reader.sha256}
+
+    def _record_file_checksum(self, filepath):
+        # Файл пишет сам клиент БД, так что контрольная сумма — отдельным чтением
+        with open(filepath, "rb") as fileobj:
+            reader = HashingReader(fileobj)
+            while reader.read(CHUNK_SIZE):
+                pass
+        self._record_checksum(reader)
 
     def _set_error4operation(self, operation, error):
         print(error)
         operation.status = DumpOperationStatusChoices.FAIL
         operation.error_text = error
+        operation.stage_metrics = self.timer.stages or None
         operation.save()
+        if isinstance(operation, DumpTaskOperation):
+            self._update_task_summary(operation)
+
+    def _update_task_summary(self, operation):
+        """Сводка последнего дампа на задаче; перевыполнение старой операции её не откатывает."""
+        if operation.status == DumpOperationStatusChoices.SUCCESS:
+            field = "last_success_dt"
+            values = {
+                "last_dump_size": operation.dump_size,
+                "last_duration_seconds": round(sum(record["wall_seconds"] for record in self.timer.stages), 3),
+            }
+        else:
+            field = "last_failure_dt"
+            values = {}
+        DumpTask.objects.filter(
+            Q(**{f"{field}__isnull": True}) | Q(**{f"{field}__lte": operation.created_dt}),
+            id=operation.task_id,
+        ).update(**{field: operation.created_dt}, **values)
+
+    def _upload_spooled(self, db_interface, storage_service, db, operation):
+        """Старый путь: дамп (сжатый тем же кодеком, что и поток) во временный файл, затем выгрузка файла."""
+        filepath, error = self._spool_dump(db_interface, db, operation)
+        if error:
+            return None, error
+        with self.timer.stage("upload") as record:
+            record["bytes"] = self.checksum["dump_size"]
+            try:
+                return storage_service.upload_dump(filepath, operation.id)
+            finally:
+                os.remove(filepath)
+
+    @staticmethod
+    def _open_compressed_stream(db_interface, db, operation):
+        """-> (поток дампа, поток для выгрузки (сжатый), расширение, error)"""
+        dump_reader, error = db_interface.open_dump_stream(db.connection_string, operation.id)
+        if error:
+            return None, None, None, error
+        reader = dump_reader
+        extension = db_interface.stream_extension
+        codec = db_interface.stream_codec
+        if codec and operation.task.adaptive_compression:
+            codec = adaptive_codec(operation, codec)
+        if codec:
+            reader = CompressingReader(dump_reader, codec)
+            extension = f"{extension}.{codec.extension}"
+        return dump_reader, reader, extension, None
+
+    @staticmethod
+    def _record_compression(record, reader):
+        """Замер сжатия на этапе: по нему adaptive_codec выбирает уровень следующего дампа."""
+        if isinstance(reader, CompressingReader):
+            record.update({
+                "codec": reader.codec.name,
+                "level": reader.codec.level,
+                "raw_bytes": reader.raw_bytes,
+                "compress_seconds": round(reader.compress_seconds, 3),
+                "read_seconds": round(reader.read_seconds, 3),
+            })
+
+    def _upload_streaming(self, db_interface, storage_service, db, operation):
+        """Поток дампа -> (сжатие) -> multipart upload, без файла в /tmp."""
+        dump_reader, compressed, extension, error = self._open_compressed_stream(db_interface, db, operation)
+        if error:
+            return None, error
+        reader = HashingReader(compressed)
+        # Дамп, сжатие и выгрузка идут конвейером, поэтому это один этап
+        with self.timer.stage("dump_upload") as record:
+            remote_path, error = storage_service.upload_stream(reader, operation.id, extension)
+            self._record_checksum(reader)
+            dump_error = dump_reader.close()
+            record["bytes"] = reader.size
+            self._record_compression(record, compressed)
+        if dump_error and remote_path:
+            # Дамп оборвался, а выгрузка успела завершиться — такой файл не годится
+            storage_service.delete_dump(remote_path)
+        # Выгрузка упала первой — дамп прерван из-за неё, причина в error
+        return remote_path, error or dump_error
+
+    def _spool_dump(self, db_interface, db, operation):
+        """Дамп (сжатый, если база умеет стримить) во временный файл. -> (filepath, error)"""
+        if not hasattr(db_interface, "open_dump_stream"):
+            with self.timer.stage("dump") as record:
+                filepath, error = db_interface.dump_database(db.connection_string, operation.id)
+                if error:
+                    return None, error
+                self._record_file_checksum(filepath)
+                record["bytes"] = self.checksum["dump_size"]
+            return filepath, None
+        dump_reader, compressed, extension, error = self._open_compressed_stream(db_interface, db, operation)
+        if error:
+            return None, error
+        reader = HashingReader(compressed)
+        filepath = spool_path(f"dump_{operation.id}.{extension}")
+        with self.timer.stage("dump") as record:
+            try:
+                with open(filepath, "wb") as fileobj:
+                    shutil.copyfileobj(reader, fileobj, CHUNK_SIZE)
+            except Exception as e:
+                error = f"Error saving dump: {e}"
+            dump_error = dump_reader.close()
+            record["bytes"] = reader.size
+            self._record_compression(record, compressed)
+        if dump_error or error:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return None, error or dump_error
+        self._record_checksum(reader)
+        return filepath, None
+
+    def _upload_resumable(self, db_interface, storage_service, db, operation):
+        """
+        Дамп в локальный файл, затем multipart-выгрузка с сохранением состояния
+        в операции. Если прошлая попытка оборвалась, файл и upload_id остались —
+        повтор не делает дамп заново и докачивает только недостающие части.
+        """
+        filepath = operation.local_dump_path
+        if operation.upload_state and filepath and os.path.exists(filepath):
+            print(f"Resuming upload of {filepath}")
+        else:
+            if operation.upload_state:
+                storage_service.abort_upload(operation.upload_state)
+            filepath, error = self._spool_dump(db_interface, db, operation)
+            if error:
+                return None, error
+            operation.local_dump_path = filepath
+            operation.upload_state = None
+            # Сведения о дампе нужны и при докачке, когда дамп уже не повторяется
+            for field, value in {**getattr(db_interface, "dump_metadata", {}), **self.checksum}.items():
+                setattr(operation, field, value)
+            operation.save()
+
+        def save_state(state):
+            operation.upload_state = state
+            operation.save(update_fields=["upload_state", "updated_dt"])
+
+        with self.timer.stage("upload") as record:
+            remote_path, error = storage_service.upload_resumable(
+                filepath, operation.id, operation.upload_state or {}, save_state)
+            record["bytes"] = os.path.getsize(filepath)
+        if error:
+            return None, error
+        os.remove(filepath)
+        operation.local_dump_path = None
+        operation.upload_state = None
+        return remote_path, None
+
+    def _upload_chunked(self, db_interface, storage_service, db, operation):
+        """Поток дампа -> чанки -> выгрузка только новых чанков + манифест."""
+        chunk_store = ChunkStore(storage_service, operation.task.file_storage)
+        if ChunkStore.is_manifest(operation.dump_path):
+            # Перевыполнение: старый манифест заменяется, его ссылки снимаем
+            chunk_store.delete(operation.dump_path)
+        dump_reader, error = db_interface.open_dump_stream(db.connection_string, operation.id)
+        if error:
+            return None, error
+        # Чанки сжимаются по отдельности, общий поток не сжимаем — иначе нет дедупликации
+        reader = HashingReader(dump_reader)
+        with self.timer.stage("dump_upload") as record:
+            remote_path, error = chunk_store.upload(reader, operation.id, db_interface.stream_extension)
+            self._record_checksum(reader)
+            dump_error = dump_reader.close()
+            record["bytes"] = reader.size
+        if dump_error and remote_path:
+            chunk_store.delete(remote_path)
+        return remote_path, error or dump_error
+
+    def _upload_tables(self, db_interface, storage_service, db, operation):
+        """Postgres объектом на таблицу + каталог для выборочного восстановления."""
+        table_store = TableStore(storage_service, db_interface.jobs, db_interface.stream_codec)
+        if TableStore.is_catalog(operation.dump_path):
+            # Перевыполнение: объекты прошлой попытки заменяются
+            table_store.delete(operation.dump_path)
+        with self.timer.stage("dump_upload") as record:
+            remote_path, catalog, error = table_store.upload(db_interface, db.connection_string, operation.id)
+            if error:
+                return None, error
+            record["bytes"] = TableStore.catalog_size(catalog)
+        operation.table_catalog = catalog
+        # Сумма — по каталогу, у каждого объекта своя
+        self.checksum = {"dump_size": record["bytes"], "dump_sha256": None}
+        return remote_path, None
+
+    def _describe_contents(self, db_interface, db, operation):
+        """
+        Каталог содержимого дампа для поиска в админке: таблицы, строки, размеры
+        (у ClickHouse — по партициям). Без него дамп не проваливается. -> [dict] или None
+        """
+        with self.timer.stage("contents") as record:
+            if operation.table_catalog:
+                # Дамп по таблицам: каталог снят из того же снимка, что и данные
+                contents = [
+                    {"schema": table["schema"], "table": table["name"], "rows": table["rows"], "size": table["size"]}
+                    for table in operation.table_catalog["tables"]
+                ]
+            else:
+                contents, error = db_interface.describe_contents(db.connection_string)
+                if error:
+                    print(f"Could not describe dump contents: {error}")
+                    return None
+            record["objects"] = len(contents)
+        return contents
+
+    @staticmethod
+    def _save_contents(operation, contents):
+        DumpContent.objects.filter(operation=operation).delete()
+        DumpContent.objects.bulk_create(
+            [DumpContent(operation=operation, **item) for item in contents], batch_size=1000)
+
+    def _upload_server_side(self, db_interface, storage_service, db, operation):
+        """Нативный BACKUP или create_remote ClickHouse: бэкап в S3 пишет сама база, менеджер только ждёт."""
+        if operation.task.file_storage.type != FileStorage.TYPE_S3:
+            return None, "This ClickHouse engine needs an S3 storage"
+        remote_path = db_interface.remote_path(operation.id)
+
+        def save_state(state):
+            operation.upload_state = state
+            operation.save(update_fields=["upload_state", "updated_dt"])
+
+        with self.timer.stage("dump_upload") as record:
+            dump_size, error = db_interface.backup_to_storage(
+                db.connection_string, storage_service, remote_path, operation.upload_state, save_state)
+            if error:
+                return None, error
+            record["bytes"] = dump_size
+        operation.upload_state = None
+        # Бэкап — много объектов, общей суммы у него нет
+        self.checksum = {"dump_size": dump_size, "dump_sha256": None}
+        return remote_path, None
+
+    @staticmethod
+    def _dump_space(db_interface, mode, estimate):
+        """Место, нужное способу выгрузки: [{каталог: байт}, ...]"""
+        if mode == "spooled" or not hasattr(db_interface, "open_dump_stream"):
+            return [db_interface.dump_space(estimate, streaming=False)]
+        requirements = [db_interface.dump_space(estimate, streaming=True)]
+        if mode == "resumable":
+            requirements.append({settings.SPOOL_DIR: estimate["compressed"]})
+        return requirements
+
+    def _plan_dump(self, db_interface, storage_service, db, operation):
+        """
+        Pre-flight: оценка размера дампа и выбор способа выгрузки, под который
+        хватает места. Предпочтительный способ первый, дальше — запасные.
+        -> (mode, error)
+        """
+        task = operation.task
+        can_stream = hasattr(db_interface, "open_dump_stream")
+        if getattr(db_interface, "server_side", False):
+            modes = ["server_side"]
+        elif getattr(db_interface, "is_per_table_format", False):
+            modes = ["tables"]
+        elif can_stream and task.storage_format == StorageFormatChoices.CHUNKED:
+            modes = ["chunked"]
+        else:
+            modes = []
+            if task.file_storage.resumable_uploads and hasattr(storage_service, "upload_resumable"):
+                modes.append("resumable")
+            if can_stream and storage_service.supports_streaming:
+                modes.append("streaming")
+            modes.append("spooled")
+        if modes[0] == "resumable" and operation.upload_state and operation.local_dump_path \
+                and os.path.exists(operation.local_dump_path):
+            # Докачка: дамп уже на диске
+            return "resumable", None
+
+        errors = []
+        with self.timer.stage("preflight") as record:
+            estimate = estimate_dump(task, db_interface, db.connection_string, operation.id)
+            if estimate is None:
+                record["mode"] = modes[0]
+                return modes[0], None
+            record["source_bytes"] = estimate["source_bytes"]
+            record["estimate_bytes"] = estimate["compressed"]
+            for mode in modes:
+                error = check_space(*self._dump_space(db_interface, mode, estimate))
+                if not error:
+                    record["mode"] = mode
+                    if mode != modes[0]:
+                        print(f"Not enough space for {modes[0]} upload, falling back to {mode}")
+                    return mode, None
+                errors.append(f"{mode}: {error}")
+        return None, (f"Pre-flight check failed, estimated dump size {estimate['compressed'] / GB:.1f} GB. "
+                      + "; ".join(errors))
+
+    def _reuse_dump(self, operation, previous):
+        """База не менялась с прошлого дампа: операция ссылается на его артефакт."""
+        print(f"No changes since {previous.id}, reusing {previous.dump_path}")
+        reuse_artifact(operation, previous)
+        operation.status = DumpOperationStatusChoices.SUCCESS
+        operation.error_text = None
+        operation.upload_state = None
+        operation.stage_metrics = self.timer.stages
+        operation.save()
+        self._update_task_summary(operation)
+        return True, None
 
     def make_dump(self):
+        with heartbeat(DumpTaskOperation, self.operation_id):
+            return self._make_dump()
+
+    def _make_dump(self):
         operation = DumpTaskOperation.objects.filter(id=self.operation_id).first()
         if not operation:
             return False, f"Operation {self.operation_id} doesn't exist"
 
+        if operation.artifact_operation_id:
+            # Перевыполнение операции без своего артефакта: чужой не трогаем
+            operation.dump_path = None
+            operation.artifact_operation = None
+        elif operation.dump_path and DumpTaskOperation.objects.filter(
+                task_id=operation.task_id, dump_path=operation.dump_path).exclude(id=operation.id).exists():
+            # Новый дамп перезаписал бы артефакт, на который ссылаются более поздние операции;
+            # сама операция остаётся как есть (админка такие в очередь не ставит)
+            return False, "The dump is reused by later operations, create a new dump operation instead"
+
         operation.status = DumpOperationStatusChoices.IN_PROCESS
         operation.error_text = None
         operation.save()
@@ -34,62 +381,259 @@ class BackupService:
             self._set_error4operation(operation, error)
             return False, error
 
-        db_interface = DB_INTERFACE[db.db_type]()
-        is_connected = db_interface.check_connection(db.connection_string)
+        db_interface = get_db_interface(operation.task)
+        with self.timer.stage("check_connection"):
+            # Проверка, сделанная только что (действие в админке, соседняя операция), переиспользуется
+            is_connected = probe_database(db).ok
         if not is_connected:
             error = "Database connection failed"
             self._set_error4operation(operation, error)
             return False, error
 
-        filepath, error = db_interface.dump_database(db.connection_string, operation.id)
+        # Отпечаток — до дампа: изменения во время дампа увидит следующий
+        with self.timer.stage("fingerprint"):
+            operation.change_fingerprint, error = change_fingerprint(operation.task, db_interface)
         if error:
-            self._set_error4operation(operation, error)
-            return False, error
+            print(f"Change fingerprint unavailable, dumping: {error}")
+        elif operation.task.skip_unchanged:
+            previous = find_unchanged(operation, operation.change_fingerprint)
+            if previous:
+                return self._reuse_dump(operation, previous)
 
         # получаем нужный сервис (S3 или Yandex) по типу
         storage_service = get_storage_service(storage)
 
-        remote_path, error = storage_service.upload_dump(filepath, operation.id)
+        # Стримим, если это умеют и база, и хранилище; иначе через временный файл
+        mode, error = self._plan_dump(db_interface, storage_service, db, operation)
         if error:
             self._set_error4operation(operation, error)
             return False, error
+        if mode != "resumable" and (operation.upload_state or operation.local_dump_path):
+            # Прошлая попытка выгружала resumable, эта пойдёт другим способом
+            discard_upload(operation, storage_service)
+        operation.table_catalog = None
+        # Содержимое снимается перед дампом, чтобы быть ближе к его состоянию;
+        # дамп по таблицам берёт его из своего каталога после выгрузки
+        contents = self._describe_contents(db_interface, db, operation) if mode != "tables" else None
+        upload = {
+            "server_side": self._upload_server_side,
+            "tables": self._upload_tables,
+            "chunked": self._upload_chunked,
+            "resumable": self._upload_resumable,
+            "streaming": self._upload_streaming,
+            "spooled": self._upload_spooled,
+        }[mode]
+        remote_path, error = upload(db_interface, storage_service, db, operation)
+        if error:
+            self._set_error4operation(operation, error)
+            return False, error
+        if mode == "tables":
+            contents = self._describe_contents(db_interface, db, operation)
 
         print(f"File uploaded successfully to {remote_path}")
+        print(f"Stages: {self.timer.summary()}")
         operation.status = DumpOperationStatusChoices.SUCCESS
         operation.error_text = None
         operation.dump_path = remote_path
+        operation.stage_metrics = self.timer.stages
+        # Сведения о дампе от сервиса БД (манифест частей, базовая операция, ...) и контрольная сумма
+        for field, value in {**getattr(db_interface, "dump_metadata", {}), **self.checksum}.items():
+            setattr(operation, field, value)
         operation.save()
+        if contents is not None:
+            self._save_contents(operation, contents)
+        self._update_task_summary(operation)
+
+        print("Dump Success")
+        return True, None
+
+    def _restore_spooled(self, db_interface, storage_service, db, dump_path):
+        """Старый путь: скачать дамп целиком во временный файл, затем загрузить."""
+        # DOWNLOAD DUMP
+        with self.timer.stage("download") as record:
+            filepath, error = storage_service.download_dump(dump_path)
+            if error:
+                return False, error
+            record["bytes"] = os.path.getsize(filepath)
+
+        # RESTORE DUMP
+        with self.timer.stage("load") as record:
+            record["bytes"] = os.path.getsize(filepath)
+            try:
+                return db_interface.load_dump(
+                    filepath=filepath,
+                    connection_string=db.connection_string
+                )
+            finally:
+                os.remove(filepath)
+
+    @staticmethod
+    def _spool(reader, artifact_path):
+        """Поток -> временный файл, для форматов, которые читаются только с диска."""
+        filepath = spool_path(os.path.basename(artifact_path))
+        try:
+            with open(filepath, "wb") as fileobj:
+                shutil.copyfileobj(reader, fileobj, CHUNK_SIZE)
+        except Exception as e:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return None, f"Error saving dump: {e}"
+        finally:
+            reader.close()
+        return filepath, None
+
+    def _open_artifact(self, storage_service, file_storage, dump_operation):
+        """
+        Поток артефакта операции (из чанков или ranged GET) со сверкой размера
+        и sha256 на лету. -> (reader, artifact_path, error); artifact_path
+        определяет формат содержимого.
+        """
+        dump_path = dump_operation.dump_path
+        if ChunkStore.is_manifest(dump_path):
+            reader, error = ChunkStore(storage_service, file_storage).open(dump_path)
+            artifact_path = ChunkStore.artifact_path(dump_path)
+        else:
+            reader, error = storage_service.open_stream(dump_path)
+            artifact_path = dump_path
+        if error:
+            return None, None, error
+        stored_size = getattr(reader, "size", None)
+        if dump_operation.dump_sha256 and stored_size is not None and stored_size != dump_operation.dump_size:
+            # Обрезанный объект видно по размеру ещё до чтения
+            reader.close()
+            return None, None, f"Dump size mismatch: stored {stored_size} bytes, expected {dump_operation.dump_size}"
+        # Без сохранённой суммы (дамп старше проверки) только считаем байты
+        expected_size = dump_operation.dump_size if dump_operation.dump_sha256 else None
+        reader = HashingReader(reader, expected_size, dump_operation.dump_sha256)
+        self._readers.append(reader)
+        return reader, artifact_path, None
+
+    @property
+    def _bytes_read(self):
+        return (sum(reader.size for reader in self._readers)
+                + sum(reader.fetched for reader in self._ranged_readers))
 
-        # max_files_keep (чуть поправил off-by-one: держим ровно max_files_cnt последних)
-        previous_dump_operations = DumpTaskOperation.objects.filter(
-            task=operation.task,
-            status=DumpOperationStatusChoices.SUCCESS,
-        ).order_by("-created_dt")
-
-        max_files_cnt = operation.task.max_dumpfiles_keep or 0
-        files2delete = []
-        operations2delete = []
-
-        for idx, dump_operation in enumerate(previous_dump_operations):
-            if idx < max_files_cnt:
-                continue
-            files2delete.append(dump_operation.dump_path)
-            operations2delete.append(dump_operation.id)
-
-        # delete files
-        if files2delete:
-            for file_backup_path in files2delete:
+    def _restore_artifact(self, db_interface, storage_service, file_storage, db, dump_operation):
+        """Поток артефакта -> клиент БД; форматы, которым нужен файл, — через временный файл."""
+        reader, artifact_path, error = self._open_artifact(storage_service, file_storage, dump_operation)
+        if error:
+            return False, error
+        if hasattr(db_interface, "load_stream") and db_interface.supports_stream_restore(artifact_path):
+            # Скачивание, распаковка и загрузка идут конвейером, поэтому это один этап
+            with self.timer.stage("download_load") as record:
                 try:
-                    storage_service.delete_dump(file_backup_path)
-                except Exception:
-                    pass
-        if operations2delete:
-            DumpTaskOperation.objects.filter(id__in=operations2delete).delete()
+                    return db_interface.load_stream(db.connection_string, artifact_path, reader)
+                finally:
+                    reader.close()
+                    record["bytes"] = reader.size
+        with self.timer.stage("download") as record:
+            filepath, error = self._spool(reader, artifact_path)
+            record["bytes"] = reader.size
+        if error:
+            return False, error
+        with self.timer.stage("load") as record:
+            record["bytes"] = reader.size
+            try:
+                return db_interface.load_dump(filepath=filepath, connection_string=db.connection_string)
+            finally:
+                os.remove(filepath)
 
-        print("Dump Success")
+    def _restore_chain(self, db_interface, storage_service, file_storage, db, chain, tables=None, partitions=None):
+        """
+        Инкрементальный дамп: артефакты всей цепочки base -> increment.
+        Выборочное восстановление ClickHouse идёт тем же путём: из zip по
+        центральному каталогу скачиваются только файлы выбранных таблиц.
+        """
+        operations = {operation.dump_path: operation for operation in chain}
+
+        def open_artifact(dump_path):
+            if tables and hasattr(storage_service, "open_stream") and not ChunkStore.is_manifest(dump_path) \
+                    and not db_interface.supports_stream_restore(dump_path):
+                # Архив читается не целиком, так что sha256 не сверить
+                reader, error = storage_service.open_stream(dump_path)
+                if error:
+                    return None, None, error
+                self._ranged_readers.append(reader)
+                return reader, dump_path, None
+            reader, artifact_path, error = self._open_artifact(
+                storage_service, file_storage, operations[dump_path])
+            if error or db_interface.supports_stream_restore(artifact_path):
+                return reader, artifact_path, error
+            filepath, error = self._spool(reader, artifact_path)
+            if error:
+                return None, None, error
+            fileobj = open(filepath, "rb")
+            # Место освободится, когда распаковка закроет файл
+            os.remove(filepath)
+            return fileobj, filepath, None
+
+        if tables:
+            print(f"Selective restore: {', '.join(tables)}" + (f" [{', '.join(partitions)}]" if partitions else ""))
+        with self.timer.stage("download_load") as record:
+            try:
+                return db_interface.load_chain(db.connection_string, chain, open_artifact, tables, partitions)
+            finally:
+                record["bytes"] = self._bytes_read
+
+    def _restore_tables(self, db_interface, storage_service, db, dump_operation, tables):
+        """Дамп по таблицам: целиком или только выбранные таблицы."""
+        table_store = TableStore(storage_service)
+
+        def open_object(entry):
+            reader, error = table_store.open_object(entry)
+            if reader:
+                self._readers.append(reader)
+            return reader, error
+
+        if tables:
+            print(f"Selective restore: {', '.join(tables)}")
+        with self.timer.stage("download_load") as record:
+            try:
+                return db_interface.load_tables(db.connection_string, dump_operation.table_catalog, open_object, tables)
+            finally:
+                record["bytes"] = self._bytes_read
+
+    def _restore_server_side(self, db_interface, storage_service, db, dump_operation, tables, partitions):
+        """Нативный RESTORE или restore_remote ClickHouse прямо из S3."""
+        # Таблицы дампа по каталогу содержимого: нативный RESTORE проверяет, не заняты ли они
+        contents = set(dump_operation.contents.values_list("schema", "table")) or None
+        with self.timer.stage("download_load") as record:
+            record["bytes"], error = db_interface.restore_from_storage(
+                db.connection_string, storage_service, dump_operation.dump_path, tables, partitions,
+                contents=contents)
+            if error:
+                return False, error
         return True, None
 
+    def _check_restore_space(self, db_interface, storage_service, dump_operation):
+        """Pre-flight восстановления: хватит ли места под скачанные и распакованные артефакты."""
+        chain = dump_operation.get_chain() if dump_operation.base_operation_id else [dump_operation]
+        requirements = []
+        with self.timer.stage("preflight") as record:
+            for operation in chain:
+                if operation.dump_size is None:
+                    # Дамп старше учёта размера — оценивать не по чему
+                    continue
+                dump_path = operation.dump_path
+                artifact_path = ChunkStore.artifact_path(dump_path) if ChunkStore.is_manifest(dump_path) else dump_path
+                # Серверные движки скачивают бэкап сами, мимо SPOOL_DIR
+                streaming = getattr(db_interface, "server_side", False) or (
+                    hasattr(storage_service, "open_stream") and db_interface.supports_stream_restore(artifact_path))
+                if not streaming:
+                    requirements.append({settings.SPOOL_DIR: operation.dump_size})
+                requirements.append(db_interface.restore_space(
+                    artifact_path, operation.dump_size, source_bytes(operation) or operation.dump_size, streaming))
+            record["estimate_bytes"] = sum(operation.dump_size or 0 for operation in chain)
+            error = check_space(*requirements)
+        if error:
+            return f"Pre-flight check failed: {error}"
+        return None
+
     def restore_dump(self):
+        with heartbeat(RecoverBackupOperation, self.operation_id):
+            return self._restore_dump()
+
+    def _restore_dump(self):
         operation = RecoverBackupOperation.objects.filter(id=self.operation_id).first()
         if not operation:
             return False, f"Operation {self.operation_id} doesn't exist"
@@ -107,31 +651,46 @@ class BackupService:
             self._set_error4operation(operation, error)
             return False, error
 
-        db_interface = DB_INTERFACE[db.db_type]()
-        is_connected = db_interface.check_connection(db.connection_string)
+        db_interface = get_db_interface(dump_operation.task, dump_operation.dump_path)
+        with self.timer.stage("check_connection"):
+            # Проверка, сделанная только что (действие в админке, соседняя операция), переиспользуется
+            is_connected = probe_database(db).ok
         if not is_connected:
             error = "Database connection failed"
             self._set_error4operation(operation, error)
             return False, error
 
         storage_service = get_storage_service(storage)
-        # DOWNLOAD DUMP
-        filepath, error = storage_service.download_dump(dump_operation.dump_path)
+        tables, partitions = operation.table_list, operation.partition_list
+        # Выборочному восстановлению нужна лишь часть артефакта: оценка по целому была бы завышена
+        error = None if tables else self._check_restore_space(db_interface, storage_service, dump_operation)
         if error:
             self._set_error4operation(operation, error)
             return False, error
-
-        # RESTORE DUMP
-        _, error = db_interface.load_dump(
-            filepath=filepath,
-            connection_string=db.connection_string
-        )
+        if TableStore.is_catalog(dump_operation.dump_path):
+            _, error = self._restore_tables(db_interface, storage_service, db, dump_operation, tables)
+        elif tables and not getattr(db_interface, "supports_selective_restore", False):
+            error = "Selective restore needs a per-table Postgres dump or a ClickHouse backup"
+        elif partitions and not tables:
+            error = "Select the tables whose partitions to restore"
+        elif getattr(db_interface, "server_side", False):
+            _, error = self._restore_server_side(
+                db_interface, storage_service, db, dump_operation, tables, partitions)
+        elif dump_operation.base_operation_id or tables:
+            chain = dump_operation.get_chain() if dump_operation.base_operation_id else [dump_operation]
+            _, error = self._restore_chain(db_interface, storage_service, storage, db, chain, tables, partitions)
+        elif hasattr(storage_service, "open_stream"):
+            _, error = self._restore_artifact(db_interface, storage_service, storage, db, dump_operation)
+        else:
+            _, error = self._restore_spooled(db_interface, storage_service, db, dump_operation.dump_path)
         if error:
             self._set_error4operation(operation, error)
             return False, error
 
         print("File restored successfully")
+        print(f"Stages: {self.timer.summary()}")
         operation.status = DumpOperationStatusChoices.SUCCESS
         operation.error_text = None
+        operation.stage_metrics = self.timer.stages
         operation.save()
         return True, None
@@ -0,0 +1,52 @@
+import hashlib
+
+from manager.choices import DumpOperationStatusChoices
+from manager.models import DumpContent, DumpTaskOperation
+
+# Настройки задачи, от которых зависит артефакт: после их смены прошлый не подходит.
+# parallel_jobs меняет только скорость (-j, потоки zstd), артефакт тот же
+DUMP_SETTINGS = ["file_storage_id", "pg_dump_format", "clickhouse_engine", "clickhouse_archive_mode",
+                 "clickhouse_incremental", "clickhouse_full_every", "storage_format", "compression_codec",
+                 "compression_level", "adaptive_compression"]
+# Что новая операция берёт у операции, чей артефакт переиспользует
+REUSED_FIELDS = ["dump_path", "dump_size", "dump_sha256", "base_operation_id", "parts_manifest",
+                 "table_catalog", "remote_backup_name"]
+
+
+def change_fingerprint(task, db_interface):
+    """
+    Отпечаток состояния базы (db_interface.change_fingerprint) вместе со строкой
+    подключения и настройками дампа задачи. -> (sha256, error)
+    """
+    db = task.database
+    state, error = db_interface.change_fingerprint(db.connection_string)
+    if error:
+        return None, error
+    values = [db.db_type, db.connection_string, state, *(getattr(task, field) for field in DUMP_SETTINGS)]
+    return hashlib.sha256("\0".join(str(value) for value in values).encode()).hexdigest(), None
+
+
+def find_unchanged(operation, fingerprint):
+    """Последний успешный дамп задачи, если с него база не менялась, иначе None."""
+    previous = DumpTaskOperation.objects.filter(
+        task_id=operation.task_id, status=DumpOperationStatusChoices.SUCCESS,
+    ).exclude(id=operation.id).order_by("-created_dt").first()
+    if previous and previous.dump_path and previous.change_fingerprint == fingerprint:
+        return previous
+    return None
+
+
+def reuse_artifact(operation, previous):
+    """Операция ссылается на артефакт previous: без дампа и выгрузки. Каталог содержимого копируется."""
+    for field in REUSED_FIELDS:
+        setattr(operation, field, getattr(previous, field))
+    # Ссылка на операцию, которая артефакт действительно сняла
+    operation.artifact_operation_id = previous.artifact_operation_id or previous.id
+    DumpContent.objects.filter(operation=operation).delete()
+    # Все поля, кроме ключей: новое поле каталога копируется без правки этого места
+    fields = [field.attname for field in DumpContent._meta.concrete_fields
+              if not field.primary_key and field.attname != "operation_id"]
+    DumpContent.objects.bulk_create([
+        DumpContent(operation=operation, **{field: getattr(content, field) for field in fields})
+        for content in DumpContent.objects.filter(operation=previous)
+    ], batch_size=1000)
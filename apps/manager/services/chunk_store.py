@@ -0,0 +1,326 @@
+import hashlib
+import json
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from manager.models import StorageChunk
+from manager.services.compression import get_codec
+from manager.services.streams import CHUNK_SIZE
+
+MANIFEST_SUFFIX = ".manifest.json"
+CHUNKS_PREFIX = "chunks"
+
+# Границы чанков: не меньше MIN, в среднем AVG, не больше MAX байт
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_AVG_SIZE = 1024 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+# Окно, по которому считается хэш у кандидата в границу
+BOUNDARY_WINDOW = 48
+# Сколько чанков одновременно выгружаем/скачиваем и держим в памяти
+TRANSFER_CONCURRENCY = 4
+TRANSFER_WINDOW = TRANSFER_CONCURRENCY * 2
+# Сколько дайджестов за раз передаём в digest__in (лимит переменных SQLite)
+DB_BATCH_SIZE = 500
+# Захват очисткой старше CLAIM_TTL считается брошенным (процесс очистки умер)
+CLAIM_TTL = timedelta(hours=1)
+# Сколько выгрузка ждёт, пока очистка удалит захваченный чанк
+CLAIM_WAIT_SECONDS = 60
+
+
+def batched(items, size=DB_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class ContentDefinedChunker:
+    """
+    Нарезка потока на чанки, границы которых зависят только от содержимого:
+    вставка в начало дампа сдвигает соседние границы, а не все последующие.
+
+    Кандидаты в границы — переводы строк (для SQL-дампов это границы строк
+    COPY, для бинарных данных — просто случайные позиции), ищутся через
+    bytes.find на скорости C. Кандидат становится границей, если crc32 окна
+    перед ним меньше порога, пропорционального расстоянию до прошлого
+    кандидата, — так средний размер чанка не зависит от длины строк.
+    """
+
+    def __init__(self, source, min_size=CHUNK_MIN_SIZE, avg_size=CHUNK_AVG_SIZE, max_size=CHUNK_MAX_SIZE):
+        self.source = source
+        self.min_size = min_size
+        self.max_size = max_size
+        self._threshold_per_byte = (1 << 32) / max(avg_size - min_size, 1)
+
+    def _find_boundary(self, buffer):
+        limit = min(len(buffer), self.max_size)
+        position = self.min_size
+        previous = position
+        while True:
+            newline = buffer.find(b"\n", position, limit)
+            if newline == -1:
+                return None
+            cut = newline + 1
+            window_hash = zlib.crc32(buffer[max(cut - BOUNDARY_WINDOW, 0):cut])
+            if window_hash < (cut - previous) * self._threshold_per_byte:
+                return cut
+            previous = position = cut
+
+    def __iter__(self):
+        buffer = bytearray()
+        eof = False
+        while buffer or not eof:
+            while not eof and len(buffer) < self.max_size:
+                data = self.source.read(CHUNK_SIZE)
+                if not data:
+                    eof = True
+                    break
+                buffer += data
+            if len(buffer) <= self.min_size and eof:
+                if buffer:
+                    yield bytes(buffer)
+                return
+            cut = self._find_boundary(buffer)
+            if cut is None:
+                cut = min(len(buffer), self.max_size)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+
+
+class ChunkReader:
+    """Последовательное чтение артефакта по манифесту: чанки качаются параллельно."""
+
+    def __init__(self, store, chunks):
+        self.store = store
+        self._chunks = deque(chunks)
+        self._executor = ThreadPoolExecutor(max_workers=TRANSFER_CONCURRENCY)
+        self._pending = deque()
+        self._buffer = bytearray()
+
+    def _schedule(self):
+        while self._chunks and len(self._pending) < TRANSFER_WINDOW:
+            digest, size = self._chunks.popleft()
+            self._pending.append(self._executor.submit(self.store.fetch_chunk, digest, size))
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            self._schedule()
+            if not self._pending:
+                break
+            self._buffer += self._pending.popleft().result()
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def close(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+
+class ChunkStore:
+    """
+    Дедуплицированное хранение артефактов в FileStorage:
+    chunks/<sha256>.<ext> — сжатые чанки, dumps/<operation_id>.<ext>.manifest.json —
+    их порядок. StorageChunk считает ссылки манифестов на чанк; чанк удаляется,
+    когда на него не ссылается ни один манифест.
+
+    Дампы и очистка идут одновременно, поэтому ссылка берётся до выгрузки
+    объекта (_reserve_chunk), а очистка сначала захватывает чанки без ссылок
+    (deleting_dt) и только потом удаляет объекты. Захваченный чанк новая
+    ссылка не получает, пока очистка не закончит; так объект, на который
+    ссылается манифест, не может быть удалён.
+    """
+
+    def __init__(self, storage_service, file_storage):
+        self.storage_service = storage_service
+        self.file_storage = file_storage
+        self.codec = get_codec("zstd")
+
+    @staticmethod
+    def is_manifest(dump_path):
+        return bool(dump_path) and dump_path.endswith(MANIFEST_SUFFIX)
+
+    @staticmethod
+    def artifact_path(dump_path):
+        """dumps/<id>.sql.manifest.json -> dumps/<id>.sql (формат содержимого)."""
+        return dump_path[:-len(MANIFEST_SUFFIX)]
+
+    def _chunk_key(self, digest):
+        return f"{CHUNKS_PREFIX}/{digest}.{self.codec.extension}"
+
+    def _compress(self, data):
+        compressor = self.codec.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def _store_chunk(self, digest, data):
+        stored = self._compress(data)
+        self.storage_service.put_object(self._chunk_key(digest), stored)
+        return digest, len(stored)
+
+    def _reserve_chunk(self, digest, size):
+        """
+        Ссылка манифеста на чанк, взятая до выгрузки: очистка такой чанк не
+        захватит. -> нужно ли выгружать объект (его ещё нет или он под вопросом)
+
+        Проверка захвата и ссылка — один условный UPDATE: select_for_update
+        на SQLite ничего не блокирует.
+        """
+        waited = 0
+        while True:
+            chunk, _ = StorageChunk.objects.get_or_create(
+                file_storage=self.file_storage, digest=digest, defaults={"size": size, "stored_size": 0})
+            chunks = StorageChunk.objects.filter(pk=chunk.pk)
+            if chunks.filter(deleting_dt__isnull=True).update(refcount=F("refcount") + 1):
+                # Со ссылкой чанк уже не захватить, stored не сбросится
+                return not chunks.values_list("stored", flat=True).first()
+            # Брошенный захват: удалён ли объект, неизвестно — выгружаем заново
+            if chunks.filter(deleting_dt__lt=timezone.now() - CLAIM_TTL).update(
+                    refcount=F("refcount") + 1, stored=False, deleting_dt=None):
+                return True
+            # Чанк захвачен очисткой (или уже удалён — тогда запись создастся заново)
+            if waited >= CLAIM_WAIT_SECONDS:
+                raise IOError(f"Chunk {digest} is being deleted")
+            time.sleep(1)
+            waited += 1
+
+    def upload(self, reader, operation_id, extension):
+        """Нарезает поток, выгружает отсутствующие чанки, пишет манифест. -> (path, error)"""
+        chunks = []
+        seen = set()
+        referenced = set()
+        pending = deque()
+        stats = {"size": 0, "new_chunks": 0, "new_bytes": 0}
+
+        def finish(future):
+            digest, stored_size = future.result()
+            StorageChunk.objects.filter(file_storage=self.file_storage, digest=digest).update(
+                stored=True, stored_size=stored_size)
+            stats["new_chunks"] += 1
+            stats["new_bytes"] += stored_size
+
+        try:
+            with ThreadPoolExecutor(max_workers=TRANSFER_CONCURRENCY) as executor:
+                for data in ContentDefinedChunker(reader):
+                    digest = hashlib.sha256(data).hexdigest()
+                    chunks.append([digest, len(data)])
+                    stats["size"] += len(data)
+                    # Манифест ссылается на чанк один раз, даже если он повторяется
+                    if digest in seen:
+                        continue
+                    seen.add(digest)
+                    needs_upload = self._reserve_chunk(digest, len(data))
+                    referenced.add(digest)
+                    if not needs_upload:
+                        continue
+                    pending.append(executor.submit(self._store_chunk, digest, data))
+                    while len(pending) >= TRANSFER_WINDOW:
+                        finish(pending.popleft())
+                while pending:
+                    finish(pending.popleft())
+
+            manifest = {
+                "version": 1,
+                "codec": self.codec.name,
+                "size": stats["size"],
+                "chunks": chunks,
+            }
+            manifest_key = f"dumps/{operation_id}.{extension}{MANIFEST_SUFFIX}"
+            path = self.storage_service.put_object(manifest_key, json.dumps(manifest).encode())
+        except Exception as e:
+            # Ссылки этого манифеста откатываем: выгруженные, но никому не нужные чанки удалит очистка
+            self._release(referenced)
+            return None, str(e)
+        print(f"Chunks: {len(chunks)}, new: {stats['new_chunks']} ({stats['new_bytes']} bytes uploaded)")
+        return path, None
+
+    def load_manifest(self, dump_path):
+        return json.loads(self.storage_service.get_object(dump_path))
+
+    def fetch_chunk(self, digest, size):
+        decompressor = self.codec.decompressor()
+        data = decompressor.decompress(self.storage_service.get_object(self._chunk_key(digest)))
+        if len(data) != size or hashlib.sha256(data).hexdigest() != digest:
+            raise IOError(f"Chunk {digest} is corrupted")
+        return data
+
+    def open(self, dump_path):
+        """Поток исходного (несжатого) артефакта по манифесту. -> (reader, error)"""
+        try:
+            manifest = self.load_manifest(dump_path)
+        except Exception as e:
+            return None, f"Error reading manifest: {e}"
+        return ChunkReader(self, manifest["chunks"]), None
+
+    def _release(self, digests):
+        """Снимает ссылки на чанки и удаляет те, на которые больше никто не ссылается."""
+        for batch in batched(digests):
+            StorageChunk.objects.filter(
+                file_storage=self.file_storage, digest__in=batch, refcount__gt=0,
+            ).update(refcount=F("refcount") - 1)
+            self.collect_garbage(batch)
+
+    def _claim_orphans(self, digests):
+        """Захватывает чанки без ссылок (и брошенные захваты). -> (время захвата, дайджесты)"""
+        claimed_dt = timezone.now()
+        unclaimed = Q(deleting_dt__isnull=True) | Q(deleting_dt__lt=claimed_dt - CLAIM_TTL)
+        orphans = StorageChunk.objects.filter(unclaimed, file_storage=self.file_storage, refcount=0)
+        if digests is not None:
+            orphans = orphans.filter(digest__in=digests)
+        candidates = list(orphans.values_list("pk", flat=True)[:DB_BATCH_SIZE])
+        # Условия повторяются в UPDATE: между выборкой и захватом выгрузка могла взять ссылку
+        StorageChunk.objects.filter(unclaimed, pk__in=candidates, refcount=0).update(deleting_dt=claimed_dt)
+        claimed = StorageChunk.objects.filter(pk__in=candidates, deleting_dt=claimed_dt)
+        return claimed_dt, list(claimed.values_list("digest", flat=True))
+
+    def _collect_batch(self, digests):
+        """Захват, удаление объектов, удаление записей. -> (сколько захвачено, сколько не удалось удалить)"""
+        claimed_dt, claimed = self._claim_orphans(digests)
+        keys = {self.storage_service.object_path(self._chunk_key(digest)): digest for digest in claimed}
+        if not keys:
+            return 0, 0
+        failed = set(self.storage_service.delete_dumps(keys))
+        deleted = [digest for key, digest in keys.items() if key not in failed]
+        # Захват сверяем по времени: брошенный захват могла перехватить выгрузка
+        ours = StorageChunk.objects.filter(file_storage=self.file_storage, deleting_dt=claimed_dt, refcount=0)
+        for batch in batched(deleted):
+            ours.filter(digest__in=batch).delete()
+        for batch in batched(keys[key] for key in failed):
+            ours.filter(digest__in=batch).update(deleting_dt=None)
+        return len(keys), len(failed)
+
+    def collect_garbage(self, digests=None):
+        """
+        Пакетно удаляет чанки без ссылок (все или из digests). Если удалить
+        объект не удалось, захват снимается и удаление повторится при следующей очистке.
+        """
+        if digests is not None:
+            for batch in batched(digests):
+                self._collect_batch(batch)
+            return
+        while True:
+            claimed, failed = self._collect_batch(None)
+            if not claimed or failed:
+                # Всё удалено или хранилище недоступно — остальное при следующей очистке
+                return
+
+    def delete(self, dump_path):
+        try:
+            manifest = self.load_manifest(dump_path)
+        except Exception:
+            return False
+        # Сначала манифест: повтор после сбоя не должен снять ссылки второй раз
+        if not self.storage_service.delete_dump(dump_path):
+            return False
+        self._release({digest for digest, _ in manifest["chunks"]})
+        return True
@@ -0,0 +1,84 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from manager.choices import DumpOperationStatusChoices
+from manager.models import DumpTaskOperation, RecoverBackupOperation
+
+# Захват операции — статус IN_PROCESS; пока она выполняется, процесс раз в
+# HEARTBEAT_INTERVAL обновляет её updated_dt. Если процесс убит (OOM, SIGKILL
+# супервизора), updated_dt перестаёт меняться и через OPERATION_CLAIM_TTL захват
+# считается потерянным.
+HEARTBEAT_INTERVAL = settings.OPERATION_CLAIM_TTL / 10
+LOST_CLAIM_ERROR = "The process executing the operation was lost, queue it again"
+
+
+def stale_cutoff():
+    return timezone.now() - timedelta(seconds=settings.OPERATION_CLAIM_TTL)
+
+
+def requeueable():
+    """Условие для повторной постановки в очередь: не выполняется или захват потерян."""
+    return ~Q(status=DumpOperationStatusChoices.IN_PROCESS) | Q(updated_dt__lt=stale_cutoff())
+
+
+def touch_claims(jobs):
+    """Продлевает захват операций задач пула, в том числе ещё ждущих очереди; запущенные продлевает и heartbeat()."""
+    claimed = {}
+    for job in jobs:
+        if job.claim:
+            model, operation_id = job.claim
+            claimed.setdefault(model, []).append(operation_id)
+    for model, ids in claimed.items():
+        model.objects.filter(id__in=ids, status=DumpOperationStatusChoices.IN_PROCESS).update(
+            updated_dt=timezone.now())
+
+
+@contextmanager
+def heartbeat(model, operation_id):
+    """
+    Продлевает захват операции, пока выполняется блок. Нужен и вне воркера:
+    операцию, запущенную командой dump_operation/restore_dump, воркер иначе
+    сочтёт потерянной через OPERATION_CLAIM_TTL и пометит FAIL.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                try:
+                    model.objects.filter(id=operation_id, status=DumpOperationStatusChoices.IN_PROCESS).update(
+                        updated_dt=timezone.now())
+                except Exception as e:
+                    print(f"Heartbeat of operation {operation_id} failed: {e}")
+        finally:
+            # У потока своё соединение с БД
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{operation_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def fail_stale_claims():
+    """
+    Операции с потерянным захватом -> FAIL. Автоматически не перезапускаются:
+    восстановление поверх частично загруженной базы решает оператор (действия админки).
+    """
+    failed = 0
+    for model in (DumpTaskOperation, RecoverBackupOperation):
+        failed += model.objects.filter(
+            status=DumpOperationStatusChoices.IN_PROCESS, updated_dt__lt=stale_cutoff(),
+        ).update(status=DumpOperationStatusChoices.FAIL, error_text=LOST_CLAIM_ERROR)
+    if failed:
+        print(f"Operations with a lost worker marked failed: {failed}")
+    return failed
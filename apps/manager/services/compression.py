@@ -0,0 +1,150 @@
+import zlib
+
+import zstandard
+
+from manager.choices import CompressionCodecChoices
+
+
+# Сколько первых байт артефакта нужно, чтобы узнать кодек по сигнатуре
+MAGIC_SIZE = 4
+
+
+class GzipCodec:
+    """Потоковое gzip-сжатие средствами zlib (без внешних зависимостей)."""
+
+    name = "gzip"
+    extension = "gz"
+    magic = b"\x1f\x8b"
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compressor(self):
+        # wbits=31 -> gzip-заголовок и CRC32
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def decompressor(self):
+        return zlib.decompressobj(31)
+
+
+class ZstdCodec:
+    """zstd; при threads > 1 сжатие идёт в несколько потоков внутри libzstd."""
+
+    name = "zstd"
+    extension = "zst"
+    magic = b"\x28\xb5\x2f\xfd"
+
+    def __init__(self, level=3, threads=1):
+        self.level = level
+        self.threads = threads
+
+    def compressor(self):
+        threads = self.threads if self.threads > 1 else 0
+        return zstandard.ZstdCompressor(level=self.level, threads=threads).compressobj()
+
+    def decompressor(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+class _Lz4Compressor:
+    """LZ4FrameCompressor с интерфейсом compressobj: заголовок кадра — с первым блоком."""
+
+    def __init__(self, level):
+        import lz4.frame
+
+        self._compressor = lz4.frame.LZ4FrameCompressor(compression_level=level)
+        self._header = self._compressor.begin()
+
+    def _take_header(self):
+        header, self._header = self._header, b""
+        return header
+
+    def compress(self, data):
+        return self._take_header() + self._compressor.compress(data)
+
+    def flush(self):
+        return self._take_header() + self._compressor.flush()
+
+
+class _Lz4Decompressor:
+    def __init__(self):
+        import lz4.frame
+
+        self._decompressor = lz4.frame.LZ4FrameDecompressor()
+
+    @property
+    def eof(self):
+        return self._decompressor.eof
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        return b""
+
+
+class Lz4Codec:
+    """
+    lz4 frame: сжимает слабее zstd, но почти не нагружает CPU. Пакет lz4
+    импортируется при использовании: без него не работают только задачи с этим кодеком.
+    """
+
+    name = "lz4"
+    extension = "lz4"
+    magic = b"\x04\x22\x4d\x18"
+
+    def __init__(self, level=0):
+        self.level = level
+
+    def compressor(self):
+        return _Lz4Compressor(self.level)
+
+    def decompressor(self):
+        return _Lz4Decompressor()
+
+
+CODECS = {
+    GzipCodec.name: GzipCodec,
+    ZstdCodec.name: ZstdCodec,
+    Lz4Codec.name: Lz4Codec,
+}
+
+
+def get_codec(name, **options):
+    return CODECS[name](**options)
+
+
+# Кодек задачи (CompressionCodecChoices) -> имя в CODECS
+TASK_CODECS = {
+    CompressionCodecChoices.GZIP: GzipCodec.name,
+    CompressionCodecChoices.ZSTD: ZstdCodec.name,
+    CompressionCodecChoices.LZ4: Lz4Codec.name,
+}
+
+
+def detect_codec(head):
+    """Кодек по сигнатуре в начале артефакта (MAGIC_SIZE байт); None — данные не сжаты."""
+    for codec_class in CODECS.values():
+        if head.startswith(codec_class.magic):
+            return codec_class()
+    return None
+
+
+def task_codec(task, default, level=None):
+    """
+    Кодек потока дампа по настройкам задачи. default — кодек формата дампа;
+    если формат поток не сжимает (zip частей ClickHouse, pg_dump -Fd — данные
+    уже сжаты), настройка задачи не применяется. level переопределяет уровень задачи.
+    """
+    if default is None or task is None or task.compression_codec == CompressionCodecChoices.DEFAULT:
+        return default
+    if task.compression_codec == CompressionCodecChoices.NONE:
+        return None
+    name = TASK_CODECS[task.compression_codec]
+    options = {}
+    level = task.compression_level if level is None else level
+    if level is not None:
+        options["level"] = level
+    if name == ZstdCodec.name:
+        options["threads"] = max(task.parallel_jobs, 1)
+    return get_codec(name, **options)
@@ -1,10 +1,40 @@
-from manager.services.databases.clickhouse import ClickhouseService
+from manager.services.databases.clickhouse import (ClickhouseRemoteService,
+                                                   ClickhouseService)
+from manager.services.databases.clickhouse_native import \
+    ClickhouseNativeService
 from manager.services.databases.postgres import PostgresqlService
 
-from manager.choices import DBType
+from manager.choices import ClickhouseEngineChoices, DBType
 
 
 DB_INTERFACE = {
     DBType.POSTGRESQL: PostgresqlService,
     DBType.CLICKHOUSE: ClickhouseService
 }
+
+# Движки ClickHouse, которые сами пишут бэкап в хранилище
+SERVER_SIDE_ENGINES = {
+    ClickhouseEngineChoices.NATIVE: ClickhouseNativeService,
+    ClickhouseEngineChoices.REMOTE: ClickhouseRemoteService,
+}
+
+
+def is_server_side_backup(dump_path):
+    return any(service.is_server_side_backup(dump_path) for service in SERVER_SIDE_ENGINES.values())
+
+
+def get_db_interface(task, dump_path=None):
+    """
+    Сервис БД задачи. Для восстановления (dump_path) движок ClickHouse берётся
+    по самому дампу: настройку задачи могли поменять после него.
+    """
+    db_type = task.database.db_type
+    if db_type == DBType.CLICKHOUSE:
+        for engine, service in SERVER_SIDE_ENGINES.items():
+            if dump_path is not None:
+                matches = service.is_server_side_backup(dump_path)
+            else:
+                matches = task.clickhouse_engine == engine
+            if matches:
+                return service(task)
+    return DB_INTERFACE[db_type](task)
@@ -1,5 +1,7 @@
+import hashlib
+import json
 import os
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 import shutil
 import subprocess
 import tempfile
@@ -7,9 +9,139 @@ import zipfile
 
 from clickhouse_driver import Client
 from clickhouse_driver.errors import NetworkError, ServerException
+from django.conf import settings
+
+from manager.choices import (ClickhouseArchiveChoices,
+                             DumpOperationStatusChoices)
+from manager.services.compression import get_codec, task_codec
+from manager.services.spool import spool_path
+from manager.services.streams import (CHUNK_SIZE, CompressingReader,
+                                      DirectoryReader, extract_tar_stream,
+                                      open_decompressed, write_directory_tar,
+                                      write_directory_zip)
+
+# Части лежат в shadow/<db>/<table>/<disk>/<part>
+PARTS_DEPTH = 5
+# Префикс бэкапов clickhouse-backup в бакете (s3.path): <REMOTE_DIR>/<backup_name>/...
+REMOTE_DIR = "clickhouse-backup"
+MB = 1024 * 1024
+
+
+def selection_filter(tables, partitions=None):
+    """
+    Отбор файлов бэкапа clickhouse-backup для выборочного восстановления.
+    tables — "db.table" или "db.*", partitions — id партиций (начало имени
+    части). Остаются metadata.json, метаданные и части выбранных таблиц.
+    -> keep(путь внутри бэкапа)
+    """
+    selected = [name.split(".", 1) for name in tables]
+    partitions = set(partitions or [])
+
+    def table_selected(database, table):
+        return any(database == name[0] and name[1] in ("*", table) for name in selected)
+
+    def keep(path):
+        # Имена баз и таблиц в путях закодированы (%2E, %2D, ...)
+        names = [unquote(name) for name in os.path.normpath(path).split(os.sep)]
+        if names[0] == "metadata" and len(names) == 3:
+            return table_selected(names[1], names[2].removesuffix(".json"))
+        if names[0] == "shadow" and len(names) > 3:
+            if not table_selected(names[1], names[2]):
+                return False
+            # shadow/<db>/<table>/<disk>/<partition_id>_<min>_<max>_<level>/...
+            return not partitions or len(names) < 5 or names[4].split("_")[0] in partitions
+        return len(names) == 1
+    return keep
 
 
 class ClickhouseService:
+    # Выбранные таблицы и партиции восстанавливаются без скачивания всего архива
+    supports_selective_restore = True
+
+    def __init__(self, task=None):
+        self.task = task
+        self.archive_mode = task.clickhouse_archive_mode if task else ClickhouseArchiveChoices.STORE
+        self.threads = max(task.parallel_jobs, 1) if task else 1
+        # Заполняется при дампе, сохраняется BackupService на операцию
+        self.dump_metadata = {}
+
+    @property
+    def stream_extension(self):
+        return "zip" if self.archive_mode == ClickhouseArchiveChoices.STORE else "tar"
+
+    @property
+    def stream_codec(self):
+        # Zip читается ranged-запросами при выборочном восстановлении, его не сжимаем
+        if self.archive_mode == ClickhouseArchiveChoices.ZSTD:
+            return task_codec(self.task, get_codec("zstd"))
+        if self.archive_mode == ClickhouseArchiveChoices.ZSTD_MT:
+            return task_codec(self.task, get_codec("zstd", threads=self.threads))
+        return None
+
+    def _archive_writer(self, skip_dirs=frozenset()):
+        writer = write_directory_zip if self.archive_mode == ClickhouseArchiveChoices.STORE else write_directory_tar
+        return lambda directory, fileobj: writer(directory, fileobj, skip_dirs=skip_dirs)
+
+    @staticmethod
+    def _list_parts(backup_path):
+        """Относительные пути каталогов частей: shadow/<db>/<table>/<disk>/<part>."""
+        parts = []
+        shadow = os.path.join(backup_path, "shadow")
+        for root, dirs, files in os.walk(shadow):
+            relroot = os.path.relpath(root, start=backup_path)
+            if relroot.count(os.sep) == PARTS_DEPTH - 2:
+                parts.extend(os.path.join(relroot, d) for d in dirs)
+                dirs[:] = []
+        return sorted(parts)
+
+    @staticmethod
+    def _part_checksums(backup_path, parts):
+        """
+        {часть: sha256 её checksums.txt}. Имя части не определяет данные: после
+        DROP/CREATE TABLE или TRUNCATE номера блоков начинаются заново и all_1_1_0
+        возвращается с другим содержимым. checksums.txt перечисляет файлы части
+        с их суммами, поэтому совпадает только у одинаковых частей.
+        """
+        manifest = {}
+        for part in parts:
+            try:
+                with open(os.path.join(backup_path, part, "checksums.txt"), "rb") as fileobj:
+                    manifest[part] = hashlib.sha256(fileobj.read()).hexdigest()
+            except OSError:
+                manifest[part] = None
+        return manifest
+
+    @staticmethod
+    def _unchanged_parts(base_manifest, manifest):
+        """Части, которые уже лежат в базовом бэкапе: то же имя и та же сумма."""
+        # Старые манифесты — списком, без сумм: такой базе не доверяем
+        if not isinstance(base_manifest, dict):
+            return frozenset()
+        return frozenset(
+            part for part, checksum in manifest.items()
+            if checksum is not None and base_manifest.get(part) == checksum
+        )
+
+    def _find_base_operation(self, operation_id):
+        """Последний успешный бэкап задачи, если цепочка ещё не упёрлась в лимит."""
+        if not self.task or not self.task.clickhouse_incremental:
+            return None
+        from manager.models import DumpTaskOperation
+
+        base = DumpTaskOperation.objects.filter(
+            task=self.task,
+            status=DumpOperationStatusChoices.SUCCESS,
+            parts_manifest__isnull=False,
+        ).exclude(id=operation_id).order_by("-created_dt").first()
+        if not base:
+            return None
+        chain = base.get_chain()
+        if len(chain) >= max(self.task.clickhouse_full_every, 1):
+            return None
+        # Перевыполнение старой операции не должно замкнуть цепочку на себя
+        if any(str(operation.id) == str(operation_id) for operation in chain):
+            return None
+        return base
 
     def parse_connection_string(self, connection_string):
         parsed_url = urlparse(connection_string)
@@ -21,7 +153,7 @@ class ClickhouseService:
         return user, password, host, port, database
 
     @staticmethod
-    def check_connection(connection_string):
+    def check_connection(connection_string, timeout=10):
         try:
             # Разбираем строку подключения
             parsed_url = urlparse(connection_string)
@@ -43,11 +175,16 @@ class ClickhouseService:
                 port=port,
                 user=user,
                 password=password,
-                database=database
+                database=database,
+                connect_timeout=timeout,
+                send_receive_timeout=timeout,
             )
 
             # Пробуем выполнить простой запрос
-            client.execute("SELECT 1")
+            try:
+                client.execute("SELECT 1")
+            finally:
+                client.disconnect()
             return True
 
         except (NetworkError, ServerException) as e:
@@ -57,43 +194,152 @@ class ClickhouseService:
             print(f"Unexpected error: {e}")
             return False
 
-    def _create_config(self, connection_string):
+    def estimate_size(self, connection_string):
+        """Сумма активных частей всех пользовательских баз (то, что войдёт в бэкап). -> (байт, error)"""
+        user, password, host, port, database = self.parse_connection_string(connection_string)
+        client = Client(host=host, port=port, user=user, password=password, database=database)
+        try:
+            rows = client.execute(
+                "SELECT sum(bytes_on_disk) FROM system.parts "
+                "WHERE active AND database NOT IN ('system', 'INFORMATION_SCHEMA', 'information_schema')"
+            )
+            return rows[0][0], None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            client.disconnect()
+
+    def change_fingerprint(self, connection_string):
+        """
+        Активные части с их контрольными суммами (имя части меняется при
+        вставке, слиянии и мутации) и определения таблиц (ALTER без мутации
+        частей не трогает). Таблицы других движков со своими данными (Log,
+        Memory, Set, ...) в system.parts не видны — по ним берутся total_rows
+        и total_bytes; если движок их не сообщает, изменения не отслеживаются
+        (error — снимается обычный дамп). -> (строка, error)
+        """
+        user, password, host, port, database = self.parse_connection_string(connection_string)
+        client = Client(host=host, port=port, user=user, password=password, database=database)
+        try:
+            parts = client.execute(
+                "SELECT count(), max(modification_time), "
+                "groupBitXor(cityHash64(database, table, name, hash_of_all_files)) FROM system.parts "
+                "WHERE active AND database NOT IN ('system', 'INFORMATION_SCHEMA', 'information_schema')"
+            )
+            tables = client.execute(
+                "SELECT count(), groupBitXor(cityHash64(database, name, create_table_query)) FROM system.tables "
+                "WHERE database NOT IN ('system', 'INFORMATION_SCHEMA', 'information_schema')"
+            )
+            other_engines = client.execute(
+                "SELECT countIf(total_rows IS NULL OR total_bytes IS NULL), "
+                "groupBitXor(cityHash64(database, name, ifNull(total_rows, 0), ifNull(total_bytes, 0))) "
+                "FROM system.tables WHERE has_own_data AND engine NOT LIKE '%MergeTree' "
+                "AND database NOT IN ('system', 'INFORMATION_SCHEMA', 'information_schema')"
+            )
+            untracked, _ = other_engines[0]
+            if untracked:
+                return None, f"{untracked} tables report no row count or size, their changes can't be detected"
+            return f"{parts[0]}{tables[0]}{other_engines[0]}", None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            client.disconnect()
+
+    def describe_contents(self, connection_string):
+        """
+        Партиции таблиц пользовательских баз для каталога содержимого дампа.
+        partition — значение ключа партиционирования, partition_id — id, по которому
+        выбираются партиции при восстановлении (как в именах частей).
+        -> ([{schema, table, partition, partition_id, parts, rows, size}], error)
+        """
+        user, password, host, port, database = self.parse_connection_string(connection_string)
+        client = Client(host=host, port=port, user=user, password=password, database=database)
+        try:
+            rows = client.execute(
+                "SELECT database, table, partition, partition_id, count(), sum(rows), sum(bytes_on_disk) "
+                "FROM system.parts "
+                "WHERE active AND database NOT IN ('system', 'INFORMATION_SCHEMA', 'information_schema') "
+                "GROUP BY database, table, partition, partition_id ORDER BY database, table, partition_id"
+            )
+            return [
+                {"schema": db, "table": table, "partition": partition, "partition_id": partition_id,
+                 "parts": parts, "rows": count, "size": size}
+                for db, table, partition, partition_id, parts, count, size in rows
+            ], None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            client.disconnect()
+
+    @staticmethod
+    def dump_space(estimate, streaming):
+        """clickhouse-backup create делает жёсткие ссылки на части, место нужно только под архив."""
+        return {} if streaming else {settings.SPOOL_DIR: estimate["compressed"]}
+
+    @staticmethod
+    def restore_space(artifact_path, size, raw_size, streaming):
+        """Части уже сжаты, распакованный бэкап ~ размеру архива."""
+        return {settings.CLICKHOUSE_BACKUP_DIR: size}
+
+    def _create_config(self, connection_string, storage=None):
+        """
+        Временный конфиг clickhouse-backup. С storage — удалённое S3-хранилище
+        из FileStorage: параллельность, лимит скорости и размер части берутся
+        из его параметров передачи, сжатие — из режима архива задачи.
+        """
         user, password, host, port, database = self.parse_connection_string(connection_string)
-        # Динамически создаём временный конфиг
-        config_content = f"""
-clickhouse:
-  host: {host}
-  port: {port}
-  username: {user}
-  password: {password}
-  database: {database}
-  timeout: 10s
-
-general:
-  remote_storage: s3
-  max_file_size: 10737418240
-
-s3:
-  access_key: aaa
-  secret_key: aaa
-  bucket: aaa
-  endpoint: aaaa
-  use_ssl: false
-  path: "/"
-"""
+        config = {
+            "general": {
+                "remote_storage": "none",
+                "max_file_size": 10737418240,
+                # Старые бэкапы удаляет RetentionService
+                "backups_to_keep_local": 0,
+                "backups_to_keep_remote": 0,
+            },
+            "clickhouse": {
+                "host": host,
+                "port": port,
+                "username": user,
+                "password": password,
+                "timeout": "10s",
+            },
+        }
+        if storage is not None:
+            concurrency = max(storage.max_concurrency, 1)
+            bandwidth = storage.max_bandwidth_mb * MB
+            config["general"].update({
+                "remote_storage": "s3",
+                "upload_concurrency": concurrency,
+                "download_concurrency": concurrency,
+                "upload_max_bytes_per_second": bandwidth,
+                "download_max_bytes_per_second": bandwidth,
+            })
+            config["s3"] = {
+                "access_key": storage.access_key,
+                "secret_key": storage.secret_key,
+                "bucket": storage.bucket_name,
+                "endpoint": storage.host,
+                "disable_ssl": storage.host.startswith("http://"),
+                "force_path_style": True,
+                "path": REMOTE_DIR,
+                "part_size": max(storage.multipart_chunk_size_mb, 5) * MB,
+                # Части уже сжаты LZ4/ZSTD: без сжатия архива или быстрый zstd
+                "compression_format": "tar" if self.archive_mode == ClickhouseArchiveChoices.STORE else "zstd",
+                "compression_level": 1,
+            }
         try:
             with tempfile.NamedTemporaryFile(delete=False, suffix=".yml") as temp_config:
                 config_file_path = temp_config.name
-                temp_config.write(config_content.encode())
+                # JSON — подмножество YAML, пароли не нужно экранировать вручную
+                temp_config.write(json.dumps(config).encode())
         except Exception as e:
             return None, f"Error cretate temp config: {e}"
         return config_file_path, None
-    
-    def dump_database(self, connection_string, operation_id):
+
+    def _create_backup(self, connection_string, operation_id):
+        """clickhouse-backup create в локальный CLICKHOUSE_BACKUP_DIR."""
         file_name = f"dump_{operation_id}"
-        folder_prefix = "/var/lib/clickhouse/backup/"
-        backup_path = os.path.join(folder_prefix, file_name)
-        zip_file_path = f"/tmp/{file_name}.zip"
+        backup_path = os.path.join(settings.CLICKHOUSE_BACKUP_DIR, file_name)
 
         config_file_path, error = self._create_config(connection_string)
         if error:
@@ -107,43 +353,75 @@ s3:
         finally:
             # Удаление временного файла конфигурации
             os.remove(config_file_path)
+        return backup_path, None
+
+    def open_dump_stream(self, connection_string, operation_id):
+        """
+        Архив бэкапа потоком, без временного <name>.zip: части ClickHouse уже сжаты
+        LZ4/ZSTD, поэтому по умолчанию только упаковываем их (zip без сжатия).
+        Папка бэкапа удаляется после выгрузки.
+        """
+        backup_path, error = self._create_backup(connection_string, operation_id)
+        if error:
+            return None, error
+
+        # Инкремент: в архив идут только части, которых нет в базовом бэкапе
+        # (сверяются имя и сумма checksums.txt)
+        parts = self._part_checksums(backup_path, self._list_parts(backup_path))
+        base = self._find_base_operation(operation_id)
+        skip_dirs = self._unchanged_parts(base.parts_manifest, parts) if base else frozenset()
+        self.dump_metadata = {
+            "parts_manifest": parts,
+            "base_operation": base,
+        }
+        if base:
+            print(f"Incremental backup from {base.id}: {len(parts) - len(skip_dirs)} of {len(parts)} parts")
+        return DirectoryReader(backup_path, self._archive_writer(skip_dirs)), None
+
+    def dump_database(self, connection_string, operation_id):
+        """Запасной путь для хранилищ без потоковой выгрузки: архив во временный файл."""
+        reader, error = self.open_dump_stream(connection_string, operation_id)
+        if error:
+            return None, error
+        archive_path = spool_path(f"dump_{operation_id}.{self.stream_extension}")
+        codec = self.stream_codec
+        if codec:
+            archive_path = f"{archive_path}.{codec.extension}"
         try:
-            # Упаковка папки в zip-архив
-            with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(backup_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, start=backup_path)
-                        zipf.write(file_path, arcname)
-
-            # Удаление папки с бэкапом после упаковки
-            shutil.rmtree(backup_path)
+            with open(archive_path, "wb") as fileobj:
+                shutil.copyfileobj(CompressingReader(reader, codec) if codec else reader, fileobj, CHUNK_SIZE)
         except Exception as e:
+            reader.close()
             return None, f"Error zipping or cleaning up: {e}"
+        error = reader.close()
+        if error:
+            return None, f"Error zipping or cleaning up: {error}"
+        return archive_path, None
 
-        return zip_file_path, None
-    
-    def load_dump(self, connection_string, filepath):
-        """Загрузка дампа в ClickHouse из zip-архива."""
-        file_name = os.path.basename(filepath).replace(".zip", "")
-        folder_prefix = "/var/lib/clickhouse/backup/"
-        backup_path = os.path.join(folder_prefix, file_name)
+    @staticmethod
+    def _backup_name(dump_path):
+        # dumps/<operation_id>.tar.zst -> <operation_id>
+        return os.path.basename(dump_path).split(".")[0]
+
+    def _restore_backup(self, connection_string, file_name, parts_manifest=None, tables=None, partitions=None):
+        backup_path = os.path.join(settings.CLICKHOUSE_BACKUP_DIR, file_name)
+        if parts_manifest is not None:
+            # После сборки цепочки убираем части, которых в этом бэкапе уже нет
+            keep = set(parts_manifest)
+            for part in self._list_parts(backup_path):
+                if part not in keep:
+                    shutil.rmtree(os.path.join(backup_path, part), ignore_errors=True)
 
         config_file_path, error = self._create_config(connection_string)
         if error:
+            shutil.rmtree(backup_path, ignore_errors=True)
             return False, error
-        # Распаковываем архив в /var/lib/clickhouse/backup
-        try:
-            with zipfile.ZipFile(filepath, 'r') as zip_ref:
-                zip_ref.extractall(backup_path)
-        except Exception as e:
-            os.remove(config_file_path)
-            return False, f"Error extracting zip file: {e}"
 
         # Выполняем команду восстановления дампа
         try:
-            command = f"clickhouse-backup restore {file_name} --config {config_file_path} --data"
-            subprocess.run(command, shell=True, check=True)
+            command = ["clickhouse-backup", "restore", file_name, "--config", config_file_path, "--data"]
+            command.extend(self._selection_args(tables, partitions))
+            subprocess.run(command, check=True)
         except subprocess.CalledProcessError as e:
             return False, f"Error restoring backup: {e}"
         finally:
@@ -152,3 +430,181 @@ s3:
             # Удаляем папку с бэкапом после восстановления
             shutil.rmtree(backup_path, ignore_errors=True)
         return True, None
+
+    @staticmethod
+    def supports_stream_restore(dump_path):
+        # Zip читается с конца (центральный каталог), потоком — только tar
+        return ".tar" in os.path.basename(dump_path)
+
+    @staticmethod
+    def _selection_args(tables, partitions):
+        args = []
+        if tables:
+            args.append(f"--tables={','.join(tables)}")
+        if partitions:
+            args.append(f"--partitions={','.join(partitions)}")
+        return args
+
+    def extract_archive(self, dump_path, fileobj, file_name, keep=None):
+        """
+        Распаковка артефакта в CLICKHOUSE_BACKUP_DIR/<file_name> без restore. Поверх уже
+        распакованного — так собирается цепочка base -> increment.
+        tar(.zst) читается потоком, zip — из файла или ranged-потока (нужен seek):
+        с keep (selection_filter) из zip читаются только отобранные файлы.
+        """
+        backup_path = os.path.join(settings.CLICKHOUSE_BACKUP_DIR, file_name)
+        try:
+            if self.supports_stream_restore(dump_path):
+                extract_tar_stream(open_decompressed(fileobj), backup_path, keep)
+            else:
+                with zipfile.ZipFile(fileobj, 'r') as zip_ref:
+                    members = [name for name in zip_ref.namelist() if keep(name)] if keep else None
+                    zip_ref.extractall(backup_path, members)
+        except Exception as e:
+            shutil.rmtree(backup_path, ignore_errors=True)
+            return False, f"Error extracting archive: {e}"
+        return True, None
+
+    def load_chain(self, connection_string, chain, open_artifact, tables=None, partitions=None):
+        """
+        Восстановление инкрементального бэкапа: распаковываем артефакты цепочки
+        от полного к последнему и восстанавливаем состав частей последнего.
+        open_artifact(dump_path) -> (fileobj, artifact_path, error); artifact_path
+        определяет формат содержимого, fileobj закрывается здесь.
+        tables/partitions — выборочное восстановление (см. selection_filter).
+        """
+        selected = selection_filter(tables, partitions) if tables else None
+        file_name = self._backup_name(chain[-1].dump_path)
+        backup_path = os.path.join(settings.CLICKHOUSE_BACKUP_DIR, file_name)
+        shutil.rmtree(backup_path, ignore_errors=True)
+        manifest = chain[-1].parts_manifest
+        final_parts = set(manifest) if manifest is not None else None
+        written_parts = set()
+        # От последнего артефакта к полному: каждая часть и каждый файл метаданных
+        # берутся из самого нового артефакта, где они есть, — часть с тем же именем
+        # из базы не смешивается с файлами новой
+        for operation in reversed(chain):
+            newer_parts = frozenset(written_parts)
+
+            def keep(name, newer_parts=newer_parts):
+                if selected and not selected(name):
+                    return False
+                names = os.path.normpath(name).split(os.sep)
+                if names[0] != "shadow" or len(names) < PARTS_DEPTH:
+                    return not os.path.isfile(os.path.join(backup_path, name))
+                part = os.path.join(*names[:PARTS_DEPTH])
+                if part in newer_parts or (final_parts is not None and part not in final_parts):
+                    return False
+                written_parts.add(part)
+                return True
+
+            print(f"Extract {operation.dump_path}...")
+            fileobj, artifact_path, error = open_artifact(operation.dump_path)
+            if error:
+                shutil.rmtree(backup_path, ignore_errors=True)
+                return False, error
+            try:
+                _, error = self.extract_archive(artifact_path, fileobj, file_name, keep)
+            finally:
+                fileobj.close()
+            if error:
+                return False, error
+        return self._restore_backup(connection_string, file_name, chain[-1].parts_manifest, tables, partitions)
+
+    def load_stream(self, connection_string, dump_path, reader):
+        """Распаковка tar(.zst) прямо из потока скачивания в CLICKHOUSE_BACKUP_DIR и restore."""
+        file_name = self._backup_name(dump_path)
+        _, error = self.extract_archive(dump_path, reader, file_name)
+        if error:
+            return False, error
+        return self._restore_backup(connection_string, file_name)
+
+    def load_dump(self, connection_string, filepath):
+        """Загрузка дампа в ClickHouse из zip- или tar(.zst)-архива."""
+        file_name = self._backup_name(filepath)
+        with open(filepath, "rb") as fileobj:
+            _, error = self.extract_archive(filepath, fileobj, file_name)
+        if error:
+            return False, error
+        return self._restore_backup(connection_string, file_name)
+
+
+class ClickhouseRemoteService(ClickhouseService):
+    """
+    clickhouse-backup create_remote/restore_remote: части в S3 выгружает и
+    скачивает сам инструмент, параллельно и со своим сжатием. Менеджер архив
+    не собирает и данные через себя не гонит.
+    """
+    server_side = True
+
+    @staticmethod
+    def is_server_side_backup(dump_path):
+        return bool(dump_path) and dump_path.startswith(f"{REMOTE_DIR}/")
+
+    @staticmethod
+    def remote_path(operation_id):
+        return f"{REMOTE_DIR}/dump_{operation_id}"
+
+    @staticmethod
+    def dump_space(estimate, streaming):
+        # create делает жёсткие ссылки на части, upload сжимает на лету
+        return {}
+
+    @staticmethod
+    def restore_space(artifact_path, size, raw_size, streaming):
+        # restore_remote сначала скачивает бэкап в локальный каталог
+        return {settings.CLICKHOUSE_BACKUP_DIR: size}
+
+    @staticmethod
+    def _run(config_file_path, *args, check=True):
+        subprocess.run(["clickhouse-backup", *args, "--config", config_file_path], check=check)
+
+    @staticmethod
+    def _remote_size(storage_service, dump_path):
+        """Сжатый размер из metadata.json бэкапа; без него размер просто не учитывается."""
+        try:
+            metadata = json.loads(storage_service.get_object(f"{dump_path}/metadata.json"))
+        except Exception:
+            return None
+        return metadata.get("compressed_size")
+
+    def backup_to_storage(self, connection_string, storage_service, dump_path, state, save_state):
+        """create_remote в dump_path. -> (размер, error)"""
+        file_name = os.path.basename(dump_path)
+        config_file_path, error = self._create_config(connection_string, storage_service.storage_instance)
+        if error:
+            return None, error
+        try:
+            # Остатки прошлой попытки: с тем же именем create_remote не запустится
+            self._run(config_file_path, "delete", "local", file_name, check=False)
+            self._run(config_file_path, "delete", "remote", file_name, check=False)
+            self._run(config_file_path, "create_remote", file_name)
+            # Локальная копия — жёсткие ссылки на части, после выгрузки не нужна
+            self._run(config_file_path, "delete", "local", file_name, check=False)
+        except Exception as e:
+            return None, f"Error executing command: {e}"
+        finally:
+            os.remove(config_file_path)
+        self.dump_metadata = {"remote_backup_name": file_name}
+        return self._remote_size(storage_service, dump_path), None
+
+    def restore_from_storage(self, connection_string, storage_service, dump_path, tables=None, partitions=None,
+                             contents=None):
+        """
+        restore_remote --data: скачивание и восстановление данных силами clickhouse-backup;
+        с tables/partitions скачиваются только они. contents (каталог дампа) не нужен.
+        -> (размер, error)
+        """
+        file_name = os.path.basename(dump_path)
+        config_file_path, error = self._create_config(connection_string, storage_service.storage_instance)
+        if error:
+            return None, error
+        try:
+            self._run(config_file_path, "restore_remote", file_name, "--data",
+                      *self._selection_args(tables, partitions))
+        except Exception as e:
+            return None, f"Error restoring backup: {e}"
+        finally:
+            self._run(config_file_path, "delete", "local", file_name, check=False)
+            os.remove(config_file_path)
+        return self._remote_size(storage_service, dump_path), None
@@ -0,0 +1,192 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+from clickhouse_driver import Client
+from django.conf import settings
+
+from manager.services.databases.clickhouse import ClickhouseService
+
+# Серверный бэкап — «каталог» объектов dumps/<operation_id>.chbackup/ в бакете
+NATIVE_SUFFIX = ".chbackup"
+EXCLUDED_DATABASES = "system, INFORMATION_SCHEMA, information_schema"
+BACKUP_QUERY = (f"BACKUP ALL EXCEPT DATABASES {EXCLUDED_DATABASES}{{on_cluster}} "
+                "TO S3(%(url)s, %(access_key)s, %(secret_key)s) ASYNC")
+RESTORE_QUERY = (f"RESTORE ALL EXCEPT DATABASES {EXCLUDED_DATABASES}{{on_cluster}} "
+                 "FROM S3(%(url)s, %(access_key)s, %(secret_key)s){settings} ASYNC")
+# Таблицы со своими данными, в которых уже есть строки: в них RESTORE без allow_non_empty_tables не пишет
+NON_EMPTY_TABLES_QUERY = """
+SELECT DISTINCT database, name FROM {tables}
+WHERE database NOT IN ('system', 'INFORMATION_SCHEMA', 'information_schema')
+  AND has_own_data AND total_rows > 0
+ORDER BY database, name
+"""
+PROGRESS_QUERY = """
+SELECT status, error, num_files, total_size, compressed_size, files_read, bytes_read
+FROM system.backups WHERE id = %(id)s
+"""
+IN_PROGRESS = {"CREATING_BACKUP", "RESTORING"}
+FINISHED = {"BACKUP_CREATED", "RESTORED"}
+MB = 1024 * 1024
+
+
+def quote_string(value):
+    """Строковый литерал ClickHouse (имя кластера в ON CLUSTER и clusterAllReplicas)."""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+class ClickhouseNativeService(ClickhouseService):
+    """
+    Нативные BACKUP/RESTORE ... ASYNC: узлы ClickHouse сами пишут бэкап в S3
+    и читают его оттуда, данные не проходят через менеджер и не занимают его
+    диск. Ход операции виден в system.backups, его и опрашиваем.
+    Кластер задаётся в строке подключения: clickhouse://...?cluster=<имя> —
+    тогда BACKUP/RESTORE выполняются ON CLUSTER (все шарды и реплики).
+    """
+    server_side = True
+    supports_selective_restore = False
+
+    @staticmethod
+    def is_server_side_backup(dump_path):
+        return bool(dump_path) and dump_path.endswith(NATIVE_SUFFIX)
+
+    @staticmethod
+    def remote_path(operation_id):
+        return f"dumps/{operation_id}{NATIVE_SUFFIX}"
+
+    @staticmethod
+    def dump_space(estimate, streaming):
+        return {}
+
+    @staticmethod
+    def restore_space(artifact_path, size, raw_size, streaming):
+        return {}
+
+    def _client(self, connection_string):
+        user, password, host, port, database = self.parse_connection_string(connection_string)
+        return Client(host=host, port=port, user=user, password=password, database=database)
+
+    @staticmethod
+    def _cluster(connection_string):
+        return parse_qs(urlparse(connection_string).query).get("cluster", [None])[0]
+
+    def _on_cluster(self, connection_string):
+        cluster = self._cluster(connection_string)
+        return f" ON CLUSTER {quote_string(cluster)}" if cluster else ""
+
+    @staticmethod
+    def _s3_params(storage, dump_path):
+        # Путь в стиле path-style: <endpoint>/<bucket>/<key>/
+        return {
+            "url": f"{storage.host.rstrip('/')}/{storage.bucket_name}/{dump_path}/",
+            "access_key": storage.access_key,
+            "secret_key": storage.secret_key,
+        }
+
+    @staticmethod
+    def _progress(client, backup_id):
+        """-> строка system.backups словарём или None (сервер перезапускался)"""
+        rows = client.execute(PROGRESS_QUERY, {"id": backup_id})
+        if not rows:
+            return None
+        keys = ("status", "error", "num_files", "total_size", "compressed_size", "files_read", "bytes_read")
+        return dict(zip(keys, rows[0]))
+
+    def _wait(self, client, backup_id):
+        """
+        Опрос system.backups до завершения операции, не дольше CLICKHOUSE_BACKUP_TIMEOUT.
+        По таймауту операция на сервере продолжается: повтор BACKUP к ней присоединится.
+        -> (progress, error)
+        """
+        deadline = time.monotonic() + settings.CLICKHOUSE_BACKUP_TIMEOUT
+        while True:
+            progress = self._progress(client, backup_id)
+            if progress is None:
+                return None, f"Backup {backup_id} is missing in system.backups"
+            if progress["status"] in FINISHED:
+                return progress, None
+            if progress["status"] not in IN_PROGRESS:
+                return None, f"{progress['status']}: {progress['error']}"
+            print(f"{progress['status']}: {progress['num_files']} files, {progress['total_size'] / MB:.1f} MB, "
+                  f"read {progress['files_read']} files, {progress['bytes_read'] / MB:.1f} MB")
+            if time.monotonic() >= deadline:
+                return None, (f"Operation {backup_id} did not finish in {settings.CLICKHOUSE_BACKUP_TIMEOUT:.0f} s "
+                              f"(CLICKHOUSE_BACKUP_TIMEOUT), it is still {progress['status']} on the server")
+            time.sleep(settings.CLICKHOUSE_POLL_INTERVAL)
+
+    def backup_to_storage(self, connection_string, storage_service, dump_path, state, save_state):
+        """
+        BACKUP ... TO S3 ASYNC в dump_path. state — {"backup_id"} прошлой попытки:
+        если тот BACKUP ещё идёт, дожидаемся его, а не запускаем второй.
+        save_state(state) сохраняет id запущенного бэкапа. -> (сжатый размер, error)
+        """
+        storage = storage_service.storage_instance
+        client = self._client(connection_string)
+        try:
+            backup_id = (state or {}).get("backup_id")
+            progress = self._progress(client, backup_id) if backup_id else None
+            if progress and progress["status"] in IN_PROGRESS | FINISHED:
+                print(f"Attach to backup {backup_id}")
+            else:
+                # Остатки прошлой попытки: в непустой путь ClickHouse бэкап не пишет
+                if not storage_service.delete_prefix(f"{dump_path}/"):
+                    return None, f"Can't clean up {dump_path}"
+                query = BACKUP_QUERY.format(on_cluster=self._on_cluster(connection_string))
+                backup_id, _ = client.execute(query, self._s3_params(storage, dump_path))[0]
+                save_state({"backup_id": backup_id})
+                print(f"Backup {backup_id} started")
+            progress, error = self._wait(client, backup_id)
+            return progress and progress["compressed_size"], error
+        except Exception as e:
+            return None, str(e)
+        finally:
+            client.disconnect()
+
+    def non_empty_tables(self, connection_string, tables=None):
+        """
+        Непустые таблицы на сервере (на всех узлах кластера), в которые RESTORE
+        не запишет; tables — {(база, таблица)} из каталога дампа, None — все.
+        -> (["база.таблица"], error)
+        """
+        cluster = self._cluster(connection_string)
+        source = f"clusterAllReplicas({quote_string(cluster)}, system.tables)" if cluster else "system.tables"
+        client = self._client(connection_string)
+        try:
+            rows = client.execute(NON_EMPTY_TABLES_QUERY.format(tables=source))
+        except Exception as e:
+            return None, str(e)
+        finally:
+            client.disconnect()
+        return [f"{database}.{name}" for database, name in rows
+                if tables is None or (database, name) in tables], None
+
+    def restore_from_storage(self, connection_string, storage_service, dump_path, tables=None, partitions=None,
+                             contents=None):
+        """
+        RESTORE ... FROM S3 ASYNC. В непустые таблицы ClickHouse не пишет, поэтому
+        они проверяются заранее (contents — {(база, таблица)} из каталога дампа):
+        есть такие — ошибка со списком, их нужно очистить или удалить. С
+        CLICKHOUSE_RESTORE_ALLOW_NON_EMPTY данные дописываются к существующим.
+        -> (прочитано байт, error)
+        """
+        restore_settings = ""
+        if settings.CLICKHOUSE_RESTORE_ALLOW_NON_EMPTY:
+            restore_settings = " SETTINGS allow_non_empty_tables = 1"
+        else:
+            non_empty, error = self.non_empty_tables(connection_string, contents)
+            if error:
+                return None, error
+            if non_empty:
+                return None, (f"RESTORE does not overwrite non-empty tables, drop or truncate them first: "
+                              f"{', '.join(non_empty)}")
+        query = RESTORE_QUERY.format(on_cluster=self._on_cluster(connection_string), settings=restore_settings)
+        client = self._client(connection_string)
+        try:
+            restore_id, _ = client.execute(
+                query, self._s3_params(storage_service.storage_instance, dump_path))[0]
+            print(f"Restore {restore_id} started")
+            progress, error = self._wait(client, restore_id)
+            return progress and progress["bytes_read"], error
+        except Exception as e:
+            return None, str(e)
+        finally:
+            client.disconnect()
@@ -1,30 +1,295 @@
+import io
+import os
+import re
+import shutil
 import subprocess
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import psycopg2
+from django.conf import settings
+
+from manager.choices import PgDumpFormatChoices
+from manager.services.compression import (MAGIC_SIZE, GzipCodec,
+                                          detect_codec, get_codec, task_codec)
+from manager.services.spool import spool_path
+from manager.services.streams import (CHUNK_SIZE, DirectoryReader,
+                                      LineFilterReader, open_decompressed,
+                                      open_process, write_directory_tar)
+
+PG_BIN = "/usr/lib/postgresql/17/bin"
+# --no-owner/--no-privileges -> не трогать владельцев/гранты
+PG_OWNERSHIP_OPTIONS = ["--no-owner", "--no-privileges"]
+# --clean   -> добавить DROP
+# --if-exists -> безопасные DROP IF EXISTS
+PG_DUMP_OPTIONS = ["--clean", "--if-exists", *PG_OWNERSHIP_OPTIONS]
+# pg_dump 17 пишет SET transaction_timeout, который старые серверы не знают
+TRANSACTION_TIMEOUT_LINE = re.compile(rb"^SET[ \t]+transaction_timeout[^\n]*\n", re.M)
+# Таблицы с данными для дампа по таблицам: обычные и секции (у секционированного
+# родителя своих данных нет), без системных схем и таблиц расширений.
+# Большие первыми — так параллельный дамп заканчивается раньше.
+TABLES_QUERY = """
+SELECT n.nspname, c.relname, c.reltuples::bigint, pg_table_size(c.oid) AS size
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r'
+  AND n.nspname <> 'information_schema' AND n.nspname NOT LIKE 'pg\\_%'
+  AND NOT EXISTS (
+    SELECT 1 FROM pg_depend d
+    WHERE d.classid = 'pg_class'::regclass AND d.objid = c.oid AND d.deptype = 'e'
+  )
+ORDER BY size DESC
+"""
+SEQUENCES_QUERY = "SELECT schemaname, sequencename, last_value FROM pg_sequences WHERE last_value IS NOT NULL"
+
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def qualified_name(schema, name):
+    return f"{quote_ident(schema)}.{quote_ident(name)}"
 
 
 class PostgresqlService:
 
+    def __init__(self, task=None):
+        self.task = task
+        self.dump_format = task.pg_dump_format if task else PgDumpFormatChoices.PLAIN
+        self.jobs = max(task.parallel_jobs, 1) if task else 1
+
+    @property
+    def is_directory_format(self):
+        return self.dump_format == PgDumpFormatChoices.DIRECTORY
+
+    @property
+    def is_per_table_format(self):
+        return self.dump_format == PgDumpFormatChoices.PER_TABLE
+
+    @property
+    def stream_extension(self):
+        return "tar" if self.is_directory_format else "sql"
+
+    @property
+    def stream_codec(self):
+        # Файлы таблиц в -Fd уже сжаты самим pg_dump
+        return None if self.is_directory_format else task_codec(self.task, get_codec("gzip"))
+
     @staticmethod
-    def check_connection(connection_string: str) -> bool:
+    def check_connection(connection_string: str, timeout=5) -> bool:
         try:
-            with psycopg2.connect(connection_string, connect_timeout=5) as conn:
+            conn = psycopg2.connect(connection_string, connect_timeout=max(int(timeout), 1))
+            try:
                 with conn.cursor() as cur:
                     cur.execute("SELECT 1")
                     cur.fetchone()
+            finally:
+                conn.close()
             return True
         except Exception:
             return False
 
+    @staticmethod
+    def estimate_size(connection_string):
+        """pg_database_size: с индексами, поэтому сверху оценивает несжатый дамп. -> (байт, error)"""
+        try:
+            conn = psycopg2.connect(connection_string, connect_timeout=5)
+        except Exception as e:
+            return None, str(e)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_database_size(current_database())")
+                return cur.fetchone()[0], None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def change_fingerprint(connection_string):
+        """
+        Позиция WAL: сдвигается при любой записи, включая DDL и последовательности,
+        и, в отличие от счётчиков pg_stat_*, без задержки сбора статистики. Запись
+        в соседние базы кластера тоже выглядит изменением — тогда просто
+        снимается обычный дамп. Запись в UNLOGGED-таблицы WAL не пишет, поэтому
+        с ними изменения не отслеживаются (error — снимается обычный дамп).
+        -> (строка, error)
+        """
+        try:
+            conn = psycopg2.connect(connection_string, connect_timeout=5)
+        except Exception as e:
+            return None, str(e)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*) FROM pg_class WHERE relpersistence = 'u' AND relkind IN ('r', 'p', 'S')")
+                unlogged = cur.fetchone()[0]
+                if unlogged:
+                    return None, f"{unlogged} unlogged tables or sequences, their changes are not in WAL"
+                cur.execute(
+                    "SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() "
+                    "ELSE pg_current_wal_lsn() END::text"
+                )
+                return cur.fetchone()[0], None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def describe_contents(connection_string):
+        """Таблицы базы для каталога содержимого дампа. -> ([{schema, table, rows, size}], error)"""
+        try:
+            conn = psycopg2.connect(connection_string, connect_timeout=5)
+        except Exception as e:
+            return None, str(e)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(TABLES_QUERY)
+                return [
+                    {"schema": schema, "table": name, "rows": rows if rows >= 0 else None, "size": size}
+                    for schema, name, rows, size in cur.fetchall()
+                ], None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def referenced_tables(connection_string):
+        """Таблицы (schema.table), на которые ссылаются внешние ключи других таблиц. -> (set, error)"""
+        try:
+            conn = psycopg2.connect(connection_string, connect_timeout=5)
+        except Exception as e:
+            return None, str(e)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT DISTINCT n.nspname, c.relname FROM pg_constraint k "
+                    "JOIN pg_class c ON c.oid = k.confrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+                    "WHERE k.contype = 'f' AND k.conrelid <> k.confrelid"
+                )
+                return {f"{schema}.{name}" for schema, name in cur.fetchall()}, None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def table_snapshot(self, connection_string):
+        """
+        Транзакция REPEATABLE READ с экспортированным снимком, открытая на время
+        дампа по таблицам: pg_dump --snapshot во всех процессах видит одно
+        состояние базы, а ACCESS SHARE не даёт удалить или изменить таблицы.
+        -> (snapshot, tables, sequences)
+        """
+        conn = psycopg2.connect(connection_string)
+        try:
+            conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_export_snapshot()")
+                snapshot = cur.fetchone()[0]
+                cur.execute(TABLES_QUERY)
+                tables = [
+                    # reltuples = -1: таблицу ещё не анализировали
+                    {"schema": schema, "name": name, "rows": rows if rows >= 0 else None, "size": size}
+                    for schema, name, rows, size in cur.fetchall()
+                ]
+                if tables:
+                    names = ", ".join(qualified_name(table["schema"], table["name"]) for table in tables)
+                    cur.execute(f"LOCK TABLE {names} IN ACCESS SHARE MODE")
+                cur.execute(SEQUENCES_QUERY)
+                sequences = [[qualified_name(schema, name), value] for schema, name, value in cur.fetchall()]
+            yield snapshot, tables, sequences
+        finally:
+            conn.close()
+
+    @staticmethod
+    def open_section_stream(connection_string, snapshot, section):
+        """pre-data (схема без индексов и ограничений) или post-data (индексы, ограничения, триггеры)."""
+        command = [
+            f"{PG_BIN}/pg_dump", connection_string, *PG_DUMP_OPTIONS,
+            f"--section={section}", f"--snapshot={snapshot}",
+        ]
+        return open_process(command, name=f"pg_dump --section={section}")
+
+    @staticmethod
+    def open_table_stream(connection_string, snapshot, schema, name):
+        """Данные одной таблицы (COPY) и значения принадлежащих ей последовательностей."""
+        command = [
+            f"{PG_BIN}/pg_dump", connection_string, "--data-only", f"--snapshot={snapshot}",
+            "-t", qualified_name(schema, name),
+        ]
+        return open_process(command, name=f"pg_dump {schema}.{name}")
+
+    def dump_space(self, estimate, streaming):
+        """
+        Место, которое займёт сам дамп: {каталог: байт}. Каталог -Fd пишется
+        на диск и при потоковой выгрузке; plain-файл — только без неё.
+        """
+        if self.is_directory_format:
+            # Таблицы в -Fd сжаты, каталог ~ сжатому дампу; без стрима рядом ещё и tar
+            return {settings.SPOOL_DIR: estimate["compressed"] * (1 if streaming else 2)}
+        return {} if streaming else {settings.SPOOL_DIR: estimate["raw"]}
+
+    def restore_space(self, artifact_path, size, raw_size, streaming):
+        """Место под распаковку артефакта перед загрузкой (сам скачанный файл не входит)."""
+        if not self.supports_stream_restore(artifact_path):
+            return {settings.SPOOL_DIR: size}
+        # Без стрима load_dump пишет рядом распакованную отфильтрованную копию
+        return {} if streaming else {settings.SPOOL_DIR: raw_size}
+
+    def _dump_directory(self, connection_string, operation_id):
+        """Параллельный pg_dump -Fd -j N в каталог."""
+        output_dir = spool_path(f"dump_{operation_id}")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        command = [
+            f"{PG_BIN}/pg_dump", connection_string, *PG_OWNERSHIP_OPTIONS,
+            "-Fd", "-j", str(self.jobs), "-f", output_dir,
+        ]
+        print(f"Выполняем команду dump (-Fd -j {self.jobs})")
+        try:
+            subprocess.run(command, check=True)
+        except (subprocess.CalledProcessError, OSError) as e:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            return None, f"Ошибка при создании дампа: {e}"
+        return output_dir, None
+
+    def open_dump_stream(self, connection_string, operation_id):
+        """
+        Поток дампа без промежуточного файла: stdout pg_dump для plain-формата.
+        Каталог -Fd в stdout не пишется, поэтому он сначала создаётся,
+        а наружу отдаётся tar-поток этого каталога.
+        """
+        if self.is_directory_format:
+            output_dir, error = self._dump_directory(connection_string, operation_id)
+            if error:
+                return None, error
+            return DirectoryReader(output_dir, write_directory_tar), None
+        pg_dump = f"{PG_BIN}/pg_dump"
+        print("Выполняем команду dump (stream)")
+        return open_process([pg_dump, connection_string, *PG_DUMP_OPTIONS], name="pg_dump")
+
     def dump_database(self, connection_string, operation_id):
-        output_file = f"/tmp/dump_{operation_id}.sql"
-        pg_dump = "/usr/lib/postgresql/17/bin/pg_dump"
-        # --clean   -> добавить DROP
-        # --if-exists -> безопасные DROP IF EXISTS
-        # --no-owner/--no-privileges -> не трогать владельцев/гранты
+        if self.is_directory_format:
+            output_dir, error = self._dump_directory(connection_string, operation_id)
+            if error:
+                return None, error
+            output_file = f"{output_dir}.tar"
+            try:
+                with open(output_file, "wb") as fileobj:
+                    write_directory_tar(output_dir, fileobj)
+            except Exception as e:
+                return None, f"Error packing dump directory: {e}"
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+            return output_file, None
+
+        output_file = spool_path(f"dump_{operation_id}.sql")
+        pg_dump = f"{PG_BIN}/pg_dump"
         command = (
             f'{pg_dump} "{connection_string}" '
-            f'--clean --if-exists --no-owner --no-privileges '
+            f'{" ".join(PG_DUMP_OPTIONS)} '
             f'-f "{output_file}"'
         )
         print("Выполняем команду dump")
@@ -34,19 +299,59 @@ class PostgresqlService:
             return None, f"Ошибка при создании дампа: {e}"
         return output_file, None
 
-    def load_dump(self, connection_string, filepath):
+    def _drop_schema_command(self, connection_string):
+        psql = f"{PG_BIN}/psql"
+        return f'{psql} "{connection_string}" -v ON_ERROR_STOP=1 -c "DROP SCHEMA public CASCADE; CREATE SCHEMA public;"'
+
+    def _load_directory_dump(self, connection_string, filepath):
+        """Распаковка tar с каталогом -Fd и параллельный pg_restore -j N."""
+        dump_dir = filepath[:-len(".tar")]
         try:
-            with open(filepath, 'r'):
-                pass
-        except FileNotFoundError:
+            shutil.rmtree(dump_dir, ignore_errors=True)
+            with tarfile.open(filepath, "r:") as tar:
+                tar.extractall(dump_dir, filter="data")
+        except Exception as e:
+            return False, f"Error extracting dump archive: {e}"
+
+        restore_cmd = [
+            f"{PG_BIN}/pg_restore", *PG_OWNERSHIP_OPTIONS, "--exit-on-error",
+            "-j", str(self.jobs), "-d", connection_string, dump_dir,
+        ]
+        try:
+            print("Drop schema...")
+            subprocess.run(self._drop_schema_command(connection_string), shell=True, check=True)
+            print(f"pg_restore -j {self.jobs}...")
+            subprocess.run(restore_cmd, check=True)
+        except subprocess.CalledProcessError as e:
+            return False, f"Ошибка при загрузке дампа: {e}"
+        except Exception as e:
+            return False, f"Неизвестная ошибка: {e}"
+        finally:
+            shutil.rmtree(dump_dir, ignore_errors=True)
+        return True, None
+
+    def load_dump(self, connection_string, filepath):
+        if not os.path.exists(filepath):
             return False, "Dump file not found"
 
-        psql = "/usr/lib/postgresql/17/bin/psql"
+        # Формат определяем по самому артефакту, а не по текущим настройкам задачи
+        if filepath.endswith(".tar"):
+            return self._load_directory_dump(connection_string, filepath)
+
+        with open(filepath, "rb") as fileobj:
+            codec = detect_codec(fileobj.read(MAGIC_SIZE))
+        if codec and codec.name != GzipCodec.name:
+            # zstd и lz4 распаковываем сами: утилит для них в образе может не быть
+            with open(filepath, "rb") as fileobj:
+                return self.load_stream(connection_string, filepath, fileobj)
+
+        psql = f"{PG_BIN}/psql"
 
-        drop_cmd = f'{psql} "{connection_string}" -v ON_ERROR_STOP=1 -c "DROP SCHEMA public CASCADE; CREATE SCHEMA public;"'
+        drop_cmd = self._drop_schema_command(connection_string)
 
         filtered = f"{filepath}.filtered"
-        sed_cmd = f"grep -v '^SET[[:space:]]\\+transaction_timeout' '{filepath}' > '{filtered}'"
+        read_cmd = f"gzip -dc '{filepath}'" if codec else f"cat '{filepath}'"
+        sed_cmd = f"{read_cmd} | grep -v '^SET[[:space:]]\\+transaction_timeout' > '{filtered}'"
 
         # 3) грузим дамп, стопимся на первой ошибке
         load_cmd = f'{psql} "{connection_string}" -v ON_ERROR_STOP=1 -f "{filtered}"'
@@ -62,4 +367,151 @@ class PostgresqlService:
             return False, f"Ошибка при загрузке дампа: {e}"
         except Exception as e:
             return False, f"Неизвестная ошибка: {e}"
+        finally:
+            if os.path.exists(filtered):
+                os.remove(filtered)
         return True, None
+
+    @staticmethod
+    def supports_stream_restore(dump_path):
+        # pg_restore -j работает только с каталогом на диске
+        return not dump_path.endswith(".tar")
+
+    def load_stream(self, connection_string, dump_path, reader):
+        """
+        Восстановление plain-дампа прямо из потока скачивания:
+        распаковка и фильтрация на лету, данные сразу идут в stdin psql.
+        Размер объекта сверяется до вызова (_open_artifact), а начало потока
+        читается и распаковывается до DROP SCHEMA: пустой или битый артефакт
+        базу не трогает. Если поток оборвётся позже (обрезан, не сошлась
+        sha256), psql останавливается, и схема public остаётся частично
+        загруженной — восстановление нужно повторить.
+        """
+        reader = self._sql_reader(reader)
+        try:
+            head = reader.read(CHUNK_SIZE)
+        except Exception as e:
+            return False, f"Ошибка при чтении дампа: {e}"
+        if not head:
+            return False, "Dump is empty"
+        try:
+            print("Drop schema...")
+            subprocess.run(self._drop_schema_command(connection_string), shell=True, check=True)
+        except subprocess.CalledProcessError as e:
+            return False, f"Ошибка при загрузке дампа: {e}"
+
+        print("Load dump (stream)...")
+        error = self._pipe_to_psql(connection_string, reader, prefix=head)
+        if error:
+            return False, error
+        return True, None
+
+    @staticmethod
+    def _sql_reader(reader):
+        """Сжатый поток артефакта -> SQL без строк, которых не знают старые серверы."""
+        return LineFilterReader(open_decompressed(reader), TRANSACTION_TIMEOUT_LINE)
+
+    @staticmethod
+    def _pipe_to_psql(connection_string, reader, prefix=b"", single_transaction=False):
+        """SQL из reader -> stdin psql, стоп на первой ошибке. -> error или None"""
+        psql = f"{PG_BIN}/psql"
+        options = ["--single-transaction"] if single_transaction else []
+        try:
+            process = subprocess.Popen(
+                [psql, connection_string, "-v", "ON_ERROR_STOP=1", *options, "-f", "-"], stdin=subprocess.PIPE)
+        except OSError as e:
+            return f"Cannot start psql: {e}"
+        error = None
+        try:
+            process.stdin.write(prefix)
+            while True:
+                chunk = reader.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            # psql завершился сам (ON_ERROR_STOP) — код ошибки получим ниже
+            pass
+        except Exception as e:
+            process.kill()
+            error = f"Ошибка при чтении дампа: {e}"
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = process.wait()
+        if error:
+            return error
+        if returncode != 0:
+            return f"Ошибка при загрузке дампа: psql exited with code {returncode}"
+        return None
+
+    def load_tables(self, connection_string, catalog, open_object, tables=None):
+        """
+        Восстановление дампа по таблицам; open_object(entry) -> (reader, error) —
+        сжатый поток объекта из каталога.
+        Целиком: схема (pre-data), данные таблиц по jobs параллельно, значения
+        последовательностей, затем индексы и ограничения (post-data).
+        Выборочно (tables — имена schema.table): только данные этих таблиц,
+        каждая в своей транзакции после TRUNCATE; схема и остальное не трогаются.
+        На таблицу, на которую ссылаются внешние ключи, TRUNCATE не пройдёт:
+        её строки удаляются DELETE с session_replication_role = replica, чтобы
+        внешние ключи и триггеры не срабатывали (как pg_restore --disable-triggers;
+        нужны права суперпользователя или SET на этот параметр). Ссылки из других
+        таблиц при этом не проверяются: они остаются верными, если восстановленные
+        строки сохранили свои ключи.
+        """
+        def load(entry, prefix=b"", single_transaction=False):
+            reader, error = open_object(entry)
+            if error:
+                return error
+            try:
+                return self._pipe_to_psql(
+                    connection_string, self._sql_reader(reader), prefix, single_transaction)
+            finally:
+                reader.close()
+
+        def load_data(entries, truncate, referenced=frozenset()):
+            def load_table(entry):
+                name = f"{entry['schema']}.{entry['name']}"
+                print(f"Load {name}...")
+                table = qualified_name(entry['schema'], entry['name'])
+                if not truncate:
+                    prefix = ""
+                elif name in referenced:
+                    prefix = f"SET LOCAL session_replication_role = replica;\nDELETE FROM ONLY {table};\n"
+                else:
+                    prefix = f"TRUNCATE ONLY {table};\n"
+                return load(entry, prefix.encode(), single_transaction=truncate)
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                return next((error for error in executor.map(load_table, entries) if error), None)
+
+        if tables is not None:
+            found = {f"{entry['schema']}.{entry['name']}": entry for entry in catalog["tables"]}
+            missing = sorted(set(tables) - set(found))
+            if missing:
+                return False, f"Tables not found in the dump: {', '.join(missing)}"
+            referenced, error = self.referenced_tables(connection_string)
+            if error:
+                return False, error
+            error = load_data([found[name] for name in tables], truncate=True, referenced=referenced)
+            return (False, error) if error else (True, None)
+
+        try:
+            print("Drop schema...")
+            subprocess.run(self._drop_schema_command(connection_string), shell=True, check=True)
+        except subprocess.CalledProcessError as e:
+            return False, f"Ошибка при загрузке дампа: {e}"
+        print("Load schema (pre-data)...")
+        error = load(catalog["pre_data"]) or load_data(catalog["tables"], truncate=False)
+        if not error and catalog["sequences"]:
+            setvals = "".join(
+                f"SELECT pg_catalog.setval('{name.replace(chr(39), chr(39) * 2)}', {value}, true);\n"
+                for name, value in catalog["sequences"]
+            )
+            error = self._pipe_to_psql(connection_string, io.BytesIO(setvals.encode()))
+        if not error:
+            print("Load indexes and constraints (post-data)...")
+            error = load(catalog["post_data"])
+        return (False, error) if error else (True, None)
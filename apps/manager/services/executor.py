@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+from django.db import connections
+
+
+def database_host_key(connection_string):
+    """host:port из строки подключения; для DSN вида key=value — сама строка."""
+    parsed = urlparse(connection_string)
+    if parsed.hostname:
+        return f"{parsed.hostname}:{parsed.port or ''}"
+    return connection_string
+
+
+@dataclass
+class Job:
+    name: str
+    func: object
+    args: tuple = ()
+    limit_keys: tuple = ()
+    # (модель, id) операции, захват которой задача продлевает, пока выполняется
+    claim: tuple = None
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: float = None
+    finished_at: float = None
+    result: object = None
+    error: str = None
+
+    @property
+    def queued_seconds(self):
+        return (self.started_at or self.finished_at or time.monotonic()) - self.submitted_at
+
+    @property
+    def executing_seconds(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class BoundedExecutor:
+    """
+    Пул потоков с глобальным лимитом и лимитами по ключам (хост БД, хранилище).
+    Задача уходит в пул, только когда свободны все её лимиты, поэтому поток
+    пула никогда не простаивает в ожидании чужого семафора.
+
+    limits: {"host": 1, "storage": 2}; limit_keys задачи: (("host", "db1:5432"), ...)
+    keep_jobs=False — для долгоживущего воркера: завершённые задачи не копятся в jobs.
+    """
+
+    def __init__(self, max_workers, limits=None, keep_jobs=True):
+        self.max_workers = max(max_workers, 1)
+        self.limits = limits or {}
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._condition = threading.Condition()
+        self._pending = []
+        self._running = 0
+        self._busy = Counter()
+        self.keep_jobs = keep_jobs
+        self.jobs = []
+
+    @property
+    def free_slots(self):
+        """Сколько задач можно взять, чтобы они не ждали в очереди пула."""
+        with self._condition:
+            return max(self.max_workers - self._running - len(self._pending), 0)
+
+    def active_jobs(self):
+        """Задачи в очереди и выполняющиеся."""
+        with self._condition:
+            return [job for job in self.jobs if job.finished_at is None]
+
+    def submit(self, name, func, *args, limit_keys=(), claim=None):
+        job = Job(name=name, func=func, args=args, limit_keys=tuple(limit_keys), claim=claim)
+        with self._condition:
+            self._pending.append(job)
+            self.jobs.append(job)
+            self._dispatch()
+        return job
+
+    def _can_start(self, job):
+        for kind, key in job.limit_keys:
+            limit = self.limits.get(kind)
+            if limit and self._busy[(kind, key)] >= limit:
+                return False
+        return True
+
+    def _dispatch(self):
+        # Вызывается под self._condition
+        for job in list(self._pending):
+            if self._running >= self.max_workers:
+                break
+            if not self._can_start(job):
+                continue
+            self._pending.remove(job)
+            self._running += 1
+            for limit_key in job.limit_keys:
+                self._busy[limit_key] += 1
+            self._pool.submit(self._run, job)
+
+    def _run(self, job):
+        job.started_at = time.monotonic()
+        try:
+            job.result = job.func(*job.args)
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            # Каждый поток держит своё подключение к БД приложения
+            connections.close_all()
+            job.finished_at = time.monotonic()
+            with self._condition:
+                self._running -= 1
+                for limit_key in job.limit_keys:
+                    self._busy[limit_key] -= 1
+                if not self.keep_jobs:
+                    self.jobs.remove(job)
+                self._dispatch()
+                self._condition.notify_all()
+
+    def wait(self, tick=None, interval=None):
+        """Дождаться всех задач; tick() вызывается раз в interval секунд, вне блокировки."""
+        while True:
+            with self._condition:
+                if not (self._pending or self._running):
+                    break
+                self._condition.wait(interval)
+            if tick:
+                tick()
+        self._pool.shutdown(wait=True)
+        return self.jobs
+
+    def summary(self):
+        lines = [f"{'job':<40} {'queued, s':>10} {'executing, s':>13}  result"]
+        for job in self.jobs:
+            result = job.error or job.result
+            lines.append(f"{job.name:<40} {job.queued_seconds:>10.1f} {job.executing_seconds:>13.1f}  {result}")
+        total_queued = sum(job.queued_seconds for job in self.jobs)
+        total_executing = sum(job.executing_seconds for job in self.jobs)
+        lines.append(f"{'total':<40} {total_queued:>10.1f} {total_executing:>13.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,131 @@
+import resource
+import time
+from contextlib import contextmanager
+
+from django.db.models import Count, JSONField, OuterRef, Subquery
+
+from manager.choices import DumpOperationStatusChoices
+from manager.models import DumpTask, DumpTaskOperation, RecoverBackupOperation
+
+MB = 1024 * 1024
+
+# Метрики этапа, которые отдаются в Prometheus: ключ в stage_metrics -> (имя, описание)
+STAGE_METRICS = {
+    "wall_seconds": ("backup_stage_wall_seconds", "Wall time of the stage"),
+    "bytes": ("backup_stage_bytes", "Bytes processed by the stage"),
+    "bytes_per_second": ("backup_stage_throughput_bytes_per_second", "Stage throughput"),
+    "thread_cpu_seconds": ("backup_stage_thread_cpu_seconds", "CPU time of the operation thread"),
+    "child_cpu_seconds": ("backup_stage_child_cpu_seconds", "CPU time of finished child processes"),
+    "estimate_bytes": ("backup_stage_estimate_bytes", "Pre-flight estimate of the artifact size"),
+}
+
+
+def _cpu_seconds(usage):
+    return usage.ru_utime + usage.ru_stime
+
+
+def _thread_usage():
+    # RUSAGE_THREAD есть только в Linux
+    return resource.getrusage(getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF))
+
+
+class StageTimer:
+    """
+    Замеры этапов операции (проверка подключения, дамп, выгрузка, очистка, ...).
+
+    На этап записывается wall time, байты (если этап их знает) и скорость,
+    CPU потока операции и завершившихся за этап дочерних процессов (pg_dump,
+    psql, clickhouse-backup). CPU детей берётся из RUSAGE_CHILDREN процесса:
+    если в пуле параллельно идут несколько операций, их дочерние процессы
+    попадают во все этапы сразу. Пиковый RSS не пишется: ru_maxrss — пик за всю
+    жизнь процесса, а не этапа (пики памяти меряют бенчмарки).
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """with timer.stage("upload") as record: ...; record["bytes"] = n"""
+        record = {"stage": name}
+        started = time.monotonic()
+        thread_before = _thread_usage()
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        try:
+            yield record
+        finally:
+            wall_seconds = time.monotonic() - started
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            record["wall_seconds"] = round(wall_seconds, 3)
+            record["thread_cpu_seconds"] = round(_cpu_seconds(_thread_usage()) - _cpu_seconds(thread_before), 3)
+            record["child_cpu_seconds"] = round(_cpu_seconds(children_after) - _cpu_seconds(children_before), 3)
+            if record.get("bytes") is not None and wall_seconds > 0:
+                record["bytes_per_second"] = round(record["bytes"] / wall_seconds)
+            self.stages.append(record)
+
+    def summary(self):
+        return ", ".join(
+            f"{record['stage']} {record['wall_seconds']:.1f}s"
+            + (f" {record['bytes_per_second'] / MB:.1f} MB/s" if "bytes_per_second" in record else "")
+            for record in self.stages
+        )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def render_prometheus():
+    """
+    Метрики в текстовом формате Prometheus: число операций по статусам и
+    замеры этапов последней завершённой операции каждой задачи.
+    """
+    # Имена, а не подписи статусов: подписи переводятся
+    statuses = {status.value: status.name.lower() for status in DumpOperationStatusChoices}
+    lines = [
+        "# HELP backup_operations Operations by kind and status",
+        "# TYPE backup_operations gauge",
+    ]
+    for kind, model in (("dump", DumpTaskOperation), ("restore", RecoverBackupOperation)):
+        counts = dict(model.objects.order_by().values_list("status").annotate(count=Count("id")))
+        for status, label in statuses.items():
+            lines.append(f"backup_operations{_labels(kind=kind, status=label)} {counts.get(status, 0)}")
+
+    samples = {key: [] for key in STAGE_METRICS}
+    last_success = []
+    finished = [DumpOperationStatusChoices.SUCCESS, DumpOperationStatusChoices.FAIL]
+
+    def last_metrics(model, task_field):
+        return Subquery(model.objects.filter(
+            **{task_field: OuterRef("pk")}, status__in=finished, stage_metrics__isnull=False,
+        ).order_by("-created_dt").values("stage_metrics")[:1], output_field=JSONField())
+
+    # Одним запросом: замеры последних операций — подзапросами по задаче
+    tasks = DumpTask.objects.annotate(
+        last_dump_metrics=last_metrics(DumpTaskOperation, "task"),
+        last_restore_metrics=last_metrics(RecoverBackupOperation, "dump_operation__task"),
+    ).order_by("id").values_list(
+        "id", "database__name", "last_success_dt", "last_dump_metrics", "last_restore_metrics")
+    for task_id, database_name, last_success_dt, dump_metrics, restore_metrics in tasks:
+        task_labels = {"task": task_id, "database": database_name}
+        for kind, stage_metrics in (("dump", dump_metrics), ("restore", restore_metrics)):
+            for record in stage_metrics or []:
+                labels = _labels(kind=kind, **task_labels, stage=record["stage"])
+                for key in STAGE_METRICS:
+                    if record.get(key) is not None:
+                        samples[key].append(f"{labels} {record[key]}")
+        if last_success_dt:
+            last_success.append(f"{_labels(**task_labels)} {last_success_dt.timestamp():.0f}")
+
+    for key, (name, description) in STAGE_METRICS.items():
+        lines.append(f"# HELP {name} {description} (last finished operation of the task)")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{sample}" for sample in samples[key])
+    lines.append("# HELP backup_last_success_timestamp_seconds Creation time of the last successful dump")
+    lines.append("# TYPE backup_last_success_timestamp_seconds gauge")
+    lines.extend(f"backup_last_success_timestamp_seconds{sample}" for sample in last_success)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,37 @@
+from manager.choices import DumpOperationStatusChoices
+from manager.models import DumpTaskOperation
+
+# Сколько последних успешных дампов задачи учитывается в оценке
+HISTORY_DEPTH = 5
+
+
+def source_bytes(operation):
+    """Размер базы, измеренный перед дампом операции (этап preflight)."""
+    for record in operation.stage_metrics or []:
+        if record["stage"] == "preflight":
+            return record.get("source_bytes")
+    return None
+
+
+def estimate_dump(task, db_interface, connection_string, operation_id):
+    """
+    Оценка дампа до его начала: размер базы по данным самой БД и то, во сколько
+    раз артефакт прошлых дампов задачи меньше базы.
+    -> {"source_bytes", "raw", "compressed"} (raw — несжатый дамп, compressed —
+       выгружаемый артефакт) или None, если оценивать не по чему.
+    """
+    size, error = db_interface.estimate_size(connection_string)
+    if error:
+        print(f"Database size estimation failed: {error}")
+    history = list(DumpTaskOperation.objects.filter(
+        task=task, status=DumpOperationStatusChoices.SUCCESS, dump_size__isnull=False,
+    ).exclude(id=operation_id).order_by("-created_dt")[:HISTORY_DEPTH])
+    ratios = [operation.dump_size / source_bytes(operation) for operation in history if source_bytes(operation)]
+    if size is not None:
+        # Худший из последних коэффициентов; без истории — как без сжатия
+        compressed = int(size * max(ratios)) if ratios else size
+        return {"source_bytes": size, "raw": max(size, compressed), "compressed": compressed}
+    if history:
+        largest = max(operation.dump_size for operation in history)
+        return {"source_bytes": None, "raw": largest, "compressed": largest}
+    return None
@@ -0,0 +1,112 @@
+import hashlib
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from manager.models import ConnectionProbe, FileStorage
+from manager.services.databases import DB_INTERFACE
+from manager.services.storage_clients import (credentials_hash,
+                                              get_s3_client,
+                                              get_yadisk_client)
+
+
+def _database_fingerprint(db):
+    return hashlib.sha256(f"{db.db_type}\0{db.connection_string}".encode()).hexdigest()
+
+
+def _check_database(db, timeout):
+    """-> error или None"""
+    if DB_INTERFACE[db.db_type].check_connection(db.connection_string, timeout=timeout):
+        return None
+    return "Database connection failed"
+
+
+def _check_storage(storage, timeout):
+    """-> error или None"""
+    if storage.type == FileStorage.TYPE_YADISK:
+        if not storage.secret_key:
+            return "Yandex Disk token is empty (secret_key)"
+        client = get_yadisk_client(storage)
+        if not client.check_token(timeout=timeout):
+            return "Yandex Disk token is invalid"
+        client.get_disk_info(timeout=timeout)
+    else:
+        get_s3_client(storage).list_buckets()
+    return None
+
+
+def _timed(check, target, timeout):
+    started = time.monotonic()
+    try:
+        error = check(target, timeout)
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    return error, (time.monotonic() - started) * 1000
+
+
+def _probe(targets, field, check, fingerprint, force):
+    """
+    Проверка объектов одного вида (баз или хранилищ). Успешные проверки моложе
+    PROBE_TTL переиспользуются, остальные идут параллельно, каждая — с таймаутом
+    PROBE_TIMEOUT. Новые результаты пишутся в историю. -> {pk: ConnectionProbe}
+    """
+    # pk только что созданной базы — UUID, прочитанной из БД — строка
+    targets = {str(target.pk): target for target in targets}
+    fingerprints = {pk: fingerprint(target) for pk, target in targets.items()}
+    results = {}
+    if not force and settings.PROBE_TTL > 0:
+        fresh = ConnectionProbe.objects.filter(
+            **{f"{field}__in": list(targets)}, ok=True,
+            created_at__gte=timezone.now() - timedelta(seconds=settings.PROBE_TTL),
+        ).order_by("-created_at")
+        for probe in fresh:
+            pk = str(getattr(probe, f"{field}_id"))
+            if pk not in results and probe.fingerprint == fingerprints[pk]:
+                probe.cached = True
+                results[pk] = probe
+    pending = [pk for pk in targets if pk not in results]
+    if not pending:
+        return {targets[pk].pk: probe for pk, probe in results.items()}
+
+    timeout = settings.PROBE_TIMEOUT
+    workers = min(settings.PROBE_CONCURRENCY, len(pending))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe")
+    futures = {pk: executor.submit(_timed, check, targets[pk], timeout) for pk in pending}
+    # Проверки идут волнами по workers штук; зависшие не держат остальных
+    wait(futures.values(), timeout=timeout * math.ceil(len(pending) / workers) + 1)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    probes = []
+    for pk, future in futures.items():
+        if future.done() and not future.cancelled():
+            error, latency_ms = future.result()
+        else:
+            error, latency_ms = f"Timed out after {timeout:g}s", None
+        probe = ConnectionProbe(
+            **{field: targets[pk]}, fingerprint=fingerprints[pk], ok=error is None,
+            latency_ms=round(latency_ms, 1) if latency_ms is not None else None, error=error,
+        )
+        probes.append(probe)
+        results[pk] = probe
+    ConnectionProbe.objects.bulk_create(probes)
+    ConnectionProbe.objects.filter(
+        created_at__lt=timezone.now() - timedelta(days=settings.PROBE_HISTORY_DAYS)).delete()
+    return {targets[pk].pk: probe for pk, probe in results.items()}
+
+
+def probe_databases(databases, force=False):
+    """-> {database.pk: ConnectionProbe}"""
+    return _probe(databases, "database", _check_database, _database_fingerprint, force)
+
+
+def probe_storages(storages, force=False):
+    """-> {storage.pk: ConnectionProbe}"""
+    return _probe(storages, "file_storage", _check_storage, credentials_hash, force)
+
+
+def probe_database(db, force=False):
+    return probe_databases([db], force)[db.pk]
@@ -0,0 +1,191 @@
+import os
+
+from django.db.models import Q
+from django.utils import timezone
+
+from manager.choices import DumpOperationStatusChoices
+from manager.models import DumpTask, DumpTaskOperation, StorageChunk
+from manager.services.chunk_store import ChunkStore, batched
+from manager.services.databases import is_server_side_backup
+from manager.services.metrics import StageTimer
+from manager.services.storage_factory import get_storage_service
+from manager.services.table_store import TableStore
+
+
+def discard_upload(operation, storage_service):
+    """
+    Бросает недокачанную resumable-выгрузку операции: отменяет multipart-загрузку
+    (её части иначе хранятся и оплачиваются) и удаляет файл дампа из SPOOL_DIR.
+    """
+    if operation.upload_state and hasattr(storage_service, "abort_upload"):
+        storage_service.abort_upload(operation.upload_state)
+    if operation.local_dump_path and os.path.exists(operation.local_dump_path):
+        os.remove(operation.local_dump_path)
+    operation.upload_state = None
+    operation.local_dump_path = None
+    operation.save(update_fields=["upload_state", "local_dump_path", "updated_dt"])
+
+
+class RetentionService:
+    """
+    Очистка старых дампов задачи, отдельно от самого дампа.
+
+    Оставляем max_dumpfiles_keep последних и, по GFS, самый новый дамп за каждый
+    из keep_daily дней, keep_weekly недель и keep_monthly месяцев, а также базы
+    оставленных инкрементов. Остальное удаляется пакетами; то, что удалить
+    не удалось, помечается DELETE_PENDING и повторяется при следующей очистке.
+    Артефакт, общий для нескольких операций, удаляется вместе с последней из них.
+    Недокачанные выгрузки упавших дампов, после которых уже был успешный,
+    бросаются: такую операцию повторять незачем.
+    """
+
+    def __init__(self, task):
+        self.task = task
+
+    @staticmethod
+    def _keep_newest_per_period(rows, count, period_key):
+        keep = set()
+        periods = set()
+        for operation_id, created_dt, _ in rows:
+            if len(periods) >= count:
+                break
+            period = period_key(timezone.localtime(created_dt))
+            if period not in periods:
+                periods.add(period)
+                keep.add(operation_id)
+        return keep
+
+    def _select_keep(self, rows, base_ids):
+        keep_seeds = {operation_id for operation_id, _, _ in rows[:self.task.max_dumpfiles_keep or 0]}
+        keep_seeds |= self._keep_newest_per_period(
+            rows, self.task.keep_daily, lambda dt: dt.date())
+        keep_seeds |= self._keep_newest_per_period(
+            rows, self.task.keep_weekly, lambda dt: dt.isocalendar()[:2])
+        keep_seeds |= self._keep_newest_per_period(
+            rows, self.task.keep_monthly, lambda dt: (dt.year, dt.month))
+        # Базы операций, которые сейчас (пере)выполняются
+        keep_seeds |= set(DumpTaskOperation.objects.filter(
+            task=self.task, base_operation__isnull=False,
+        ).exclude(
+            status__in=[DumpOperationStatusChoices.SUCCESS, DumpOperationStatusChoices.DELETE_PENDING],
+        ).values_list("base_operation_id", flat=True))
+        return self._with_bases(keep_seeds, base_ids)
+
+    @staticmethod
+    def _with_bases(operation_ids, base_ids):
+        """Операции вместе со всеми их базами (без баз инкремент не восстановить)."""
+        result = set()
+        for operation_id in operation_ids:
+            while operation_id and operation_id not in result:
+                result.add(operation_id)
+                operation_id = base_ids.get(operation_id)
+        return result
+
+    def _delete_artifacts(self, paths):
+        """-> множество путей, которые удалить не удалось"""
+        storage = self.task.file_storage
+        storage_service = get_storage_service(storage)
+        manifests = [path for path in paths if ChunkStore.is_manifest(path)]
+        catalogs = [path for path in paths if TableStore.is_catalog(path)]
+        server_side = [path for path in paths if is_server_side_backup(path)]
+        files = [
+            path for path in paths
+            if not ChunkStore.is_manifest(path) and not TableStore.is_catalog(path) and path not in server_side
+        ]
+        failed = set(storage_service.delete_dumps(files)) if files else set()
+        # Бэкап серверного движка ClickHouse — все объекты под его префиксом
+        failed |= {path for path in server_side if not storage_service.delete_prefix(f"{path}/")}
+        if catalogs:
+            table_store = TableStore(storage_service)
+            failed |= {path for path in catalogs if not table_store.delete(path)}
+        if manifests or StorageChunk.objects.filter(file_storage=storage, refcount=0).exists():
+            chunk_store = ChunkStore(storage_service, storage)
+            failed |= {path for path in manifests if not chunk_store.delete(path)}
+            chunk_store.collect_garbage()
+        return failed
+
+    def _discard_abandoned_uploads(self):
+        latest = DumpTaskOperation.objects.filter(
+            task=self.task, status=DumpOperationStatusChoices.SUCCESS,
+        ).order_by("-created_dt").values_list("created_dt", flat=True).first()
+        if not latest:
+            return
+        abandoned = DumpTaskOperation.objects.filter(
+            Q(upload_state__isnull=False) | Q(local_dump_path__isnull=False),
+            task=self.task, status=DumpOperationStatusChoices.FAIL, created_dt__lt=latest,
+        ).only("id", "upload_state", "local_dump_path")
+        storage_service = None
+        for operation in abandoned:
+            storage_service = storage_service or get_storage_service(self.task.file_storage)
+            discard_upload(operation, storage_service)
+            print(f"Task {self.task.id}: abandoned upload of operation {operation.id} discarded")
+
+    def prune(self):
+        """-> (число удалённых операций, число отложенных)"""
+        self._discard_abandoned_uploads()
+        rows = list(DumpTaskOperation.objects.filter(
+            task=self.task,
+            status=DumpOperationStatusChoices.SUCCESS,
+        ).order_by("-created_dt").values_list("id", "created_dt", "base_operation_id"))
+        pending = list(DumpTaskOperation.objects.filter(
+            task=self.task,
+            status=DumpOperationStatusChoices.DELETE_PENDING,
+        ).values_list("id", "base_operation_id"))
+
+        base_ids = {operation_id: base_id for operation_id, _, base_id in rows}
+        base_ids.update(pending)
+        keep_ids = self._select_keep(rows, base_ids)
+        candidates = {operation_id for operation_id, _, _ in rows if operation_id not in keep_ids}
+        candidates |= {operation_id for operation_id, _ in pending}
+        if not candidates:
+            return 0, 0
+
+        paths = {}
+        for batch in batched(candidates):
+            paths.update(DumpTaskOperation.objects.filter(id__in=batch).values_list("id", "dump_path"))
+        candidate_paths = {path for path in paths.values() if path}
+        # Артефакт, на который ещё ссылаются оставшиеся операции (дамп без изменений), не удаляется
+        shared_paths = set()
+        for batch in batched(candidate_paths):
+            shared_paths.update(
+                path for operation_id, path in DumpTaskOperation.objects.filter(
+                    task=self.task, dump_path__in=batch).values_list("id", "dump_path")
+                if operation_id not in candidates
+            )
+        failed_paths = self._delete_artifacts(candidate_paths - shared_paths)
+
+        # Не удалился файл — оставляем строку (и её базы: на них ссылается FK) до следующей очистки
+        failed_ids = {operation_id for operation_id, path in paths.items() if path in failed_paths}
+        blocked_ids = self._with_bases(failed_ids, base_ids) & candidates
+        deletable_ids = candidates - blocked_ids
+        # Сначала инкременты, потом базы: глубина в цепочке у инкремента всегда больше
+        deletable_ids = sorted(
+            deletable_ids, key=lambda operation_id: len(self._with_bases([operation_id], base_ids)), reverse=True)
+        for batch in batched(deletable_ids):
+            DumpTaskOperation.objects.filter(id__in=batch).delete()
+        for batch in batched(blocked_ids):
+            DumpTaskOperation.objects.filter(id__in=batch).update(
+                status=DumpOperationStatusChoices.DELETE_PENDING)
+        if blocked_ids:
+            print(f"Task {self.task.id}: {len(blocked_ids)} dumps will be deleted on the next pruning")
+        return len(deletable_ids), len(blocked_ids)
+
+
+def prune_task(task_id, operation_id=None):
+    """
+    Точка входа для пула/команд: очистка по id задачи. -> краткий итог
+    operation_id — дамп, после которого запущена очистка: её замер
+    добавляется этапом "retention" в его stage_metrics.
+    """
+    task = DumpTask.objects.filter(id=task_id).select_related("file_storage").first()
+    if not task:
+        return f"Task {task_id} doesn't exist"
+    timer = StageTimer()
+    with timer.stage("retention") as record:
+        deleted, postponed = RetentionService(task).prune()
+        record["deleted"] = deleted
+    operation = DumpTaskOperation.objects.filter(id=operation_id).first() if operation_id else None
+    if operation:
+        operation.stage_metrics = (operation.stage_metrics or []) + timer.stages
+        operation.save(update_fields=["stage_metrics", "updated_dt"])
+    return f"pruned {deleted}, postponed {postponed}"
@@ -0,0 +1,41 @@
+import os
+import shutil
+
+from django.conf import settings
+
+GB = 1024 ** 3
+
+
+def spool_path(name):
+    """Путь временного файла/каталога на томе SPOOL_DIR."""
+    return os.path.join(settings.SPOOL_DIR, name)
+
+
+def _existing_parent(path):
+    # Каталог может быть ещё не создан: место считаем по ближайшему существующему родителю
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+
+def check_space(*requirements):
+    """
+    requirements: словари {каталог: байт}. Всё, что попадает на один том,
+    суммируется, к сумме добавляется запас SPOOL_HEADROOM. -> error или None
+    """
+    volumes = {}
+    for directory, needed in (item for requirement in requirements for item in requirement.items()):
+        if not needed:
+            continue
+        path = _existing_parent(directory)
+        volume = volumes.setdefault(os.stat(path).st_dev, {"paths": [], "needed": 0, "path": path})
+        volume["paths"].append(directory)
+        volume["needed"] += needed
+    for volume in volumes.values():
+        needed = int(volume["needed"] * settings.SPOOL_HEADROOM)
+        free = shutil.disk_usage(volume["path"]).free
+        if needed > free:
+            return (f"Not enough free space in {', '.join(volume['paths'])}: "
+                    f"need ~{needed / GB:.1f} GB, free {free / GB:.1f} GB")
+    return None
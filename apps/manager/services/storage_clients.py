@@ -0,0 +1,98 @@
+import hashlib
+import threading
+
+import boto3
+import yadisk
+from botocore.config import Config
+from django.conf import settings
+
+# Процессный кэш клиентов хранилищ: (storage_id, хэш реквизитов) -> клиент.
+# boto3-клиенты потокобезопасны, так что один клиент обслуживает все
+# параллельные передачи воркера.
+_clients = {}
+_lock = threading.Lock()
+
+
+class RemoteState:
+    """
+    Что процесс уже знает о хранилище: созданные каталоги и метаданные
+    (размер, md5) выгруженных файлов. Экономит запросы exists/get_meta.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dirs = set()
+        self.files = {}
+
+    def add_dir(self, path):
+        with self.lock:
+            self.dirs.add(path)
+
+    def has_dir(self, path):
+        with self.lock:
+            return path in self.dirs
+
+    def set_file(self, path, size, md5):
+        with self.lock:
+            self.files[path] = (size, md5)
+
+    def get_file(self, path):
+        with self.lock:
+            return self.files.get(path)
+
+    def forget_file(self, path):
+        with self.lock:
+            self.files.pop(path, None)
+
+
+def credentials_hash(storage):
+    fields = (storage.type, storage.host, storage.bucket_name, storage.access_key, storage.secret_key)
+    return hashlib.sha256("\0".join(str(field or "") for field in fields).encode()).hexdigest()
+
+
+def _get_or_create(storage, kind, factory):
+    key = (kind, storage.pk, credentials_hash(storage))
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # Реквизиты поменялись — старые клиенты этого хранилища больше не нужны
+            _drop(storage.pk, keep_hash=key[2])
+            client = _clients[key] = factory()
+        return client
+
+
+def _drop(storage_id, keep_hash=None):
+    for key in [key for key in _clients if key[1] == storage_id and key[2] != keep_hash]:
+        client = _clients.pop(key)
+        if hasattr(client, "close"):
+            try:
+                client.close()
+            except Exception:
+                pass
+
+
+def get_s3_client(storage):
+    def factory():
+        # Своя сессия: boto3.client() по умолчанию делит глобальную, не потокобезопасную
+        session = boto3.session.Session()
+        return session.client(
+            's3',
+            endpoint_url=storage.host,
+            aws_access_key_id=storage.access_key,
+            aws_secret_access_key=storage.secret_key,
+            config=Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS),
+        )
+    return _get_or_create(storage, "s3", factory)
+
+
+def get_yadisk_client(storage):
+    return _get_or_create(storage, "yadisk", lambda: yadisk.YaDisk(token=storage.secret_key))
+
+
+def get_remote_state(storage):
+    return _get_or_create(storage, "state", RemoteState)
+
+
+def invalidate(storage_id):
+    with _lock:
+        _drop(storage_id)
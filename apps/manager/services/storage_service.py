@@ -1,29 +1,93 @@
-import boto3
+import hashlib
+import io
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
 import yadisk
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import (ClientError, NoCredentialsError,
+                                 PartialCredentialsError)
+
+from manager.services.spool import spool_path
+from manager.services.storage_clients import (get_remote_state,
+                                              get_s3_client,
+                                              get_yadisk_client)
+from manager.services.streams import CHUNK_SIZE, RangeReader, RateLimiter
+
+MB = 1024 * 1024
+# Минимальный размер части multipart-загрузки в S3 (кроме последней)
+MIN_PART_SIZE = 5 * MB
+# Максимум частей в одной multipart-загрузке S3
+MAX_PARTS = 10000
+# Лимит S3 DeleteObjects на один запрос
+DELETE_BATCH_SIZE = 1000
+# Яндекс.Диск: попытки выгрузки файла и параллельные удаления
+YADISK_UPLOAD_ATTEMPTS = 3
+YADISK_DELETE_CONCURRENCY = 8
+
+
+def is_not_found(error):
+    """Ошибка get_object/put_object — «объекта нет» (S3 NoSuchKey/404, Яндекс.Диск PathNotFound)."""
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404")
+    return isinstance(error, yadisk.exceptions.PathNotFoundError)
+
+
+def artifact_extension(filepath):
+    """dump_<id>.tar.zst -> tar.zst: расширение целиком, чтобы не потерять формат."""
+    return os.path.basename(filepath).split(".", 1)[-1]
 
 
 class S3StorageSerivce:
+    supports_streaming = True
+
     def __init__(self, storage_instance):
         self.storage_instance = storage_instance
         self.s3 = None
 
     def _connect(self):
-        self.s3 = boto3.client(
-            's3',
-            endpoint_url=self.storage_instance.host,
-            aws_access_key_id=self.storage_instance.access_key,
-            aws_secret_access_key=self.storage_instance.secret_key,
+        # Клиент берётся из процессного кэша: без новой сессии и TLS-рукопожатия
+        self.s3 = get_s3_client(self.storage_instance)
+
+    @property
+    def part_size(self):
+        return max(self.storage_instance.multipart_chunk_size_mb * MB, MIN_PART_SIZE)
+
+    def part_size_for(self, size):
+        """Размер части под файл: настроенный, но не больше MAX_PARTS частей на файл."""
+        return max(self.part_size, math.ceil(size / MAX_PARTS / MB) * MB)
+
+    @property
+    def concurrency(self):
+        return max(self.storage_instance.max_concurrency, 1)
+
+    @property
+    def bandwidth(self):
+        """Лимит скорости в байт/с; None — без ограничения."""
+        return self.storage_instance.max_bandwidth_mb * MB or None
+
+    def _transfer_config(self):
+        config = TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.concurrency,
+            max_bandwidth=self.bandwidth,
         )
+        # Потоковая выгрузка держит в памяти не больше (concurrency + 2) частей
+        config.max_in_memory_upload_chunks = self.concurrency + 2
+        return config
 
     def upload_dump(self, filepath, operation_id):
         error = None
         s3_file_path = None
-        fileformat = filepath.split(".")[-1]
+        fileformat = artifact_extension(filepath)
         try:
             self._connect()
             key = f'dumps/{operation_id}.{fileformat}'
-            self.s3.upload_file(filepath, self.storage_instance.bucket_name, key)
+            self.s3.upload_file(filepath, self.storage_instance.bucket_name, key, Config=self._transfer_config())
             s3_file_path = key
         except FileNotFoundError:
             error = "File not found"
@@ -33,6 +97,122 @@ class S3StorageSerivce:
             error = str(e)
         return s3_file_path, error
 
+    def upload_stream(self, reader, operation_id, extension):
+        """
+        Multipart-выгрузка из file-like объекта (pipe pg_dump -> компрессор),
+        без промежуточного файла и с ограниченным расходом памяти.
+        """
+        error = None
+        s3_file_path = None
+        try:
+            self._connect()
+            key = f'dumps/{operation_id}.{extension}'
+            self.s3.upload_fileobj(
+                reader, self.storage_instance.bucket_name, key, Config=self._transfer_config())
+            s3_file_path = key
+        except (NoCredentialsError, PartialCredentialsError):
+            error = "Credentials are not valid"
+        except Exception as e:
+            error = str(e)
+        return s3_file_path, error
+
+    def _uploaded_parts(self, key, upload_id):
+        """Части, которые S3 уже принял: {номер: ETag}. None — загрузки больше нет."""
+        parts = {}
+        try:
+            paginator = self.s3.get_paginator("list_parts")
+            for page in paginator.paginate(
+                    Bucket=self.storage_instance.bucket_name, Key=key, UploadId=upload_id):
+                for part in page.get("Parts", []):
+                    parts[part["PartNumber"]] = part["ETag"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+                return None
+            raise
+        return parts
+
+    def _upload_part(self, filepath, key, upload_id, part_number, part_size, limiter):
+        with open(filepath, "rb") as fileobj:
+            fileobj.seek((part_number - 1) * part_size)
+            data = fileobj.read(part_size)
+        limiter.consume(len(data))
+        response = self.s3.upload_part(
+            Bucket=self.storage_instance.bucket_name, Key=key, UploadId=upload_id,
+            PartNumber=part_number, Body=data,
+        )
+        return part_number, response["ETag"]
+
+    def upload_resumable(self, filepath, operation_id, state, save_state):
+        """
+        Multipart-выгрузка файла, которую можно продолжить после сбоя.
+
+        state — {"upload_id", "key", "part_size", "parts": {номер: ETag}} с прошлой
+        попытки (или пустой); save_state(state) вызывается после создания загрузки
+        и после каждой принятой части, чтобы следующая попытка докачала только
+        недостающие части. -> (path, error)
+        """
+        fileformat = artifact_extension(filepath)
+        key = f'dumps/{operation_id}.{fileformat}'
+        bucket = self.storage_instance.bucket_name
+        try:
+            self._connect()
+            size = os.path.getsize(filepath)
+            parts = None
+            if state and state.get("upload_id") and state.get("key") == key:
+                if math.ceil(size / state["part_size"]) > MAX_PARTS:
+                    # Состояние с частями меньше допустимого для этого файла — начинаем заново
+                    self.abort_upload(state)
+                else:
+                    parts = self._uploaded_parts(key, state["upload_id"])
+            if parts is None:
+                upload_id = self.s3.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+                state = {"upload_id": upload_id, "key": key, "part_size": self.part_size_for(size), "parts": {}}
+                save_state(state)
+            else:
+                # Источник истины — S3: сохранённые ETag могли не успеть записаться
+                state["parts"] = {str(number): etag for number, etag in parts.items()}
+                print(f"Resuming upload {key}: {len(parts)} parts already uploaded")
+
+            upload_id = state["upload_id"]
+            part_size = state["part_size"]
+            total_parts = max(math.ceil(size / part_size), 1)
+            missing = [number for number in range(1, total_parts + 1) if str(number) not in state["parts"]]
+            limiter = RateLimiter(self.bandwidth)
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = [
+                    executor.submit(self._upload_part, filepath, key, upload_id, number, part_size, limiter)
+                    for number in missing
+                ]
+                for future in as_completed(futures):
+                    number, etag = future.result()
+                    state["parts"][str(number)] = etag
+                    save_state(state)
+
+            self.s3.complete_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={"Parts": [
+                    {"PartNumber": number, "ETag": state["parts"][str(number)]}
+                    for number in range(1, total_parts + 1)
+                ]},
+            )
+        except FileNotFoundError:
+            return None, "File not found"
+        except (NoCredentialsError, PartialCredentialsError):
+            return None, "Credentials are not valid"
+        except Exception as e:
+            return None, str(e)
+        return key, None
+
+    def abort_upload(self, state):
+        """Отмена незавершённой multipart-загрузки (части иначе хранятся и оплачиваются)."""
+        try:
+            self._connect()
+            self.s3.abort_multipart_upload(
+                Bucket=self.storage_instance.bucket_name, Key=state["key"], UploadId=state["upload_id"])
+        except Exception:
+            return False
+        return True
+
     def delete_dump(self, filepath):
         try:
             self._connect()
@@ -41,15 +221,66 @@ class S3StorageSerivce:
             return False
         return True
 
+    def delete_dumps(self, filepaths):
+        """Пакетное удаление через DeleteObjects. -> список путей, которые удалить не удалось"""
+        failed = []
+        filepaths = list(filepaths)
+        try:
+            self._connect()
+        except Exception:
+            return filepaths
+        for start in range(0, len(filepaths), DELETE_BATCH_SIZE):
+            batch = filepaths[start:start + DELETE_BATCH_SIZE]
+            try:
+                response = self.s3.delete_objects(
+                    Bucket=self.storage_instance.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+            except Exception as e:
+                print(f"Delete batch failed: {e}")
+                failed.extend(batch)
+                continue
+            failed.extend(error["Key"] for error in response.get("Errors", []))
+        return failed
+
+    def delete_prefix(self, prefix):
+        """Все объекты под префиксом (нативный бэкап ClickHouse — «каталог»). -> удалось ли"""
+        try:
+            self._connect()
+            paginator = self.s3.get_paginator("list_objects_v2")
+            keys = [
+                item["Key"]
+                for page in paginator.paginate(Bucket=self.storage_instance.bucket_name, Prefix=prefix)
+                for item in page.get("Contents", [])
+            ]
+        except Exception:
+            return False
+        return not self.delete_dumps(keys)
+
+    @staticmethod
+    def object_path(key):
+        return key
+
+    # Небольшие объекты целиком (чанки, манифесты); ошибки пробрасываются
+    def put_object(self, key, data):
+        self._connect()
+        self.s3.put_object(Bucket=self.storage_instance.bucket_name, Key=key, Body=data)
+        return key
+
+    def get_object(self, key):
+        self._connect()
+        return self.s3.get_object(Bucket=self.storage_instance.bucket_name, Key=key)["Body"].read()
+
     def download_dump(self, s3_file_path):
         filename = s3_file_path.split("/")[-1]
-        local_filepath = f"/tmp/{filename}"
+        local_filepath = spool_path(filename)
         try:
             self._connect()
             self.s3.download_file(
                 Bucket=self.storage_instance.bucket_name,
                 Key=s3_file_path,
-                Filename=local_filepath
+                Filename=local_filepath,
+                Config=self._transfer_config(),
             )
         except getattr(self.s3, "exceptions", object()).__dict__.get("NoSuchKey", Exception) as _:  # noqa
             return None, "File not found in S3"
@@ -59,50 +290,201 @@ class S3StorageSerivce:
             return None, str(e)
         return local_filepath, None
 
+    def open_stream(self, s3_file_path):
+        """Чтение объекта параллельными ranged GET без сохранения на диск."""
+        try:
+            self._connect()
+            head = self.s3.head_object(Bucket=self.storage_instance.bucket_name, Key=s3_file_path)
+        except (NoCredentialsError, PartialCredentialsError):
+            return None, "Credentials are not valid"
+        except Exception as e:
+            return None, str(e)
+
+        def fetch_range(start, end):
+            response = self.s3.get_object(
+                Bucket=self.storage_instance.bucket_name,
+                Key=s3_file_path,
+                Range=f"bytes={start}-{end}",
+            )
+            return response["Body"].read()
+
+        return RangeReader(fetch_range, head["ContentLength"], concurrency=self.concurrency), None
+
 
 class YandexDiskStorageSerivce:
     """
     Использует secret_key как OAuth-токен.
     Кладём в /dumps/<operation_id>.<ext>
+
+    Созданные каталоги и метаданные выгруженных файлов кэшируются на процесс
+    (RemoteState), поэтому лишних exists перед каждой операцией нет.
     """
+    supports_streaming = True
 
     def __init__(self, storage_instance):
         self.storage_instance = storage_instance
         if not self.storage_instance.secret_key:
             raise RuntimeError("Yandex Disk OAuth token is empty (use secret_key)")
-        self._y = yadisk.YaDisk(token=self.storage_instance.secret_key)
+        self._y = get_yadisk_client(self.storage_instance)
+        self._state = get_remote_state(self.storage_instance)
+
+    def _ensure_dir(self, directory):
+        if not directory or self._state.has_dir(directory):
+            return
+        try:
+            self._y.mkdir(directory)
+        except (yadisk.exceptions.DirectoryExistsError, yadisk.exceptions.PathExistsError):
+            pass
+        self._state.add_dir(directory)
+
+    def _remote_meta(self, remote_path):
+        """(size, md5) файла на диске: из кэша или одним get_meta. None — файла нет."""
+        cached = self._state.get_file(remote_path)
+        if cached:
+            return cached
+        try:
+            meta = self._y.get_meta(remote_path, fields=["size", "md5"])
+        except yadisk.exceptions.PathNotFoundError:
+            return None
+        self._state.set_file(remote_path, meta.size, meta.md5)
+        return meta.size, meta.md5
+
+    @staticmethod
+    def _file_md5(filepath):
+        digest = hashlib.md5()
+        with open(filepath, "rb") as fileobj:
+            for block in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                digest.update(block)
+        return digest.hexdigest()
 
     def upload_dump(self, filepath, operation_id):
-        error = None
-        remote_path = None
-        fileformat = filepath.split(".")[-1]
-        try:
-            base = "/dumps"
-            if not self._y.exists(base):
-                self._y.mkdir(base)
-            remote_path = f"{base}/{operation_id}.{fileformat}"
-            self._y.upload(filepath, remote_path)
+        """
+        Выгрузка файла с повторами. Перед повтором проверяем, не дошёл ли файл
+        целиком (ответ мог потеряться): совпали размер и md5 — повтор не нужен.
+        """
+        fileformat = artifact_extension(filepath)
+        base = "/dumps"
+        remote_path = f"{base}/{operation_id}.{fileformat}"
+        try:
+            size = os.path.getsize(filepath)
+            self._ensure_dir(base)
         except FileNotFoundError:
-            error = "File not found"
+            return None, "File not found"
         except Exception as e:
-            error = str(e)
-        return remote_path, error
+            return None, str(e)
+
+        local_md5 = None
+        error = None
+        for attempt in range(1, YADISK_UPLOAD_ATTEMPTS + 1):
+            try:
+                if attempt > 1:
+                    self._state.forget_file(remote_path)
+                    local_md5 = local_md5 or self._file_md5(filepath)
+                    if self._remote_meta(remote_path) == (size, local_md5):
+                        print(f"{remote_path} is already uploaded")
+                        return remote_path, None
+                # Повторами управляем сами, чтобы перед ними проверить уже выгруженное
+                self._y.upload(filepath, remote_path, overwrite=True, n_retries=0)
+                self._state.forget_file(remote_path)
+                return remote_path, None
+            except Exception as e:
+                error = str(e)
+                print(f"Upload attempt {attempt} of {remote_path} failed: {error}")
+                if attempt < YADISK_UPLOAD_ATTEMPTS:
+                    time.sleep(2 ** attempt)
+        return None, error
+
+    def upload_stream(self, reader, operation_id, extension):
+        """
+        Выгрузка из pipe одним PUT с chunked transfer encoding, без локального файла.
+        Размер и md5 считаются по ходу и сверяются с тем, что записал диск.
+        Поток не перечитать, поэтому повтор — на уровне операции.
+        """
+        base = "/dumps"
+        remote_path = f"{base}/{operation_id}.{extension}"
+        digest = hashlib.md5()
+        written = [0]
+
+        def body():
+            while True:
+                data = reader.read(CHUNK_SIZE)
+                if not data:
+                    return
+                digest.update(data)
+                written[0] += len(data)
+                yield data
+
+        try:
+            self._ensure_dir(base)
+            # Без повторов внутри yadisk: повтор перечитал бы уже вычитанный pipe
+            self._y.upload(body, remote_path, overwrite=True, n_retries=0)
+            self._state.forget_file(remote_path)
+            size, md5 = self._remote_meta(remote_path) or (None, None)
+        except Exception as e:
+            return None, str(e)
+        if size != written[0] or (md5 and md5 != digest.hexdigest()):
+            self.delete_dump(remote_path)
+            return None, "Uploaded file doesn't match the stream (size or md5)"
+        return remote_path, None
 
     def delete_dump(self, filepath):
         try:
-            if self._y.exists(filepath):
-                self._y.remove(filepath, permanently=True)
-            return True
+            self._y.remove(filepath, permanently=True)
+        except yadisk.exceptions.PathNotFoundError:
+            pass
         except Exception:
             return False
+        self._state.forget_file(filepath)
+        return True
+
+    def delete_dumps(self, filepaths):
+        """Параллельное удаление. -> список путей, которые удалить не удалось"""
+        filepaths = list(filepaths)
+        with ThreadPoolExecutor(max_workers=YADISK_DELETE_CONCURRENCY) as executor:
+            results = executor.map(self.delete_dump, filepaths)
+            return [filepath for filepath, deleted in zip(filepaths, results) if not deleted]
+
+    @staticmethod
+    def object_path(key):
+        return "/" + key.lstrip("/")
+
+    # Небольшие объекты целиком (чанки, манифесты); ошибки пробрасываются
+    def put_object(self, key, data):
+        remote_path = self.object_path(key)
+        self._ensure_dir(remote_path.rsplit("/", 1)[0])
+        self._y.upload(io.BytesIO(data), remote_path, overwrite=True)
+        return remote_path
+
+    def get_object(self, key):
+        buffer = io.BytesIO()
+        self._y.download(self.object_path(key), buffer)
+        return buffer.getvalue()
 
     def download_dump(self, remote_path):
         filename = remote_path.split("/")[-1]
-        local_filepath = f"/tmp/{filename}"
+        local_filepath = spool_path(filename)
         try:
-            if not self._y.exists(remote_path):
-                return None, "File not found in Yandex Disk"
             self._y.download(remote_path, local_filepath)
+        except yadisk.exceptions.PathNotFoundError:
+            return None, "File not found in Yandex Disk"
         except Exception as e:
             return None, str(e)
         return local_filepath, None
+
+    def open_stream(self, remote_path):
+        """Чтение файла параллельными ranged GET по ссылке на скачивание."""
+        try:
+            meta = self._remote_meta(remote_path)
+            if meta is None:
+                return None, "File not found in Yandex Disk"
+            link = self._y.get_download_link(remote_path)
+        except Exception as e:
+            return None, str(e)
+
+        def fetch_range(start, end):
+            response = requests.get(link, headers={"Range": f"bytes={start}-{end}"}, timeout=60)
+            if response.status_code != 206:
+                raise IOError(f"Ranged download failed: HTTP {response.status_code}")
+            return response.content
+
+        return RangeReader(fetch_range, meta[0]), None
@@ -0,0 +1,439 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from manager.services.compression import MAGIC_SIZE, detect_codec
+
+# Размер блока, которым читаем из дочерних процессов и сетевых потоков
+CHUNK_SIZE = 1024 * 1024
+# Параллельное скачивание: размер одного ranged GET и число одновременных запросов
+RANGE_PART_SIZE = 16 * 1024 * 1024
+RANGE_CONCURRENCY = 4
+RANGE_ATTEMPTS = 3
+
+
+class ProcessReader:
+    """
+    File-like обёртка над stdout дочернего процесса.
+    Ошибку процесса (ненулевой код выхода) возвращает close().
+    """
+
+    def __init__(self, args, name=None):
+        self.name = name or args[0]
+        self.process = subprocess.Popen(args, stdout=subprocess.PIPE)
+        self._eof = False
+
+    def read(self, size=-1):
+        data = self.process.stdout.read(size)
+        if not data and size != 0:
+            self._eof = True
+        return data
+
+    def close(self):
+        if not self._eof:
+            # Поток дочитан не до конца (ошибка выгрузки) — процесс больше не нужен
+            self.process.kill()
+        self.process.stdout.close()
+        returncode = self.process.wait()
+        if not self._eof:
+            return f"{self.name} was interrupted"
+        if returncode != 0:
+            return f"{self.name} exited with code {returncode}"
+        return None
+
+
+def open_process(args, name=None):
+    """ProcessReader или ошибка запуска (нет бинарника, нет прав). -> (reader, error)"""
+    try:
+        return ProcessReader(args, name), None
+    except OSError as e:
+        return None, f"Cannot start {name or args[0]}: {e}"
+
+
+class CompressingReader:
+    """
+    File-like обёртка: читает source и отдаёт сжатые codec'ом данные.
+    Считает несжатые байты, время сжатия и время внутри read() (источник
+    и сжатие): остальное время конвейера уходит на выгрузку.
+    """
+
+    def __init__(self, source, codec, chunk_size=CHUNK_SIZE):
+        self.source = source
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self._compressor = codec.compressor()
+        self._buffer = bytearray()
+        self._eof = False
+        self.raw_bytes = 0
+        self.compress_seconds = 0.0
+        self.read_seconds = 0.0
+
+    def _fill(self, size):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self.source.read(self.chunk_size)
+            started = time.monotonic()
+            if not chunk:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+            else:
+                self.raw_bytes += len(chunk)
+                self._buffer += self._compressor.compress(chunk)
+            self.compress_seconds += time.monotonic() - started
+
+    def read(self, size=-1):
+        started = time.monotonic()
+        self._fill(size)
+        self.read_seconds += time.monotonic() - started
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+
+class ProducerReader:
+    """
+    File-like объект, данные в который пишет producer(fileobj) в фоновом потоке
+    через pipe. Нужен, когда источник сам умеет только писать (tarfile, zipfile).
+    Ошибку producer'а возвращает close().
+    """
+
+    def __init__(self, producer):
+        read_fd, write_fd = os.pipe()
+        self._reader = os.fdopen(read_fd, "rb")
+        self._writer = os.fdopen(write_fd, "wb")
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(producer,), daemon=True)
+        self._thread.start()
+
+    def _run(self, producer):
+        try:
+            producer(self._writer)
+        except Exception as e:
+            self._error = str(e)
+        finally:
+            try:
+                self._writer.close()
+            except OSError:
+                pass
+
+    def read(self, size=-1):
+        return self._reader.read(size)
+
+    def close(self):
+        # Закрытие читающего конца прерывает producer (BrokenPipeError)
+        self._reader.close()
+        self._thread.join()
+        return self._error
+
+
+class DirectoryReader(ProducerReader):
+    """Архив каталога, записываемый writer(directory, fileobj); каталог удаляется после чтения."""
+
+    def __init__(self, directory, writer):
+        self.directory = directory
+        super().__init__(lambda fileobj: writer(directory, fileobj))
+
+    def close(self):
+        error = super().close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return error
+
+
+def write_directory_tar(directory, fileobj, skip_dirs=frozenset()):
+    """
+    Пишет содержимое каталога в fileobj как несжатый tar-поток.
+    skip_dirs — относительные пути подкаталогов, которые не попадут в архив.
+    """
+    def exclude(tarinfo):
+        return None if os.path.normpath(tarinfo.name) in skip_dirs else tarinfo
+
+    with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+        tar.add(directory, arcname=".", filter=exclude)
+
+
+def write_directory_zip(directory, fileobj, skip_dirs=frozenset()):
+    """
+    Пишет каталог в fileobj как zip без сжатия (ZIP_STORED). Zip умеет писать
+    в несидируемый поток, а центральный каталог позволяет потом читать
+    отдельные файлы архива.
+    """
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_STORED, allowZip64=True) as zipf:
+        for root, dirs, files in os.walk(directory):
+            relroot = os.path.relpath(root, start=directory)
+            dirs[:] = [d for d in dirs if os.path.normpath(os.path.join(relroot, d)) not in skip_dirs]
+            for file in files:
+                file_path = os.path.join(root, file)
+                arcname = os.path.relpath(file_path, start=directory)
+                zipf.write(file_path, arcname)
+
+
+def extract_tar_stream(source, directory, keep=None):
+    """
+    Распаковывает tar-поток из file-like source в каталог, без временного файла.
+    keep(name) — отбор файлов; остальные читаются из потока, но не пишутся.
+    """
+    with tarfile.open(fileobj=source, mode="r|") as tar:
+        if keep is None:
+            tar.extractall(directory, filter="data")
+            return
+        for member in tar:
+            if keep(member.name):
+                tar.extract(member, directory, filter="data")
+
+
+class DecompressingReader:
+    """
+    File-like обёртка: читает сжатый source и отдаёт распакованные данные.
+    Если source кончился раньше конца сжатого кадра (обрезанный артефакт),
+    read() бросает IOError, а не завершает поток как ни в чём не бывало.
+    """
+
+    def __init__(self, source, codec, chunk_size=CHUNK_SIZE):
+        self.source = source
+        self.chunk_size = chunk_size
+        self._decompressor = codec.decompressor()
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self.source.read(self.chunk_size)
+            if not chunk:
+                self._buffer += self._decompressor.flush()
+                self._eof = True
+                if not self._decompressor.eof:
+                    raise IOError("Compressed stream is truncated")
+                break
+            self._buffer += self._decompressor.decompress(chunk)
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+
+class PrefixedReader:
+    """Поток, начало которого уже прочитано: сначала отдаёт prefix, затем source."""
+
+    def __init__(self, prefix, source):
+        self.source = source
+        self._prefix = prefix
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self.source.read(size)
+        if size < 0:
+            data, self._prefix = self._prefix + self.source.read(), b""
+        else:
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+        return data
+
+
+def open_decompressed(source):
+    """
+    Поток артефакта -> распакованный поток. Кодек определяется по сигнатуре
+    в начале данных, а не по расширению: артефакты старых дампов и разных
+    настроек задачи восстанавливаются одинаково.
+    """
+    head = b""
+    while len(head) < MAGIC_SIZE:
+        chunk = source.read(MAGIC_SIZE - len(head))
+        if not chunk:
+            break
+        head += chunk
+    reader = PrefixedReader(head, source)
+    codec = detect_codec(head)
+    return DecompressingReader(reader, codec) if codec else reader
+
+
+class LineFilterReader:
+    """
+    Вырезает из текстового потока строки, подходящие под pattern (re.M).
+    Режем только по целым строкам: хвост без \\n ждёт следующего блока.
+    """
+
+    def __init__(self, source, pattern, chunk_size=CHUNK_SIZE):
+        self.source = source
+        self.pattern = pattern
+        self.chunk_size = chunk_size
+        self._tail = b""
+
+    def read(self, size=-1):
+        # size игнорируем: потребитель (copy в stdin) читает блоками и так
+        while True:
+            chunk = self.source.read(self.chunk_size)
+            if not chunk:
+                data, self._tail = self._tail, b""
+                return self.pattern.sub(b"", data)
+            data = self._tail + chunk
+            last_newline = data.rfind(b"\n")
+            if last_newline == -1:
+                self._tail = data
+                continue
+            self._tail = data[last_newline + 1:]
+            filtered = self.pattern.sub(b"", data[:last_newline + 1])
+            if filtered:
+                return filtered
+
+
+class RangeReader:
+    """
+    Последовательное чтение удалённого объекта параллельными ranged-запросами.
+    fetch_range(start, end) возвращает байты [start, end]. Впереди держим не
+    больше window частей, так что память ограничена part_size * window.
+    Поддерживает seek: zip читается по центральному каталогу, и скачиваются
+    только нужные файлы архива.
+    """
+
+    def __init__(self, fetch_range, size, part_size=RANGE_PART_SIZE,
+                 concurrency=RANGE_CONCURRENCY, attempts=RANGE_ATTEMPTS):
+        self.fetch_range = fetch_range
+        self.size = size
+        self.part_size = part_size
+        self.window = concurrency * 2
+        self.attempts = attempts
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._pending = deque()
+        self._next_offset = 0
+        self._buffer = bytearray()
+        self._position = 0
+        # Сколько байт реально скачано (при чтении с seek меньше size)
+        self.fetched = 0
+
+    def _fetch(self, start, end):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                data = self.fetch_range(start, end)
+                if len(data) != end - start + 1:
+                    raise IOError(f"Short read at bytes {start}-{end}: got {len(data)}")
+                return data
+            except Exception:
+                if attempt == self.attempts:
+                    raise
+                time.sleep(attempt)
+
+    def _schedule(self):
+        while len(self._pending) < self.window and self._next_offset < self.size:
+            end = min(self._next_offset + self.part_size, self.size) - 1
+            self._pending.append(self._executor.submit(self._fetch, self._next_offset, end))
+            self._next_offset = end + 1
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            self._schedule()
+            if not self._pending:
+                break
+            part = self._pending.popleft().result()
+            self.fetched += len(part)
+            self._buffer += part
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        self._position += len(data)
+        return data
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        offset = min(max(offset, 0), self.size)
+        if self._position < offset < self._next_offset:
+            # Вперёд в пределах уже запрошенных частей — дочитываем
+            self.read(offset - self._position)
+        elif offset != self._position:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            self._buffer.clear()
+            self._next_offset = self._position = offset
+        return self._position
+
+    def close(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+
+class RateLimiter:
+    """Ограничение средней скорости (байт/с), общее для нескольких потоков."""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def consume(self, size):
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next_slot, now)
+            self._next_slot = start + size / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+class HashingReader:
+    """
+    Считает sha256 и число байт проходящего потока. Если заданы expected_size
+    и expected_sha256, сверяет их, как только прочитан последний ожидаемый
+    байт, — до того, как этот блок уйдёт потребителю, — или раньше, если
+    данных оказалось больше ожидаемого.
+    """
+
+    def __init__(self, source, expected_size=None, expected_sha256=None):
+        self.source = source
+        self.expected_size = expected_size
+        self.expected_sha256 = expected_sha256
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._verified = False
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def _verify(self):
+        self._verified = True
+        if self.size != self.expected_size:
+            raise IOError(f"Dump size mismatch: read {self.size} bytes, expected {self.expected_size}")
+        if self.expected_sha256 and self.sha256 != self.expected_sha256:
+            raise IOError(f"Dump checksum mismatch: sha256 {self.sha256}, expected {self.expected_sha256}")
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self._sha256.update(data)
+        self.size += len(data)
+        if self.expected_size is not None and not self._verified:
+            if self.size > self.expected_size:
+                raise IOError(f"Dump size mismatch: more than {self.expected_size} bytes")
+            if self.size == self.expected_size or not data:
+                self._verify()
+        return data
+
+    def close(self):
+        close = getattr(self.source, "close", None)
+        return close() if close else None
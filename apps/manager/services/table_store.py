@@ -0,0 +1,118 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from manager.services.storage_service import is_not_found
+from manager.services.streams import CompressingReader, HashingReader
+
+CATALOG_SUFFIX = ".tables.json"
+
+
+class TableStore:
+    """
+    Postgres-дамп объектом на таблицу в FileStorage:
+    dumps/<operation_id>.pre_data.sql.gz — схема без индексов и ограничений,
+    dumps/<operation_id>.t<N>.sql.gz — данные таблицы N,
+    dumps/<operation_id>.post_data.sql.gz — индексы, ограничения, триггеры,
+    dumps/<operation_id>.tables.json — каталог: таблицы, оценка строк, размеры,
+    ключи объектов и их sha256. Каталог же сохраняется на операции.
+    codec — кодек объектов дампа (по умолчанию у задачи gzip), None — без сжатия;
+    при восстановлении кодек определяется по самим объектам.
+    """
+
+    def __init__(self, storage_service, jobs=1, codec=None):
+        self.storage_service = storage_service
+        self.jobs = jobs
+        self.codec = codec
+
+    @staticmethod
+    def is_catalog(dump_path):
+        return bool(dump_path) and dump_path.endswith(CATALOG_SUFFIX)
+
+    def _upload_object(self, open_reader, operation_id, name):
+        """Поток pg_dump -> сжатие -> объект. -> {key, dump_size, sha256}; ошибки пробрасываются"""
+        dump_reader, error = open_reader()
+        if error:
+            raise IOError(error)
+        if self.codec:
+            reader = HashingReader(CompressingReader(dump_reader, self.codec))
+            extension = f"sql.{self.codec.extension}"
+        else:
+            reader = HashingReader(dump_reader)
+            extension = "sql"
+        key, error = self.storage_service.upload_stream(reader, f"{operation_id}.{name}", extension)
+        dump_error = dump_reader.close()
+        if dump_error and key:
+            self.storage_service.delete_dump(key)
+        if dump_error or error:
+            raise IOError(dump_error or error)
+        return {"key": key, "dump_size": reader.size, "sha256": reader.sha256}
+
+    def upload(self, db_interface, connection_string, operation_id):
+        """
+        Дамп по таблицам из одного снимка базы; таблицы выгружаются по jobs
+        параллельно. -> (путь каталога, каталог, error)
+        """
+        uploaded = []
+
+        def upload_object(open_reader, name):
+            entry = self._upload_object(open_reader, operation_id, name)
+            uploaded.append(entry["key"])
+            return entry
+
+        try:
+            with db_interface.table_snapshot(connection_string) as (snapshot, tables, sequences):
+                pre_data = upload_object(
+                    lambda: db_interface.open_section_stream(connection_string, snapshot, "pre-data"), "pre_data")
+
+                def upload_table(item):
+                    index, table = item
+                    return {**table, **upload_object(
+                        lambda: db_interface.open_table_stream(
+                            connection_string, snapshot, table["schema"], table["name"]),
+                        f"t{index:05d}",
+                    )}
+
+                with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                    table_entries = list(executor.map(upload_table, enumerate(tables)))
+                post_data = upload_object(
+                    lambda: db_interface.open_section_stream(connection_string, snapshot, "post-data"), "post_data")
+            catalog = {
+                "version": 1,
+                "codec": self.codec and self.codec.name,
+                "pre_data": pre_data,
+                "post_data": post_data,
+                "tables": table_entries,
+                "sequences": sequences,
+            }
+            path = self.storage_service.put_object(
+                f"dumps/{operation_id}{CATALOG_SUFFIX}", json.dumps(catalog).encode())
+        except Exception as e:
+            if uploaded:
+                self.storage_service.delete_dumps(uploaded)
+            return None, None, str(e)
+        print(f"Tables: {len(table_entries)}, {sum(entry['dump_size'] for entry in table_entries)} bytes")
+        return path, catalog, None
+
+    @staticmethod
+    def catalog_size(catalog):
+        entries = [catalog["pre_data"], catalog["post_data"], *catalog["tables"]]
+        return sum(entry["dump_size"] for entry in entries)
+
+    def open_object(self, entry):
+        """Сжатый поток объекта каталога со сверкой размера и sha256. -> (reader, error)"""
+        reader, error = self.storage_service.open_stream(entry["key"])
+        if error:
+            return None, error
+        return HashingReader(reader, entry["dump_size"], entry["sha256"]), None
+
+    def delete(self, dump_path):
+        try:
+            catalog = json.loads(self.storage_service.get_object(dump_path))
+        except Exception as e:
+            # Каталог удаляется последним: его нет — объекты уже удалены
+            return is_not_found(e)
+        keys = [entry["key"] for entry in (catalog["pre_data"], catalog["post_data"], *catalog["tables"])]
+        if self.storage_service.delete_dumps(keys):
+            return False
+        # Каталог последним: пока он есть, повторная очистка найдёт оставшиеся объекты
+        return self.storage_service.delete_dump(dump_path)
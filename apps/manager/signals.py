@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from manager.models import FileStorage
+from manager.services.storage_clients import invalidate
+
+
+@receiver(post_save, sender=FileStorage)
+@receiver(post_delete, sender=FileStorage)
+def invalidate_storage_clients(sender, instance, **kwargs):
+    invalidate(instance.pk)
@@ -7,14 +7,14 @@
     if (!typeEl) return;
 
     // секции, которые мы пометили классами в fieldsets
-    const s3Section = document.querySelector(".fs-section.fs-s3");
-    const yaSection = document.querySelector(".fs-section.fs-yadisk");
+    const s3Sections = document.querySelectorAll(".fs-section.fs-s3");
+    const yaSections = document.querySelectorAll(".fs-section.fs-yadisk");
 
     function toggle() {
       const v = (typeEl.value || "").toLowerCase();
       const isYadisk = v === "yadisk";
-      show(s3Section, !isYadisk);
-      show(yaSection, isYadisk);
+      s3Sections.forEach(function (el) { show(el, !isYadisk); });
+      yaSections.forEach(function (el) { show(el, isYadisk); });
     }
 
     typeEl.addEventListener("change", toggle);
@@ -0,0 +1,29 @@
+class FakeStorageService:
+    """Хранилище в памяти с интерфейсом сервисов storage_service; пути из failing не удаляются."""
+
+    def __init__(self, failing=()):
+        self.objects = {}
+        self.failing = set(failing)
+
+    @staticmethod
+    def object_path(key):
+        return key
+
+    def put_object(self, key, data):
+        self.objects[key] = data
+        return key
+
+    def get_object(self, key):
+        return self.objects[key]
+
+    def delete_dump(self, filepath):
+        if filepath in self.failing:
+            return False
+        self.objects.pop(filepath, None)
+        return True
+
+    def delete_dumps(self, filepaths):
+        return [filepath for filepath in filepaths if not self.delete_dump(filepath)]
+
+    def delete_prefix(self, prefix):
+        return not self.delete_dumps([key for key in self.objects if key.startswith(prefix)])
@@ -0,0 +1,130 @@
+import io
+import os
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from manager.models import FileStorage, StorageChunk
+from manager.services import chunk_store
+from manager.services.chunk_store import ChunkStore
+from manager.tests.fakes import FakeStorageService
+
+
+def make_store(storage_service=None):
+    file_storage = FileStorage.objects.create(name="test")
+    return ChunkStore(storage_service or FakeStorageService(), file_storage)
+
+
+class ChunkStoreTests(TestCase):
+
+    def test_unreferenced_chunks_are_collected(self):
+        store = make_store()
+        data = os.urandom(3 * chunk_store.CHUNK_MAX_SIZE)
+        first, error = store.upload(io.BytesIO(data), 1, "sql")
+        self.assertIsNone(error)
+        second, error = store.upload(io.BytesIO(data), 2, "sql")
+        self.assertIsNone(error)
+        chunk_keys = {key for key in store.storage_service.objects if key.startswith("chunks/")}
+        self.assertTrue(chunk_keys)
+        self.assertEqual(set(StorageChunk.objects.values_list("refcount", flat=True)), {2})
+
+        # Первый манифест удалён — на чанки ещё ссылается второй
+        self.assertTrue(store.delete(first))
+        self.assertEqual(set(StorageChunk.objects.values_list("refcount", flat=True)), {1})
+        self.assertTrue(chunk_keys <= set(store.storage_service.objects))
+
+        self.assertTrue(store.delete(second))
+        self.assertFalse(StorageChunk.objects.exists())
+        self.assertFalse(store.storage_service.objects)
+
+    def test_failed_chunk_delete_is_retried(self):
+        storage_service = FakeStorageService()
+        store = make_store(storage_service)
+        path, _ = store.upload(io.BytesIO(os.urandom(chunk_store.CHUNK_MIN_SIZE)), 1, "sql")
+        storage_service.failing = {key for key in storage_service.objects if key.startswith("chunks/")}
+
+        self.assertTrue(store.delete(path))
+        chunk = StorageChunk.objects.get()
+        self.assertEqual(chunk.refcount, 0)
+        self.assertIsNone(chunk.deleting_dt)
+
+        storage_service.failing = set()
+        store.collect_garbage()
+        self.assertFalse(StorageChunk.objects.exists())
+        self.assertFalse(storage_service.objects)
+
+    def test_reservation_waits_for_claimed_chunk(self):
+        store = make_store()
+        StorageChunk.objects.create(
+            file_storage=store.file_storage, digest="a" * 64, size=1, stored_size=1, stored=True,
+            deleting_dt=timezone.now())
+        with mock.patch.object(chunk_store, "CLAIM_WAIT_SECONDS", 0):
+            with self.assertRaises(IOError):
+                store._reserve_chunk("a" * 64, 1)
+        self.assertEqual(StorageChunk.objects.get().refcount, 0)
+
+    def test_reservation_takes_over_abandoned_claim(self):
+        store = make_store()
+        abandoned_dt = timezone.now() - chunk_store.CLAIM_TTL - timedelta(minutes=1)
+        StorageChunk.objects.create(
+            file_storage=store.file_storage, digest="a" * 64, size=1, stored_size=1, stored=True,
+            deleting_dt=abandoned_dt)
+
+        self.assertTrue(store._reserve_chunk("a" * 64, 1))
+        chunk = StorageChunk.objects.get()
+        self.assertEqual((chunk.refcount, chunk.stored, chunk.deleting_dt), (1, False, None))
+        # Очистка с брошенным захватом и новая очистка чанк со ссылкой не трогают
+        self.assertEqual(store._claim_orphans(None)[1], [])
+        self.assertTrue(StorageChunk.objects.exists())
+
+
+class ChunkReservationRaceTests(TransactionTestCase):
+    """Выгрузка и очистка в разных потоках: на SQLite select_for_update не блокирует."""
+
+    def test_reservation_against_garbage_collection(self):
+        storage_service = FakeStorageService()
+        store = make_store(storage_service)
+        digests = [f"{number:064x}" for number in range(20)]
+        errors = []
+        stop = threading.Event()
+
+        def run(target):
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                stop.set()
+                connection.close()
+
+        def reserve():
+            for _ in range(10):
+                for digest in digests:
+                    if store._reserve_chunk(digest, 1):
+                        store._store_chunk(digest, b"x")
+                        StorageChunk.objects.filter(file_storage=store.file_storage, digest=digest).update(
+                            stored=True)
+                    # Пока на чанк есть ссылка, объект должен лежать в хранилище
+                    if store._chunk_key(digest) not in storage_service.objects:
+                        raise AssertionError(f"Referenced chunk {digest} was deleted")
+                    store._release([digest])
+
+        def collect():
+            while not stop.is_set():
+                store.collect_garbage()
+
+        with mock.patch.object(chunk_store, "CLAIM_WAIT_SECONDS", 30):
+            threads = [threading.Thread(target=run, args=(reserve,)), threading.Thread(target=run, args=(collect,))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        store.collect_garbage()
+        self.assertFalse(StorageChunk.objects.exists())
+        self.assertFalse(storage_service.objects)
@@ -0,0 +1,122 @@
+import io
+import os
+from datetime import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from manager.choices import DBType, DumpOperationStatusChoices, DumpTaskPeriodsChoices
+from manager.models import DumpTask, DumpTaskOperation, FileStorage, StorageChunk, UserDatabase
+from manager.services import retention
+from manager.services.chunk_store import ChunkStore
+from manager.services.retention import RetentionService
+from manager.tests.fakes import FakeStorageService
+
+
+class RetentionServiceTests(TestCase):
+
+    def setUp(self):
+        self.storage_service = FakeStorageService()
+        patcher = mock.patch.object(retention, "get_storage_service", return_value=self.storage_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        database = UserDatabase.objects.create(name="test", db_type=DBType.POSTGRESQL)
+        self.file_storage = FileStorage.objects.create(name="test")
+        self.task = DumpTask.objects.create(
+            database=database, file_storage=self.file_storage, task_period=DumpTaskPeriodsChoices.EVERYDAY)
+
+    def make_operation(self, created_dt, base=None, dump_path=None):
+        operation = DumpTaskOperation.objects.create(
+            task=self.task, status=DumpOperationStatusChoices.SUCCESS, base_operation=base)
+        if dump_path is None:
+            dump_path = f"dumps/{operation.id}.sql"
+        self.storage_service.objects.setdefault(dump_path, b"dump")
+        DumpTaskOperation.objects.filter(id=operation.id).update(
+            created_dt=timezone.make_aware(created_dt), dump_path=dump_path)
+        operation.refresh_from_db()
+        return operation
+
+    def prune(self, **settings):
+        DumpTask.objects.filter(id=self.task.id).update(**settings)
+        self.task.refresh_from_db()
+        return RetentionService(self.task).prune()
+
+    def remaining(self):
+        return set(DumpTaskOperation.objects.values_list("id", flat=True))
+
+    def status(self, operation):
+        return DumpTaskOperation.objects.get(id=operation.id).status
+
+    def test_keep_latest_and_gfs_periods(self):
+        # 2026-03-09 — понедельник: 9 и 10 марта в одной ISO-неделе, 2 марта — в прошлой
+        newest = self.make_operation(datetime(2026, 3, 10, 12))
+        same_day = self.make_operation(datetime(2026, 3, 10, 9))
+        previous_day = self.make_operation(datetime(2026, 3, 9, 12))
+        previous_week = self.make_operation(datetime(2026, 3, 2, 12))
+        previous_month = self.make_operation(datetime(2026, 2, 20, 12))
+        oldest = self.make_operation(datetime(2026, 1, 15, 12))
+
+        deleted, postponed = self.prune(max_dumpfiles_keep=1, keep_daily=2, keep_weekly=2, keep_monthly=2)
+
+        kept = {newest.id, previous_day.id, previous_week.id, previous_month.id}
+        self.assertEqual((deleted, postponed), (2, 0))
+        self.assertEqual(self.remaining(), kept)
+        self.assertNotIn(same_day.dump_path, self.storage_service.objects)
+        self.assertNotIn(oldest.dump_path, self.storage_service.objects)
+        self.assertIn(previous_month.dump_path, self.storage_service.objects)
+
+    def test_bases_of_kept_increments_survive(self):
+        unrelated = self.make_operation(datetime(2026, 3, 1, 12))
+        full = self.make_operation(datetime(2026, 3, 2, 12))
+        increment = self.make_operation(datetime(2026, 3, 3, 12), base=full)
+        newest = self.make_operation(datetime(2026, 3, 4, 12), base=increment)
+
+        self.assertEqual(self.prune(max_dumpfiles_keep=1), (1, 0))
+        self.assertEqual(self.remaining(), {full.id, increment.id, newest.id})
+        self.assertNotIn(unrelated.dump_path, self.storage_service.objects)
+        self.assertIn(full.dump_path, self.storage_service.objects)
+
+    def test_shared_artifact_is_kept(self):
+        previous = self.make_operation(datetime(2026, 3, 1, 12))
+        # Дамп без изменений ссылается на артефакт предыдущего
+        newest = self.make_operation(datetime(2026, 3, 2, 12), dump_path=previous.dump_path)
+
+        self.assertEqual(self.prune(max_dumpfiles_keep=1), (1, 0))
+        self.assertEqual(self.remaining(), {newest.id})
+        self.assertIn(previous.dump_path, self.storage_service.objects)
+
+    def test_failed_delete_postpones_operation_and_bases(self):
+        full = self.make_operation(datetime(2026, 3, 1, 12))
+        increment = self.make_operation(datetime(2026, 3, 2, 12), base=full)
+        newest = self.make_operation(datetime(2026, 3, 3, 12))
+        self.storage_service.failing = {increment.dump_path}
+
+        self.assertEqual(self.prune(max_dumpfiles_keep=1), (0, 2))
+        self.assertEqual(self.status(increment), DumpOperationStatusChoices.DELETE_PENDING)
+        self.assertEqual(self.status(full), DumpOperationStatusChoices.DELETE_PENDING)
+        self.assertEqual(self.status(newest), DumpOperationStatusChoices.SUCCESS)
+        self.assertIn(increment.dump_path, self.storage_service.objects)
+
+        # Хранилище снова доступно: отложенное удаляется при следующей очистке
+        self.storage_service.failing = set()
+        self.assertEqual(self.prune(max_dumpfiles_keep=1), (2, 0))
+        self.assertEqual(self.remaining(), {newest.id})
+        self.assertNotIn(increment.dump_path, self.storage_service.objects)
+
+    def test_chunks_of_deleted_dumps_are_collected(self):
+        store = ChunkStore(self.storage_service, self.file_storage)
+        data = os.urandom(1024 * 1024)
+        old_path, _ = store.upload(io.BytesIO(data), "old", "sql")
+        new_path, _ = store.upload(io.BytesIO(data + os.urandom(1024 * 1024)), "new", "sql")
+        self.make_operation(datetime(2026, 3, 1, 12), dump_path=old_path)
+        self.make_operation(datetime(2026, 3, 2, 12), dump_path=new_path)
+        new_digests = {digest for digest, _ in store.load_manifest(new_path)["chunks"]}
+
+        self.assertEqual(self.prune(max_dumpfiles_keep=1), (1, 0))
+        self.assertNotIn(old_path, self.storage_service.objects)
+        # Остались только чанки нового манифеста, на каждый одна ссылка
+        self.assertEqual(set(StorageChunk.objects.values_list("digest", flat=True)), new_digests)
+        self.assertEqual(set(StorageChunk.objects.values_list("refcount", flat=True)), {1})
+        chunk_keys = {key for key in self.storage_service.objects if key.startswith("chunks/")}
+        self.assertEqual(chunk_keys, {store._chunk_key(digest) for digest in new_digests})
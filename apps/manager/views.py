@@ -0,0 +1,18 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from manager.services.metrics import render_prometheus
+
+
+@require_GET
+def metrics(request):
+    """Метрики для Prometheus: нужен заголовок Authorization: Bearer METRICS_TOKEN; без токена отключены."""
+    token = settings.METRICS_TOKEN
+    if not token:
+        return HttpResponse("METRICS_TOKEN is not set", status=403)
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401)
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")